@@ -1,432 +1,4116 @@
 import streamlit as st
 import sqlite3
 from datetime import datetime
+import bisect
+import hashlib
 import json
+import logging
 import os
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+import pandas as pd
 import requests
+from collections import Counter, OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# Errors and warnings, plus debug output (model answers, parsed data) when
+# enabled with logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("gainsgpt")
+
+###############################################################################
+# 1) Inference API Configuration
+###############################################################################
+# Change MODEL_ID or HF_API_KEY as needed
+MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.3"  
+HF_API_KEY = os.getenv("HF_TOKEN", "YOUR_HF_API_TOKEN")
+HF_API_URL = f"https://api-inference.huggingface.co/models/{MODEL_ID}"
+
+# Generation parameters. They are part of the parse cache key, so changing them
+# invalidates previously cached parses.
+MAX_NEW_TOKENS = 1024
+TEMPERATURE = 0.1
+
+# Location of the workout database. The parse cache lives next to it.
+DB_PATH = os.getenv("GAINSGPT_DB_PATH", "workout_app.db")
+
+# Multi-user mode. When GAINSGPT_SHARD_DIR is set (and authentication is
+# configured for st.login), every signed-in user gets their own database file
+# in that directory, so users never wait on each other's writes. Exercise
+# names are shared between users through catalog.db in the same directory.
+SHARD_DIR = os.getenv("GAINSGPT_SHARD_DIR", "")
+# Read connections per database, on top of its single writer connection
+DB_READ_POOL_SIZE = int(os.getenv("GAINSGPT_DB_READ_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT = 30.0
+# Bounds on the user databases a process keeps open (see ShardRegistry): the
+# least recently used beyond SHARD_MAX_OPEN are closed, and any database
+# unused for SHARD_IDLE_SECONDS.
+SHARD_MAX_OPEN = int(os.getenv("GAINSGPT_SHARD_MAX_OPEN", "64"))
+SHARD_IDLE_SECONDS = float(os.getenv("GAINSGPT_SHARD_IDLE_SECONDS", "900"))
+
+# In offline mode the LLM is never called: only the local fast-path parser runs
+# and fragments it cannot understand are stored as general notes.
+OFFLINE_MODE = os.getenv("GAINSGPT_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# HTTP client settings. Timeouts are (connect, read) in seconds; 503 "model
+# loading" and 429 "rate limited" responses are retried with exponential backoff.
+HF_CONNECT_TIMEOUT = 5.0
+HF_READ_TIMEOUT = 120.0
+HF_POOL_SIZE = 10
+HF_MAX_RETRIES = 4
+HF_BACKOFF_BASE = 1.0
+HF_BACKOFF_MAX = 30.0
+
+# Inference backend: "hf" (Hugging Face Inference API), "tgi" (self-hosted
+# text-generation-inference), "openai" (any OpenAI-compatible completions
+# server) or "replay" (recorded responses, no network). GAINSGPT_INFERENCE_URL
+# is the server base URL, or the JSONL file of recorded responses for "replay";
+# for "hf" it overrides HF_API_URL. Set GAINSGPT_RECORD_PATH to append every
+# prompt/response pair to a JSONL file that "replay" can serve.
+INFERENCE_BACKEND = os.getenv("GAINSGPT_BACKEND", "hf").lower()
+INFERENCE_URL = os.getenv("GAINSGPT_INFERENCE_URL", "")
+INFERENCE_API_KEY = os.getenv("GAINSGPT_INFERENCE_API_KEY", "")
+INFERENCE_RECORD_PATH = os.getenv("GAINSGPT_RECORD_PATH", "")
+
+# Stream generated tokens and stop as soon as the JSON object is complete.
+# Set GAINSGPT_STREAMING=0 for endpoints without token streaming.
+STREAMING_MODE = os.getenv("GAINSGPT_STREAMING", "1").lower() not in ("0", "false", "no")
+
+class InferenceError(Exception):
+    """Base class for errors raised while calling the inference endpoint."""
+
+class InferenceTimeoutError(InferenceError):
+    """The endpoint did not answer within the configured timeouts."""
+
+class InferenceConnectionError(InferenceError):
+    """The endpoint could not be reached."""
+
+class ModelLoadingError(InferenceError):
+    """The model was still loading (HTTP 503) after all retries."""
+
+class RateLimitError(InferenceError):
+    """The endpoint kept rate limiting us (HTTP 429) after all retries."""
+
+class InferenceResponseError(InferenceError):
+    """The endpoint returned an error status or a malformed response."""
+
+class RateLimiter:
+    """
+    Thread-safe token bucket. acquire() blocks until a request may be sent,
+    allowing short bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class InferenceBackend:
+    """
+    Interface of the text-generation backends. Set `rate_limiter` to throttle
+    outgoing requests (retries included).
+    """
+    rate_limiter = None
+
+    def generate(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE) -> str:
+        raise NotImplementedError
+
+    def generate_stream(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+        """
+        Yields the generated text piece by piece. Backends without token
+        streaming yield the whole completion at once.
+        """
+        yield self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+
+class HTTPInferenceBackend(InferenceBackend):
+    """
+    Shared HTTP plumbing: keeps a pool of keep-alive connections, bounds every
+    request with connect/read timeouts and retries transient 503/429 responses.
+    Subclasses describe the request and response formats.
+    """
+
+    def __init__(self, api_url: str, api_key: str = "", pool_size: int = HF_POOL_SIZE,
+                 connect_timeout: float = HF_CONNECT_TIMEOUT, read_timeout: float = HF_READ_TIMEOUT,
+                 max_retries: int = HF_MAX_RETRIES, backoff_base: float = HF_BACKOFF_BASE,
+                 backoff_max: float = HF_BACKOFF_MAX):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _url(self, stream: bool) -> str:
+        return self.api_url
+
+    def _payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> dict:
+        raise NotImplementedError
+
+    def _parse_response(self, output) -> str:
+        raise NotImplementedError
+
+    def _parse_stream_event(self, event: dict):
+        """
+        Returns the text carried by one stream event, or None to skip it.
+        """
+        raise NotImplementedError
+
+    def generate(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE) -> str:
+        response = self._post(self._url(False), self._payload(prompt, max_tokens, temperature, False))
+        try:
+            output = response.json()
+        except ValueError as e:
+            raise InferenceResponseError(f"Response is not JSON: {response.text[:200]}") from e
+        return self._parse_response(output)
+
+    def generate_stream(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+        """
+        Yields generated text piece by piece from the endpoint's server-sent
+        event stream. Closing the generator early drops the connection, which
+        makes the server stop generating.
+        """
+        response = self._post(
+            self._url(True), self._payload(prompt, max_tokens, temperature, True), stream=True
+        )
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError as e:
+                    raise InferenceResponseError(f"Malformed stream event: {line[:200]}") from e
+                if event.get("error"):
+                    raise InferenceResponseError(f"Stream error: {event['error']}")
+                text = self._parse_stream_event(event)
+                if text:
+                    yield text
+        except requests.exceptions.Timeout as e:
+            raise InferenceTimeoutError(f"Inference stream timed out: {e}") from e
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            raise InferenceConnectionError(f"Inference stream was interrupted: {e}") from e
+        finally:
+            response.close()
+
+    def _post(self, url: str, payload: dict, stream: bool = False) -> requests.Response:
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.exceptions.Timeout as e:
+                raise InferenceTimeoutError(f"Inference request timed out: {e}") from e
+            except requests.exceptions.ConnectionError as e:
+                raise InferenceConnectionError(f"Could not reach inference endpoint: {e}") from e
+
+            if response.status_code not in (429, 503):
+                break
+            if attempt >= self.max_retries:
+                if response.status_code == 503:
+                    raise ModelLoadingError(f"Model still loading after {attempt + 1} attempts")
+                raise RateLimitError(f"Rate limited after {attempt + 1} attempts")
+            get_metrics().inc("gainsgpt_inference_retries_total", status=str(response.status_code))
+            delay = self._retry_delay(response, attempt)
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+        if response.status_code >= 400:
+            raise InferenceResponseError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        """
+        Server hints win over our own backoff: HF sends "estimated_time" with
+        503 while the model loads, and Retry-After with 429.
+        """
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        try:
+            estimated_time = response.json().get("estimated_time")
+        except (ValueError, AttributeError):
+            estimated_time = None
+        if isinstance(estimated_time, (int, float)):
+            return min(max(float(estimated_time), delay), self.backoff_max)
+        return delay
+
+class HFInferenceClient(HTTPInferenceBackend):
+    """
+    Hugging Face Inference API: one URL per model, streaming via "stream": true.
+    """
+
+    def _payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> dict:
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_tokens,
+                "temperature": temperature,
+                "do_sample": False,
+                "return_full_text": False
+            }
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _parse_response(self, output) -> str:
+        if isinstance(output, list) and len(output) > 0:
+            return output[0].get("generated_text", "")
+        elif isinstance(output, dict) and "generated_text" in output:
+            return output["generated_text"]
+        raise InferenceResponseError(f"Unexpected response format: {str(output)[:200]}")
+
+    def _parse_stream_event(self, event: dict):
+        token = event.get("token") or {}
+        if token.get("special"):
+            return None
+        return token.get("text", "")
+
+class TGIBackend(HFInferenceClient):
+    """
+    Self-hosted text-generation-inference server: same formats as the HF API,
+    served from /generate and /generate_stream.
+    """
+
+    def _url(self, stream: bool) -> str:
+        return f"{self.api_url}/generate_stream" if stream else f"{self.api_url}/generate"
+
+    def _payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> dict:
+        payload = super()._payload(prompt, max_tokens, temperature, False)
+        # TGI rejects a zero temperature; greedy decoding ignores it anyway
+        payload["parameters"]["temperature"] = max(temperature, 0.01)
+        payload["parameters"].pop("return_full_text")
+        return payload
+
+class OpenAICompatibleBackend(HTTPInferenceBackend):
+    """
+    Any server exposing the OpenAI completions API (vLLM, llama.cpp, Ollama, ...).
+    """
+
+    def __init__(self, api_url: str, api_key: str = "", model: str = MODEL_ID, **kwargs):
+        super().__init__(api_url, api_key, **kwargs)
+        self.model = model
+
+    def _url(self, stream: bool) -> str:
+        return f"{self.api_url}/v1/completions"
+
+    def _payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    def _parse_response(self, output) -> str:
+        try:
+            return output["choices"][0]["text"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise InferenceResponseError(f"Unexpected response format: {str(output)[:200]}") from e
+
+    def _parse_stream_event(self, event: dict):
+        choices = event.get("choices") or [{}]
+        return choices[0].get("text", "")
+
+class ReplayBackend(InferenceBackend):
+    """
+    Deterministic offline backend for tests and load runs: answers each prompt
+    with the response recorded for it (see RecordingBackend) and never touches
+    the network. Unknown prompts raise InferenceResponseError.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 8):
+        self.chunk_size = chunk_size
+        self.responses = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[prompt_digest(record["prompt"])] = record["response"]
+
+    def generate(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE) -> str:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            return self.responses[prompt_digest(prompt)]
+        except KeyError:
+            raise InferenceResponseError("No recorded response for this prompt") from None
+
+    def generate_stream(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+        text = self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+
+class RecordingBackend(InferenceBackend):
+    """
+    Wraps another backend and appends every prompt/response pair to a JSONL
+    file that ReplayBackend can serve later.
+    """
+
+    def __init__(self, backend: InferenceBackend, path: str):
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def rate_limiter(self):
+        return self.backend.rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, value):
+        self.backend.rate_limiter = value
+
+    def generate(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE) -> str:
+        text = self.backend.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+        self._record(prompt, text)
+        return text
+
+    def generate_stream(self, prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+        pieces = []
+        for piece in self.backend.generate_stream(prompt, max_tokens=max_tokens, temperature=temperature):
+            pieces.append(piece)
+            yield piece
+        self._record(prompt, "".join(pieces))
+
+    def _record(self, prompt: str, response: str):
+        line = json.dumps({"prompt": prompt, "response": response}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+INFERENCE_BACKENDS = {
+    "hf": HFInferenceClient,
+    "tgi": TGIBackend,
+    "openai": OpenAICompatibleBackend,
+    "replay": ReplayBackend,
+}
+
+def create_inference_backend(name: str = INFERENCE_BACKEND, url: str = INFERENCE_URL) -> InferenceBackend:
+    if name not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}; expected one of {sorted(INFERENCE_BACKENDS)}")
+    if name == "hf":
+        backend = HFInferenceClient(url or HF_API_URL, HF_API_KEY)
+    elif not url:
+        raise ValueError(f"GAINSGPT_INFERENCE_URL must be set for the {name!r} backend")
+    elif name == "replay":
+        backend = ReplayBackend(url)
+    else:
+        backend = INFERENCE_BACKENDS[name](url, INFERENCE_API_KEY)
+    if INFERENCE_RECORD_PATH:
+        backend = RecordingBackend(backend, INFERENCE_RECORD_PATH)
+    return backend
+
+def inference_backend_identity(name: str = INFERENCE_BACKEND, url: str = INFERENCE_URL) -> str:
+    """
+    Which backend answers parse calls, e.g. "tgi:http://10.0.0.5:8080". Part
+    of the parse cache key, so switching backends does not serve the old
+    backend's parses.
+    """
+    return f"{name}:{url or HF_API_URL}" if name == "hf" else f"{name}:{url}"
+
+@st.cache_resource
+def get_inference_client() -> InferenceBackend:
+    """
+    One backend (and connection pool) per process, shared across Streamlit sessions.
+    """
+    return create_inference_backend()
+
+def call_inference_api(prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE) -> str:
+    """
+    Calls the configured inference backend for text generation.
+    Returns the model's generated text, raises an InferenceError subclass on failure.
+    """
+    metrics = get_metrics()
+    try:
+        with metrics.span("inference_http"):
+            return get_inference_client().generate(prompt, max_tokens=max_tokens, temperature=temperature)
+    except InferenceError as e:
+        logger.exception("Error calling inference backend")
+        metrics.inc("gainsgpt_inference_errors_total", error=type(e).__name__)
+        raise
+
+def stream_inference_api(prompt: str, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+    """
+    Like call_inference_api, but yields the generated text as it arrives.
+    """
+    try:
+        yield from get_inference_client().generate_stream(prompt, max_tokens=max_tokens, temperature=temperature)
+    except InferenceError as e:
+        logger.exception("Error calling inference backend")
+        get_metrics().inc("gainsgpt_inference_errors_total", error=type(e).__name__)
+        raise
+
+###############################################################################
+# 2) Instrumentation
+###############################################################################
+# Timing spans and counters for the hot paths, exported in the Prometheus text
+# format on http://127.0.0.1:GAINSGPT_METRICS_PORT/metrics (0 disables the
+# endpoint) and shown on the Admin page.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("GAINSGPT_METRICS_PORT", "9464"))
+# Upper bounds (seconds) of the span latency histogram buckets
+SPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and latency histograms. span() times a block of
+    code into the gainsgpt_span_seconds histogram, labelled with its name.
+    """
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": [0] * (len(self.buckets) + 1), "count": 0, "sum": 0.0, "max": 0.0,
+                }
+            histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["max"] = max(histogram["max"], value)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("gainsgpt_span_seconds", time.perf_counter() - start, span=name, **labels)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"])))
+                                for key, value in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        Plain rows for the Admin page. Span quantiles are estimated from the
+        histogram buckets (upper bound of the bucket holding the quantile).
+        """
+        with self._lock:
+            counters = [
+                {"counter": name, "labels": format_labels(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            spans = []
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                count = histogram["count"]
+                spans.append({
+                    "span": dict(labels).get("span", name),
+                    "labels": format_labels(tuple(item for item in labels if item[0] != "span")),
+                    "count": count,
+                    "mean_ms": 1000 * histogram["sum"] / count,
+                    "p50_ms": 1000 * self._quantile(histogram, 0.50),
+                    "p95_ms": 1000 * self._quantile(histogram, 0.95),
+                    "max_ms": 1000 * histogram["max"],
+                    "total_s": histogram["sum"],
+                })
+        return {"counters": counters, "spans": spans}
+
+    def _quantile(self, histogram: dict, q: float) -> float:
+        target = q * histogram["count"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, histogram["buckets"]):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, histogram["max"])
+        return histogram["max"]
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+@st.cache_resource
+def get_metrics() -> MetricsRegistry:
+    """
+    One registry per process, shared across Streamlit sessions and worker threads.
+    """
+    return MetricsRegistry()
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(metrics: MetricsRegistry, port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+@st.cache_resource
+def get_metrics_server():
+    """
+    Serves /metrics once per process. Returns None if the endpoint is disabled
+    or the port is taken (e.g. by another GainsGPT process).
+    """
+    if not METRICS_PORT:
+        return None
+    try:
+        return start_metrics_server(get_metrics(), METRICS_PORT)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on port %s: %s", METRICS_PORT, e)
+        return None
+
+###############################################################################
+# 3) Database Setup and Functions
+###############################################################################
+# Applied to every workout database connection. WAL lets readers run while a
+# write is in progress, and synchronous=NORMAL only fsyncs at checkpoints,
+# which is safe in WAL mode.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Page query results kept in memory between writes (see WorkoutRepository.cached_query)
+QUERY_CACHE_MAX_ENTRIES = 256
+
+# exercise_sets.flags bits
+SET_FLAG_AMRAP = 1
+SET_FLAG_BODYWEIGHT_PLUS = 2
+# Sanity cap on the sets stored for one exercise entry
+MAX_SETS_PER_EXERCISE = 50
+
+def exercise_set_details(exercise: dict) -> list:
+    """
+    Per-set detail of a parsed exercise: the "set_details" list the fast-path
+    parser produces, or else the sets x reps @ weight summary expanded into
+    identical sets (what the LLM returns).
+    """
+    details = exercise.get("set_details")
+    if isinstance(details, list) and all(isinstance(detail, dict) for detail in details):
+        return details[:MAX_SETS_PER_EXERCISE]
+    try:
+        sets = min(int(exercise.get("sets") or 0), MAX_SETS_PER_EXERCISE)
+    except (TypeError, ValueError):
+        sets = 0
+    return [{"reps": exercise.get("reps"), "load": exercise.get("weight")}] * sets
+
+def set_detail_row(exercise_data_id: int, set_index: int, detail: dict) -> tuple:
+    flags = (SET_FLAG_AMRAP if detail.get("amrap") else 0) | (SET_FLAG_BODYWEIGHT_PLUS if detail.get("bodyweight_plus") else 0)
+    return (exercise_data_id, set_index, to_int_or_none(detail.get("reps")),
+            to_float_or_none(detail.get("load")), to_float_or_none(detail.get("rpe")), flags)
+
+def to_int_or_none(value):
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+def to_float_or_none(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Exercise names are matched on a normalized "alias key" (see exercise_alias_key)
+EXERCISE_NAME_TOKEN_RE = re.compile(r"[a-z0-9]+")
+EXERCISE_ABBREVIATIONS = {
+    "dl": "deadlift", "rdl": "romanian deadlift", "ohp": "overhead press",
+    "db": "dumbbell", "bb": "barbell", "bw": "bodyweight",
+}
+# Unknown keys this long or longer may be suggested as a known key one typo away
+EXERCISE_FUZZY_MIN_LENGTH = 5
+# Trigram similarity a candidate needs before the typo check
+EXERCISE_FUZZY_MIN_SIMILARITY = 0.6
+
+def exercise_alias_words(name: str, singular: bool = False) -> list:
+    """
+    The words of an exercise name as alias keys see them: accents, case and
+    punctuation dropped and common abbreviations expanded. With `singular`,
+    plural "s" endings are removed too ("Pull ups" -> ["pull", "up"]).
+    """
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode("ascii").lower()
+    words = []
+    for token in EXERCISE_NAME_TOKEN_RE.findall(text):
+        for word in EXERCISE_ABBREVIATIONS.get(token, token).split():
+            if singular and len(word) >= 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            words.append(word)
+    return words
+
+def exercise_alias_key(name: str, singular: bool = False) -> str:
+    """
+    "Pull-ups", "Pull ups" and "pullups" all become "pullups". The singular
+    key ("pullup") is only used to find a known alias of the other number,
+    so a typo such as "Military pres" is never read as a plural.
+    """
+    return "".join(exercise_alias_words(name, singular))
+
+def alias_word_starts(name: str) -> set:
+    """
+    Positions in exercise_alias_key(name) where a word begins.
+    """
+    starts = set()
+    position = 0
+    for word in exercise_alias_words(name):
+        starts.add(position)
+        position += len(word)
+    return starts
+
+def alias_trigrams(alias_key: str) -> set:
+    padded = f"^{alias_key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def one_edit_position(a: str, b: str):
+    """
+    Where `b` differs from `a` when it is `a` with at most one character
+    inserted, deleted, replaced, or two neighbours swapped; else None.
+    """
+    if abs(len(a) - len(b)) > 1:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return i if a[i:] == b[i + 1:] else None
+    if a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1]):
+        return i
+    return None
+
+class ExerciseAliasIndex:
+    """
+    In-memory copy of exercise_aliases: alias key -> exercise id, the
+    singular key of each alias name, and a trigram index used to find the
+    known key closest to a misspelled one.
+    """
+
+    def __init__(self):
+        self.exercise_ids = {}
+        self._singular_keys = {}
+        self._trigram_keys = defaultdict(set)
+
+    @classmethod
+    def load(cls, cursor: sqlite3.Cursor) -> "ExerciseAliasIndex":
+        index = cls()
+        cursor.execute("SELECT alias_key, exercise_id, alias_name FROM exercise_aliases")
+        for alias_key, exercise_id, alias_name in cursor.fetchall():
+            index.add(alias_key, exercise_id, alias_name)
+        return index
+
+    def add(self, alias_key: str, exercise_id: int, name: str = None):
+        self.exercise_ids[alias_key] = exercise_id
+        singular_key = alias_key if name is None else exercise_alias_key(name, singular=True)
+        self._singular_keys.setdefault(singular_key, alias_key)
+        for gram in alias_trigrams(alias_key):
+            self._trigram_keys[gram].add(alias_key)
+
+    def update(self, other: "ExerciseAliasIndex"):
+        self.exercise_ids.update(other.exercise_ids)
+        for singular_key, alias_key in other._singular_keys.items():
+            self._singular_keys.setdefault(singular_key, alias_key)
+        for gram, keys in other._trigram_keys.items():
+            self._trigram_keys[gram].update(keys)
+
+    def get(self, alias_key: str):
+        return self.exercise_ids.get(alias_key)
+
+    def get_singular(self, singular_key: str):
+        """
+        The exercise id of a known alias with this singular key, so "Pull up"
+        finds "Pull ups" and the reverse, or None.
+        """
+        alias_key = self._singular_keys.get(singular_key)
+        return None if alias_key is None else self.exercise_ids[alias_key]
+
+    def fuzzy_match(self, alias_key: str, word_starts=()):
+        """
+        The exercise id of the most similar known key that is one typo away
+        and has the same digits ("squat v1" never matches "squat v10"), or
+        None. A different first letter of a word is not a typo: "Hack squat"
+        and "Back squat" are different exercises. The caller only suggests
+        the match, since one letter still tells "Lap" from "Lat".
+        """
+        if len(alias_key) < EXERCISE_FUZZY_MIN_LENGTH:
+            return None
+        word_starts = {0, *word_starts}
+        grams = alias_trigrams(alias_key)
+        shared = Counter(key for gram in grams for key in self._trigram_keys.get(gram, ()))
+        digits = re.sub(r"\D", "", alias_key)
+        for key, common in shared.most_common():
+            if 2 * common / (len(grams) + len(alias_trigrams(key))) < EXERCISE_FUZZY_MIN_SIMILARITY:
+                break
+            position = one_edit_position(alias_key, key)
+            if position is not None and position not in word_starts and re.sub(r"\D", "", key) == digits:
+                return self.exercise_ids[key]
+        return None
+
+def open_connection(path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Opens a tuned connection in autocommit mode; transactions are explicit
+    (see WorkoutRepository.unit_of_work).
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """
+    Up to `size` read connections to one database file, opened on first use
+    and reused. In WAL mode they read while the writer connection commits.
+    connection() lends one out, waiting while all `size` are in use.
+    """
+
+    def __init__(self, path: str, size: int = DB_READ_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._opened = 0
+        self._available = threading.Condition()
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def connection(self):
+        with self._available:
+            if not self._available.wait_for(lambda: self._idle or self._opened < self.size, self.timeout):
+                raise TimeoutError(f"No free connection to {self.path} after {self.timeout:g} s")
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._opened += 1
+        try:
+            if conn is None:
+                conn = open_connection(self.path)
+            yield conn
+        finally:
+            with self._available:
+                if conn is None:
+                    self._opened -= 1
+                elif self._closed:
+                    # Lent out when the pool was closed
+                    conn.close()
+                    self._opened -= 1
+                else:
+                    self._idle.append(conn)
+                self._available.notify()
+
+    def data_version(self) -> int:
+        """
+        PRAGMA data_version of a dedicated connection. It changes whenever any
+        other connection, in this process or another one, commits to the file.
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = open_connection(self.path)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._opened -= len(self._idle)
+            self._idle = []
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
+
+# Names seeded into catalog.db. Curate more by inserting rows there; what
+# users type is never added, so one user's typo cannot name another's exercise.
+CATALOG_EXERCISE_NAMES = (
+    "Squat", "Back squat", "Front squat", "Goblet squat", "Hack squat", "Bulgarian split squat",
+    "Bench press", "Incline bench press", "Decline bench press", "Dumbbell bench press",
+    "Deadlift", "Romanian deadlift", "Sumo deadlift", "Trap bar deadlift",
+    "Overhead press", "Military press", "Push press", "Dumbbell shoulder press",
+    "Pull ups", "Chin ups", "Lat pulldown", "Barbell row", "Dumbbell row", "Seated cable row",
+    "Dips", "Push ups", "Hip thrust", "Leg press", "Leg extension", "Leg curl", "Lunges",
+    "Calf raises", "Face pulls", "Lateral raises", "Bicep curl", "Hammer curl",
+    "Tricep pushdown", "Skull crushers", "Cable chest flies", "Plank",
+)
+
+class ExerciseCatalog:
+    """
+    Curated exercise names shared by all users' databases, stored in
+    catalog.db in SHARD_DIR and seeded with CATALOG_EXERCISE_NAMES. When a
+    user's database meets an exercise it has no alias for, it takes the
+    catalog's spelling when the singular alias keys are equal ("squats" ->
+    "Squat"); there is no fuzzy matching here, and names not in the catalog
+    are kept as the user wrote them. Held in memory as singular key -> name,
+    reloaded only when another process has changed the file.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._lock = threading.Lock()
+        self._names = None
+        self._names_version = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS curated_exercises (
+                    alias_key TEXT PRIMARY KEY,
+                    exercise_name TEXT NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.executemany(
+                "INSERT INTO curated_exercises (alias_key, exercise_name) VALUES (?, ?) ON CONFLICT(alias_key) DO NOTHING",
+                [(exercise_alias_key(name, singular=True), name) for name in CATALOG_EXERCISE_NAMES],
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def canonical_names(self, names: dict) -> dict:
+        """
+        Maps {alias_key: name} to {alias_key: catalog name, or the name itself}.
+        """
+        with self._lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._names is None or version != self._names_version:
+                self._names = dict(self.conn.execute("SELECT alias_key, exercise_name FROM curated_exercises"))
+                self._names_version = version
+            return {
+                alias_key: self._names.get(exercise_alias_key(name, singular=True), name)
+                for alias_key, name in names.items()
+            }
+
+class WorkoutRepository:
+    """
+    Data access for workout logs in one database file. Everything written for
+    one log goes through unit_of_work(), which runs it in a single
+    BEGIN IMMEDIATE ... COMMIT transaction on the writer connection, so a
+    crash can never leave a half-written log behind. The writer connection is
+    shared between Streamlit sessions, so writes run under the repository
+    lock. With a ConnectionPool, query() and cached_query() read on pooled
+    connections instead and never wait for a write to finish.
+
+    Exercise names resolve through an in-memory ExerciseAliasIndex, loaded
+    once and reloaded only when another connection commits.
+
+    Page reads go through cached_query(), a read-model cache keyed on query and
+    parameters. Every committed unit of work bumps `generation`, which drops
+    the cached results; commits from other processes (e.g. import_logs.py)
+    are picked up through PRAGMA data_version.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, query_cache_size: int = QUERY_CACHE_MAX_ENTRIES,
+                 metrics: MetricsRegistry = None, pool: ConnectionPool = None, catalog: ExerciseCatalog = None):
+        self.conn = conn
+        self.pool = pool
+        self.catalog = catalog
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._alias_index = None
+        self._alias_index_version = None
+        self._pending_aliases = ExerciseAliasIndex()
+        self._aliases_rewritten = False
+        self._dirty_stats = set()
+        self._dirty_metric_days = set()
+        self._metric_ids = {}
+        self._pending_metric_ids = {}
+        self._change_seq = None
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._query_cache_size = query_cache_size
+        self._query_cache_generation = None
+        self._parse_progress = {}
+        self._parse_progress_lock = threading.Lock()
+
+    @contextmanager
+    def unit_of_work(self, operation: str = "write"):
+        """
+        Yields a cursor inside one transaction; commits on success, rolls back on error.
+        The whole transaction is timed as a "db_write" span labelled `operation`.
+        """
+        with self._lock, self.metrics.span("db_write", operation=operation):
+            self._pending_aliases = ExerciseAliasIndex()
+            self._aliases_rewritten = False
+            self._dirty_stats = set()
+            self._dirty_metric_days = set()
+            self._pending_metric_ids = {}
+            self._change_seq = None
+            changes_before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self.conn.cursor()
+                yield cursor
+                # Keep the analytics tables in step with the rows written above
+                if self._dirty_stats or self._dirty_metric_days:
+                    with self.metrics.span("analytics_refresh"):
+                        refresh_exercise_stats(cursor, self._dirty_stats)
+                        refresh_metric_series(cursor, self._dirty_metric_days)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self.metrics.inc("gainsgpt_db_rollbacks_total", operation=operation)
+                raise
+            with self.metrics.span("db_commit"):
+                self.conn.execute("COMMIT")
+            if self.conn.total_changes != changes_before:
+                self.generation += 1
+            # Only index aliases whose INSERT actually committed
+            self._metric_ids.update(self._pending_metric_ids)
+            if self._aliases_rewritten:
+                self._alias_index = None
+            elif self._alias_index is not None:
+                self._alias_index.update(self._pending_aliases)
+
+    def close(self):
+        """
+        Closes the read pool and the writer connection, after any write in progress.
+        """
+        with self._lock:
+            if self.pool is not None:
+                self.pool.close()
+            self.conn.close()
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                return conn.execute(sql, params).fetchall()
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def data_generation(self) -> tuple:
+        """
+        Changes whenever the data may have changed: our own commits bump
+        `generation`, other connections' commits change PRAGMA data_version.
+        """
+        if self.pool is not None:
+            return self.generation, self.pool.data_version()
+        with self._lock:
+            return self.generation, self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def cached_query(self, sql: str, params: tuple = (), name: str = "query") -> list:
+        """
+        Like query(), but serves repeated reads from memory until the next write.
+        The returned rows are shared between callers and must not be mutated.
+        Cache misses are timed as a "page_query" span labelled `name`.
+        """
+        key = (sql, tuple(params))
+        generation = self.data_generation()
+        with self._query_cache_lock:
+            if generation != self._query_cache_generation:
+                self._query_cache.clear()
+                self._query_cache_generation = generation
+            if key in self._query_cache:
+                self.metrics.inc("gainsgpt_query_cache_total", query=name, result="hit")
+                self._query_cache.move_to_end(key)
+                return self._query_cache[key]
+        self.metrics.inc("gainsgpt_query_cache_total", query=name, result="miss")
+        with self.metrics.span("page_query", query=name):
+            rows = self.query(sql, params)
+        with self._query_cache_lock:
+            # Rows read across a commit are dropped with the rest at the next lookup
+            if generation == self._query_cache_generation:
+                self._query_cache[key] = rows
+                if len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return rows
+
+    def alias_index(self, cursor: sqlite3.Cursor) -> ExerciseAliasIndex:
+        """
+        The alias index, (re)loaded when missing or when another connection
+        has committed since it was loaded.
+        """
+        cursor.execute("PRAGMA data_version")
+        version = cursor.fetchone()[0]
+        if self._alias_index is None or version != self._alias_index_version:
+            self._alias_index = ExerciseAliasIndex.load(cursor)
+            self._alias_index_version = version
+        return self._alias_index
+
+    def resolve_exercise_ids(self, cursor: sqlite3.Cursor, exercise_names) -> dict:
+        """
+        Maps exercise names to ids, creating missing exercises. Names are
+        matched on their alias key against the in-memory index, or on their
+        singular key ("Pull up" and "Pull ups"). A name one typo away from a
+        known one gets an exercise of its own plus a merge suggestion for the
+        Admin page. New exercises, aliases and suggestions are written in one batch.
+        """
+        index = self.alias_index(cursor)
+        pending = self._pending_aliases
+        keys = {name: exercise_alias_key(name) for name in set(exercise_names)}
+        new_aliases = {}
+        missing = {}
+        missing_singular = {}
+        same_as_missing = {}
+        suggestions = {}
+        for name, alias_key in sorted(keys.items()):
+            if alias_key in missing or alias_key in same_as_missing:
+                continue
+            if pending.get(alias_key) or index.get(alias_key):
+                continue
+            singular_key = exercise_alias_key(name, singular=True)
+            exercise_id = pending.get_singular(singular_key) or index.get_singular(singular_key)
+            if exercise_id is not None:
+                new_aliases[alias_key] = (exercise_id, name, "name")
+                pending.add(alias_key, exercise_id, name)
+            elif singular_key in missing_singular:
+                same_as_missing[alias_key] = (missing_singular[singular_key], name)
+            else:
+                missing[alias_key] = name
+                missing_singular[singular_key] = alias_key
+                suggested_id = index.fuzzy_match(alias_key, alias_word_starts(name))
+                if suggested_id is not None:
+                    suggestions[alias_key] = suggested_id
+        if missing:
+            if self.catalog is not None:
+                # Spell new exercises the way the shared catalog does
+                exercise_names = self.catalog.canonical_names(missing)
+            else:
+                exercise_names = missing
+            names = sorted(set(exercise_names.values()))
+            cursor.executemany(
+                "INSERT INTO exercises (exercise_name) VALUES (?) ON CONFLICT(exercise_name) DO NOTHING",
+                [(name,) for name in names],
+            )
+            cursor.execute(
+                f"SELECT exercise_name, id FROM exercises WHERE exercise_name IN ({','.join('?' * len(names))})",
+                names,
+            )
+            found = dict(cursor.fetchall())
+            for alias_key, name in missing.items():
+                exercise_id = found[exercise_names[alias_key]]
+                new_aliases[alias_key] = (exercise_id, name, "name")
+                pending.add(alias_key, exercise_id, name)
+            for alias_key, (missing_key, name) in same_as_missing.items():
+                new_aliases[alias_key] = (new_aliases[missing_key][0], name, "name")
+                pending.add(alias_key, new_aliases[missing_key][0], name)
+        if new_aliases:
+            cursor.executemany('''
+                INSERT INTO exercise_aliases (alias_key, exercise_id, alias_name, source)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(alias_key) DO NOTHING
+            ''', [(alias_key, *alias) for alias_key, alias in new_aliases.items()])
+        suggestions = [(alias_key, exercise_id) for alias_key, exercise_id in suggestions.items()
+                       if new_aliases[alias_key][0] != exercise_id]
+        if suggestions:
+            cursor.executemany(
+                "INSERT INTO exercise_alias_suggestions (alias_key, exercise_id) VALUES (?, ?) "
+                "ON CONFLICT(alias_key) DO NOTHING",
+                suggestions,
+            )
+        return {name: pending.get(alias_key) or index.get(alias_key) for name, alias_key in keys.items()}
+
+    def resolve_metric_ids(self, cursor: sqlite3.Cursor, definitions) -> dict:
+        """
+        Maps canonical metric names to ids, registering new metrics in one batch.
+        """
+        definitions = {definition.name: definition for definition in definitions}
+        missing = [
+            definition for name, definition in definitions.items()
+            if name not in self._metric_ids and name not in self._pending_metric_ids
+        ]
+        if missing:
+            cursor.executemany(
+                "INSERT INTO metrics (name, label, unit) VALUES (?, ?, ?) ON CONFLICT(name) DO NOTHING",
+                [(d.name, d.label, d.unit) for d in missing],
+            )
+            cursor.execute(
+                f"SELECT name, id FROM metrics WHERE name IN ({','.join('?' * len(missing))})",
+                [d.name for d in missing],
+            )
+            self._pending_metric_ids.update(cursor.fetchall())
+        return {name: self._metric_ids.get(name) or self._pending_metric_ids[name] for name in definitions}
+
+    def merge_exercises(self, source_id: int, target_id: int):
+        """
+        Folds one exercise into another: its history, notes and aliases move
+        to `target_id` and the source exercise is deleted. Reversible per
+        alias with split_exercise_alias().
+        """
+        with self.unit_of_work("merge_exercises") as cursor:
+            self._merge_exercises(cursor, source_id, target_id)
+
+    def accept_alias_suggestion(self, alias_key: str):
+        """
+        Merges the exercise logged under a suggested alias into the exercise
+        it was one typo away from.
+        """
+        with self.unit_of_work("merge_exercises") as cursor:
+            cursor.execute('''
+                SELECT a.exercise_id, s.exercise_id
+                FROM exercise_alias_suggestions s
+                JOIN exercise_aliases a ON a.alias_key = s.alias_key
+                WHERE s.alias_key = ?
+            ''', (alias_key,))
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"No merge suggestion for alias: {alias_key}")
+            self._merge_exercises(cursor, *row)
+
+    def dismiss_alias_suggestion(self, alias_key: str):
+        with self.unit_of_work("dismiss_alias_suggestion") as cursor:
+            cursor.execute("DELETE FROM exercise_alias_suggestions WHERE alias_key = ?", (alias_key,))
+
+    def _merge_exercises(self, cursor: sqlite3.Cursor, source_id: int, target_id: int):
+        if source_id == target_id:
+            raise ValueError("Cannot merge an exercise into itself")
+        self._mark_exercise_stats_dirty(cursor, source_id)
+        self.touch_logs(cursor, '''
+            id IN (SELECT workout_log_id FROM exercise_data WHERE exercise_id = ?
+                   UNION SELECT workout_log_id FROM notes WHERE exercise_id = ?)
+        ''', (source_id, source_id))
+        cursor.execute("UPDATE exercise_data SET exercise_id = ? WHERE exercise_id = ?", (target_id, source_id))
+        cursor.execute("UPDATE notes SET exercise_id = ? WHERE exercise_id = ?", (target_id, source_id))
+        cursor.execute(
+            "UPDATE exercise_aliases SET exercise_id = ?, source = 'merge' WHERE exercise_id = ?",
+            (target_id, source_id),
+        )
+        cursor.execute("UPDATE exercise_alias_suggestions SET exercise_id = ? WHERE exercise_id = ?",
+                       (target_id, source_id))
+        # Suggestions the merge has carried out
+        cursor.execute('''
+            DELETE FROM exercise_alias_suggestions
+            WHERE exercise_id = (SELECT a.exercise_id FROM exercise_aliases a
+                                 WHERE a.alias_key = exercise_alias_suggestions.alias_key)
+        ''')
+        cursor.execute("DELETE FROM exercises WHERE id = ?", (source_id,))
+        self._mark_exercise_stats_dirty(cursor, target_id)
+        self._aliases_rewritten = True
+
+    def split_exercise_alias(self, alias_key: str) -> int:
+        """
+        Undoes a merge or fuzzy match: the alias becomes an exercise of its
+        own, taking along the entries logged under it. Returns the new id.
+        """
+        with self.unit_of_work("split_exercise_alias") as cursor:
+            cursor.execute(
+                "SELECT exercise_id, alias_name FROM exercise_aliases WHERE alias_key = ?", (alias_key,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"Unknown exercise alias: {alias_key}")
+            old_id, alias_name = row
+            cursor.execute("SELECT exercise_name FROM exercises WHERE id = ?", (old_id,))
+            exercise_name = cursor.fetchone()[0]
+            if alias_key in (exercise_alias_key(exercise_name), exercise_alias_key(exercise_name, singular=True)):
+                raise ValueError("Cannot split an exercise from its own name")
+            cursor.execute(
+                "INSERT INTO exercises (exercise_name) VALUES (?) ON CONFLICT(exercise_name) DO NOTHING",
+                (alias_name,),
+            )
+            cursor.execute("SELECT id FROM exercises WHERE exercise_name = ?", (alias_name,))
+            new_id = cursor.fetchone()[0]
+            self._mark_exercise_stats_dirty(cursor, old_id)
+            self.touch_logs(
+                cursor, "id IN (SELECT workout_log_id FROM exercise_data WHERE exercise_id = ? AND alias_key = ?)",
+                (old_id, alias_key),
+            )
+            cursor.execute(
+                "UPDATE exercise_data SET exercise_id = ? WHERE exercise_id = ? AND alias_key = ?",
+                (new_id, old_id, alias_key),
+            )
+            # Exercise notes carry no alias key; follow the entries they belong to
+            cursor.execute('''
+                UPDATE notes SET exercise_id = ?
+                WHERE exercise_id = ? AND workout_log_id IN (
+                    SELECT ed.workout_log_id FROM exercise_data ed
+                    WHERE ed.exercise_id = ? AND ed.alias_key = ?
+                      AND (notes.block_key IS NULL OR ed.block_key = notes.block_key)
+                )
+            ''', (new_id, old_id, new_id, alias_key))
+            cursor.execute(
+                "UPDATE exercise_aliases SET exercise_id = ?, source = 'name' WHERE alias_key = ?",
+                (new_id, alias_key),
+            )
+            self._mark_exercise_stats_dirty(cursor, new_id)
+            self._aliases_rewritten = True
+        return new_id
+
+    def next_change_seq(self, cursor: sqlite3.Cursor) -> int:
+        """
+        The change sequence number of the current unit of work: one above the
+        highest committed one. Writers are serialized by BEGIN IMMEDIATE, so
+        numbers only grow in commit order and a snapshot's highest number is a
+        safe watermark for incremental exports (see snapshot.py).
+        """
+        if self._change_seq is None:
+            cursor.execute('''
+                SELECT MAX(COALESCE((SELECT MAX(change_seq) FROM workout_logs), 0),
+                           COALESCE((SELECT MAX(change_seq) FROM deleted_logs), 0)) + 1
+            ''')
+            self._change_seq = cursor.fetchone()[0]
+        return self._change_seq
+
+    def touch_logs(self, cursor: sqlite3.Cursor, where: str, params: tuple = ()):
+        """
+        Marks the logs matching `where` as changed in this unit of work.
+        """
+        cursor.execute(
+            f"UPDATE workout_logs SET change_seq = ? WHERE {where}", (self.next_change_seq(cursor),) + tuple(params)
+        )
+
+    def insert_log(self, cursor: sqlite3.Cursor, session_name: str, date_str: str, raw_text: str) -> int:
+        cursor.execute('''
+            INSERT INTO workout_logs (session_name, date, date_num, raw_text, change_seq)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (session_name, date_str, date_to_num(date_str), raw_text, self.next_change_seq(cursor)))
+        return cursor.lastrowid
+
+    def insert_structured_data(self, cursor: sqlite3.Cursor, log_id: int, structured_data: dict):
+        """
+        Writes the metrics, exercises (with one exercise_sets row per set) and
+        notes of one parsed log with executemany.
+        """
+        exercises = structured_data.get("exercises", [])
+        exercise_ids = self.resolve_exercise_ids(cursor, (e.get("exercise_name", "") for e in exercises))
+
+        metrics = structured_data.get("metrics", [])
+        definitions = [resolve_metric(m.get("metric_name", ""), m.get("metric_value", "")) for m in metrics]
+        metric_ids = self.resolve_metric_ids(cursor, definitions)
+        metric_rows = [
+            (log_id, m.get("metric_name", ""), m.get("metric_value", ""), m.get("sentiment", ""), m.get("block_key"),
+             metric_ids[definition.name], parse_metric_value(definition, m.get("metric_value", "")))
+            for m, definition in zip(metrics, definitions)
+        ]
+        exercise_rows = []
+        note_rows = []
+        for exercise in exercises:
+            exercise_id = exercise_ids[exercise.get("exercise_name", "")]
+            block_key = exercise.get("block_key")
+            exercise_rows.append((
+                log_id, exercise_id, exercise.get("sets", 0), exercise.get("reps", 0), exercise.get("weight", 0.0),
+                block_key, exercise_alias_key(exercise.get("exercise_name", "")),
+            ))
+            for note in exercise.get("notes", []):
+                note_rows.append((
+                    log_id, exercise_id, note.get("note_text", ""), "exercise_note", note.get("sentiment", ""), block_key
+                ))
+        for note in structured_data.get("general_notes", []):
+            note_rows.append((
+                log_id, None, note.get("note_text", ""), note.get("category", ""), note.get("sentiment", ""),
+                note.get("block_key"),
+            ))
+
+        cursor.executemany('''
+            INSERT INTO daily_metrics
+                (workout_log_id, metric_name, metric_value, sentiment, block_key, metric_id, numeric_value)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', metric_rows)
+        # New ids are above the current AUTOINCREMENT high-water mark, in insertion order
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'exercise_data'")
+        row = cursor.fetchone()
+        last_id_before = row[0] if row else 0
+        cursor.executemany('''
+            INSERT INTO exercise_data (workout_log_id, exercise_id, sets, reps, weight, block_key, alias_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', exercise_rows)
+        if exercises:
+            cursor.execute(
+                "SELECT id FROM exercise_data WHERE workout_log_id = ? AND id > ? ORDER BY id",
+                (log_id, last_id_before),
+            )
+            set_rows = [
+                set_detail_row(exercise_data_id, set_index, detail)
+                for (exercise_data_id,), exercise in zip(cursor.fetchall(), exercises)
+                for set_index, detail in enumerate(exercise_set_details(exercise))
+            ]
+            cursor.executemany('''
+                INSERT INTO exercise_sets (exercise_data_id, set_index, reps, load, rpe, flags)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', set_rows)
+        cursor.executemany('''
+            INSERT INTO notes (workout_log_id, exercise_id, note_text, category, sentiment, block_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', note_rows)
+        self._mark_stats_dirty(cursor, log_id)
+        self.touch_logs(cursor, "id = ?", (log_id,))
+
+    def _mark_stats_dirty(self, cursor: sqlite3.Cursor, log_id: int):
+        """
+        Records the (exercise_id, date_num) and (metric_id, date_num) days
+        touched by a log, so that unit_of_work() refreshes only those
+        analytics rows before committing.
+        """
+        cursor.execute('''
+            SELECT ed.exercise_id, w.date_num
+            FROM exercise_data ed
+            JOIN workout_logs w ON ed.workout_log_id = w.id
+            WHERE ed.workout_log_id = ? AND w.date_num IS NOT NULL
+        ''', (log_id,))
+        self._dirty_stats.update(cursor.fetchall())
+        cursor.execute('''
+            SELECT d.metric_id, w.date_num
+            FROM daily_metrics d
+            JOIN workout_logs w ON d.workout_log_id = w.id
+            WHERE d.workout_log_id = ? AND d.metric_id IS NOT NULL AND w.date_num IS NOT NULL
+        ''', (log_id,))
+        self._dirty_metric_days.update(cursor.fetchall())
+
+    def _mark_exercise_stats_dirty(self, cursor: sqlite3.Cursor, exercise_id: int):
+        cursor.execute('''
+            SELECT DISTINCT ed.exercise_id, w.date_num
+            FROM exercise_data ed
+            JOIN workout_logs w ON ed.workout_log_id = w.id
+            WHERE ed.exercise_id = ? AND w.date_num IS NOT NULL
+        ''', (exercise_id,))
+        self._dirty_stats.update(cursor.fetchall())
+
+    def delete_structured_data(self, cursor: sqlite3.Cursor, log_id: int):
+        self._mark_stats_dirty(cursor, log_id)
+        self.touch_logs(cursor, "id = ?", (log_id,))
+        cursor.execute('''
+            DELETE FROM exercise_sets WHERE exercise_data_id IN (
+                SELECT id FROM exercise_data WHERE workout_log_id = ?
+            )
+        ''', (log_id,))
+        cursor.execute("DELETE FROM daily_metrics WHERE workout_log_id = ?", (log_id,))
+        cursor.execute("DELETE FROM exercise_data WHERE workout_log_id = ?", (log_id,))
+        cursor.execute("DELETE FROM notes WHERE workout_log_id = ?", (log_id,))
+
+    def save_new_log(self, session_name: str, date_str: str, raw_text: str, structured_data: dict) -> int:
+        with self.unit_of_work("save_new_log") as cursor:
+            log_id = self.insert_log(cursor, session_name, date_str, raw_text)
+            self.insert_structured_data(cursor, log_id, structured_data)
+        return log_id
+
+    def replace_log(self, log_id: int, session_name: str, date_str: str, raw_text: str, structured_data: dict):
+        with self.unit_of_work("replace_log") as cursor:
+            self.delete_structured_data(cursor, log_id)
+            cursor.execute('''
+                UPDATE workout_logs
+                SET session_name = ?, date = ?, date_num = ?, raw_text = ?
+                WHERE id = ?
+            ''', (session_name, date_str, date_to_num(date_str), raw_text, log_id))
+            self.insert_structured_data(cursor, log_id, structured_data)
+            # The log is parsed now; a queued parse of the old text is obsolete
+            cursor.execute("DELETE FROM parse_jobs WHERE workout_log_id = ?", (log_id,))
+
+    def apply_log_edit(self, log_id: int, session_name: str, date_str: str, raw_text: str,
+                       removed_block_keys: set, added_data: dict):
+        """
+        Minimal write set for an edit, in one transaction: rows of removed
+        blocks are deleted, rows of added blocks inserted, and rows of
+        unchanged blocks stay in place.
+        """
+        with self.unit_of_work("apply_log_edit") as cursor:
+            self._mark_stats_dirty(cursor, log_id)
+            if removed_block_keys:
+                keys = list(removed_block_keys)
+                placeholders = ",".join("?" * len(keys))
+                cursor.execute(f'''
+                    DELETE FROM exercise_sets WHERE exercise_data_id IN (
+                        SELECT id FROM exercise_data WHERE workout_log_id = ? AND block_key IN ({placeholders})
+                    )
+                ''', [log_id] + keys)
+                for table in ("daily_metrics", "exercise_data", "notes"):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE workout_log_id = ? AND block_key IN ({placeholders})",
+                        [log_id] + keys,
+                    )
+            cursor.execute('''
+                UPDATE workout_logs
+                SET session_name = ?, date = ?, date_num = ?, raw_text = ?
+                WHERE id = ?
+            ''', (session_name, date_str, date_to_num(date_str), raw_text, log_id))
+            self.insert_structured_data(cursor, log_id, added_data)
+            cursor.execute("DELETE FROM parse_jobs WHERE workout_log_id = ?", (log_id,))
+
+    def get_stored_block_keys(self, log_id: int) -> set:
+        """
+        Block keys of the rows stored for a log. None means rows written before
+        block tracking existed.
+        """
+        rows = self.query('''
+            SELECT block_key FROM daily_metrics WHERE workout_log_id = ?
+            UNION SELECT block_key FROM exercise_data WHERE workout_log_id = ?
+            UNION SELECT block_key FROM notes WHERE workout_log_id = ?
+        ''', (log_id, log_id, log_id))
+        return {row[0] for row in rows}
+
+    def get_parse_status(self, log_id: int) -> str:
+        rows = self.query("SELECT status FROM parse_jobs WHERE workout_log_id = ?", (log_id,))
+        return rows[0][0] if rows else "parsed"
+
+    def record_parse_progress(self, log_id: int, exercises: list):
+        """
+        Keeps the exercises a running parse has extracted so far. Held in
+        memory, not in the database: a write there would bump data_version
+        and empty the query cache once per extracted exercise. Only parses
+        run by this process's workers are visible, not parse_worker.py's.
+        """
+        with self._parse_progress_lock:
+            self._parse_progress[log_id] = list(exercises)
+
+    def clear_parse_progress(self, log_id: int):
+        with self._parse_progress_lock:
+            self._parse_progress.pop(log_id, None)
+
+    def get_parse_progress(self, log_id: int) -> list:
+        with self._parse_progress_lock:
+            return list(self._parse_progress.get(log_id, ()))
+
+    def list_logs(self, before_id: int = None, date_from: int = None, date_to: int = None,
+                  session_name_filter: str = "", limit: int = 20):
+        """
+        Keyset-paginated listing, newest first. Returns (rows, has_more) where rows
+        are (id, session_name, date, parse_status, parse_error) tuples with ids below
+        `before_id`. raw_text is not loaded here; use get_log_text when a log is opened.
+        """
+        conditions = []
+        params = []
+        if before_id is not None:
+            conditions.append("w.id < ?")
+            params.append(before_id)
+        if date_from is not None:
+            conditions.append("w.date_num >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("w.date_num <= ?")
+            params.append(date_to)
+        if session_name_filter:
+            conditions.append("w.session_name LIKE ?")
+            params.append(f"%{session_name_filter}%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.cached_query(f'''
+            SELECT w.id, w.session_name, w.date, COALESCE(j.status, 'parsed'), j.last_error
+            FROM workout_logs w
+            LEFT JOIN parse_jobs j ON j.workout_log_id = w.id
+            {where}
+            ORDER BY w.id DESC
+            LIMIT ?
+        ''', tuple(params) + (limit + 1,), name="list_logs")
+        return rows[:limit], len(rows) > limit
+
+    def search_logs(self, text: str, date_from: int = None, date_to: int = None, limit: int = 20) -> list:
+        """
+        Full-text search over log texts and notes, best match first. Returns
+        (id, session_name, date, snippet) tuples, one per log, where the
+        snippet is the best-matching passage with the terms in **bold**.
+        """
+        match = fts_match_query(text)
+        if not match:
+            return []
+        rows = self.cached_query(SEARCH_QUERY, (match, limit, date_from, date_to), name="search")
+        return [(log_id, name, date, " ".join(snippet.split())) for log_id, name, date, snippet, _ in rows]
+
+    def get_log_text(self, log_id: int) -> str:
+        rows = self.cached_query("SELECT raw_text FROM workout_logs WHERE id = ?", (log_id,), name="log_text")
+        return rows[0][0] if rows else ""
+
+    def delete_log(self, log_id: int):
+        with self.unit_of_work("delete_log") as cursor:
+            self.delete_structured_data(cursor, log_id)
+            cursor.execute("DELETE FROM import_progress WHERE workout_log_id = ?", (log_id,))
+            cursor.execute("DELETE FROM parse_jobs WHERE workout_log_id = ?", (log_id,))
+            cursor.execute("DELETE FROM workout_logs WHERE id = ?", (log_id,))
+            # Tombstone, so incremental exports carry the deletion
+            cursor.execute(
+                "INSERT OR REPLACE INTO deleted_logs (workout_log_id, change_seq) VALUES (?, ?)",
+                (log_id, self.next_change_seq(cursor)),
+            )
+
+def shard_path(user: str = None) -> str:
+    """
+    The database file of `user`: DB_PATH without one, else a file in SHARD_DIR
+    named from the user id and its hash, so any id maps to a safe, distinct name.
+    """
+    if user is None:
+        return DB_PATH
+    if not SHARD_DIR:
+        raise ValueError("Set GAINSGPT_SHARD_DIR to give users their own databases")
+    slug = re.sub(r"[^a-z0-9]+", "-", user.lower()).strip("-")[:40]
+    digest = hashlib.sha256(user.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(SHARD_DIR, f"{slug}-{digest}.db")
+
+@st.cache_resource
+def get_exercise_catalog() -> ExerciseCatalog:
+    """
+    One exercise catalog per process, shared by every user's repository.
+    """
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    return ExerciseCatalog(open_connection(os.path.join(SHARD_DIR, "catalog.db")))
+
+def list_shard_paths() -> list:
+    """
+    The user databases in SHARD_DIR, in name order.
+    """
+    if not SHARD_DIR or not os.path.isdir(SHARD_DIR):
+        return []
+    return sorted(
+        os.path.join(SHARD_DIR, name) for name in os.listdir(SHARD_DIR)
+        if name.endswith(".db") and name != "catalog.db"
+    )
+
+def open_repository(path: str, shared_catalog: bool) -> WorkoutRepository:
+    """
+    A repository on one database file, with its own writer lock and read
+    pool, so users never wait on each other's writes. Schema migrations run
+    here, once per process and database instead of on every Streamlit rerun.
+    """
+    catalog = get_exercise_catalog() if shared_catalog else None
+    repository = WorkoutRepository(
+        open_connection(path), metrics=get_metrics(), pool=ConnectionPool(path), catalog=catalog
+    )
+    with repository.unit_of_work("migrations") as cursor:
+        apply_migrations(cursor)
+    return repository
+
+# How long a repository must have been unused before the SHARD_MAX_OPEN bound
+# may close it, so a page never loses the repository it is reading from
+SHARD_MIN_IDLE_SECONDS = 60.0
+
+@dataclass
+class OpenShard:
+    repository: WorkoutRepository
+    last_used: float
+    leases: int = 0
+
+class ShardRegistry:
+    """
+    The repositories a process has open, one per database file. get() opens
+    a repository on first use and returns the same one after that. Each use
+    also closes the repositories unused for `idle_seconds`, and the least
+    recently used ones beyond `max_open` (if unused for SHARD_MIN_IDLE_SECONDS).
+    A leased repository (see lease()) is never closed.
+    """
+
+    def __init__(self, max_open: int = SHARD_MAX_OPEN, idle_seconds: float = SHARD_IDLE_SECONDS):
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, shared_catalog: bool = False) -> WorkoutRepository:
+        shard = self._checkout(path, shared_catalog, lease=False)
+        return shard.repository
+
+    @contextmanager
+    def lease(self, path: str, shared_catalog: bool = False):
+        """
+        Yields the repository of `path`, kept open until the block ends.
+        """
+        shard = self._checkout(path, shared_catalog, lease=True)
+        try:
+            yield shard.repository
+        finally:
+            with self._lock:
+                shard.leases -= 1
+                shard.last_used = time.monotonic()
+
+    def open_paths(self) -> list:
+        with self._lock:
+            return list(self._shards)
+
+    def close_all(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for shard in shards:
+            shard.repository.close()
+
+    def _checkout(self, path: str, shared_catalog: bool, lease: bool) -> OpenShard:
+        with self._lock:
+            shard = self._shards.get(path)
+            if shard is not None:
+                evicted = self._use(path, shard, lease)
+        if shard is None:
+            # Opened (and migrated) without the lock, so other users are not held up
+            repository = open_repository(path, shared_catalog)
+            with self._lock:
+                shard = self._shards.get(path)
+                if shard is None:
+                    shard = self._shards[path] = OpenShard(repository, time.monotonic())
+                    repository = None
+                evicted = self._use(path, shard, lease)
+            if repository is not None:
+                repository.close()
+        for victim in evicted:
+            victim.repository.close()
+        return shard
+
+    def _use(self, path: str, shard: OpenShard, lease: bool) -> list:
+        self._shards.move_to_end(path)
+        shard.last_used = time.monotonic()
+        shard.leases += lease
+        return self._evict(shard)
+
+    def _evict(self, keep: OpenShard) -> list:
+        now = time.monotonic()
+        evicted = []
+        for path, shard in list(self._shards.items()):
+            if shard is keep or shard.leases:
+                continue
+            idle = now - shard.last_used
+            if idle > self.idle_seconds or (
+                len(self._shards) > self.max_open and idle >= SHARD_MIN_IDLE_SECONDS
+            ):
+                evicted.append(self._shards.pop(path))
+        return evicted
+
+@st.cache_resource
+def get_shard_registry() -> ShardRegistry:
+    """
+    One registry of open databases per process, shared by all Streamlit sessions.
+    """
+    return ShardRegistry()
+
+def get_repository(user: str = None) -> WorkoutRepository:
+    """
+    The repository of the single-user database at DB_PATH, or of `user`'s
+    own database (see shard_path).
+    """
+    return get_shard_registry().get(shard_path(user), user is not None)
+
+def current_user():
+    """
+    The signed-in user's id in multi-user mode, else None (single-user database).
+    """
+    if not SHARD_DIR or not st.user.get("is_logged_in"):
+        return None
+    return st.user.get("sub") or st.user.get("email")
+
+def current_repository() -> WorkoutRepository:
+    return get_repository(current_user())
+
+def date_to_num(date_str: str):
+    """
+    "2024-03-15" -> 20240315. Integer dates sort and compare cheaply in indexes.
+    """
+    try:
+        return int(datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y%m%d"))
+    except (TypeError, ValueError):
+        return None
+
+def init_db():
+    """
+    Makes sure the schema is up to date. Cheap after the first call in a process.
+    """
+    current_repository()
+
+def apply_migrations(cursor: sqlite3.Cursor, target_version: int = None) -> int:
+    """
+    Runs the SCHEMA_MIGRATIONS not yet applied to this database, in order.
+    PRAGMA user_version stores how many have been applied. Returns the new version.
+    """
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    target_version = len(SCHEMA_MIGRATIONS) if target_version is None else target_version
+    for migration in SCHEMA_MIGRATIONS[version:target_version]:
+        migration(cursor)
+        version += 1
+        cursor.execute(f"PRAGMA user_version = {version}")
+    return version
+
+def migrate_001_base_schema(cursor: sqlite3.Cursor):
+    # Tables creation. IF NOT EXISTS keeps this safe for databases created
+    # before migrations were tracked.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS workout_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_name TEXT,
+        date TEXT,
+        raw_text TEXT
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exercises (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exercise_name TEXT UNIQUE
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workout_log_id INTEGER,
+        exercise_id INTEGER,
+        sets INTEGER,
+        reps INTEGER,
+        weight REAL,
+        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id),
+        FOREIGN KEY(exercise_id) REFERENCES exercises(id)
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workout_log_id INTEGER,
+        exercise_id INTEGER,
+        note_text TEXT,
+        category TEXT,
+        sentiment TEXT,
+        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id),
+        FOREIGN KEY(exercise_id) REFERENCES exercises(id)
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workout_log_id INTEGER,
+        metric_name TEXT,
+        metric_value TEXT,
+        sentiment TEXT,
+        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id)
+    )
+    ''')
+    
+    # Sources already ingested by the bulk importer (import_logs.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS import_progress (
+        source_id TEXT PRIMARY KEY,
+        workout_log_id INTEGER,
+        imported_at TEXT,
+        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id)
+    )
+    ''')
+
+def migrate_002_indexes_and_date_num(cursor: sqlite3.Cursor):
+    # Sortable integer dates (YYYYMMDD), backfilled from the text column
+    cursor.execute("ALTER TABLE workout_logs ADD COLUMN date_num INTEGER")
+    cursor.execute('''
+        UPDATE workout_logs
+        SET date_num = CAST(REPLACE(date, '-', '') AS INTEGER)
+        WHERE date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_logs_date_num ON workout_logs(date_num, id)")
+    # Covering index for the Exercises page sets query
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exercise_data_exercise
+        ON exercise_data(exercise_id, workout_log_id, sets, reps, weight)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exercise_data_log ON exercise_data(workout_log_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_exercise ON notes(exercise_id, workout_log_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_log ON notes(workout_log_id)")
+    # Covering index for the Tracking page, which walks logs in date order
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_metrics_log
+        ON daily_metrics(workout_log_id, metric_name, metric_value, sentiment)
+    ''')
+
+def migrate_003_exercise_daily_stats(cursor: sqlite3.Cursor):
+    # Per-exercise, per-day training aggregates (see section 3), computed
+    # from exercise_sets; migrate_006 fills it once the set rows exist
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_daily_stats (
+        exercise_id INTEGER NOT NULL,
+        date_num INTEGER NOT NULL,
+        total_sets INTEGER,
+        total_reps INTEGER,
+        tonnage REAL,
+        best_weight REAL,
+        best_set_reps INTEGER,
+        best_set_weight REAL,
+        e1rm_epley REAL,
+        e1rm_brzycki REAL,
+        pr_e1rm REAL,
+        is_pr INTEGER,
+        PRIMARY KEY (exercise_id, date_num)
+    ) WITHOUT ROWID
+    ''')
+
+def migrate_004_parse_jobs(cursor: sqlite3.Cursor):
+    # Durable queue of logs waiting for a background parse. Logs without a
+    # row here are parsed.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS parse_jobs (
+        workout_log_id INTEGER PRIMARY KEY,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        updated_at REAL,
+        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parse_jobs_status ON parse_jobs(status, next_attempt_at)")
+
+def migrate_005_block_keys(cursor: sqlite3.Cursor):
+    # Which block of the raw text each row was parsed from (see split_log_blocks)
+    for table in ("daily_metrics", "exercise_data", "notes"):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN block_key TEXT")
+
+def migrate_006_exercise_sets(cursor: sqlite3.Cursor):
+    # One row per performed set, clustered under its exercise_data row
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_sets (
+        exercise_data_id INTEGER NOT NULL,
+        set_index INTEGER NOT NULL,
+        reps INTEGER,
+        load REAL,
+        rpe REAL,
+        flags INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (exercise_data_id, set_index)
+    ) WITHOUT ROWID
+    ''')
+    # The old one-row-per-exercise summary, computed from the sets
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS exercise_set_summary AS
+    SELECT exercise_data_id,
+           COUNT(*) AS sets,
+           CASE WHEN COUNT(reps) = COUNT(*) AND MIN(reps) = MAX(reps) THEN MIN(reps) END AS reps,
+           MAX(load) AS weight,
+           SUM(reps) AS total_reps,
+           SUM(reps * COALESCE(load, 0)) AS tonnage,
+           MAX(rpe) AS top_rpe,
+           SUM(flags & 1) AS amrap_sets
+    FROM exercise_sets
+    GROUP BY exercise_data_id
+    ''')
+    backfill_exercise_sets(cursor)
+    rebuild_exercise_stats(cursor)
+
+def backfill_exercise_sets(cursor: sqlite3.Cursor):
+    """
+    Creates set rows for existing exercise_data rows. Where the stored block
+    can still be read by the fast-path parser, the real per-set reps are
+    recovered from the raw text; otherwise the summary is expanded.
+    """
+    cursor.execute('''
+        SELECT ed.id, ed.workout_log_id, ed.sets, ed.reps, ed.weight, ed.block_key
+        FROM exercise_data ed
+        ORDER BY ed.workout_log_id, ed.id
+    ''')
+    rows = cursor.fetchall()
+    log_ids = sorted({row[1] for row in rows if row[5] not in (None, WHOLE_LOG_BLOCK_KEY)})
+    parsed_blocks = {}
+    for start in range(0, len(log_ids), 500):
+        chunk = log_ids[start:start + 500]
+        cursor.execute(
+            f"SELECT id, raw_text FROM workout_logs WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        )
+        for log_id, raw_text in cursor.fetchall():
+            for block in parse_workout_locally(raw_text or "").blocks:
+                if block["structured_data"] is not None:
+                    parsed_blocks[(log_id, block["key"])] = block["structured_data"]["exercises"][0]
+    set_rows = []
+    for exercise_data_id, log_id, sets, reps, weight, block_key in rows:
+        exercise = parsed_blocks.get((log_id, block_key)) or {"sets": sets, "reps": reps, "weight": weight}
+        set_rows.extend(
+            set_detail_row(exercise_data_id, set_index, detail)
+            for set_index, detail in enumerate(exercise_set_details(exercise))
+        )
+    cursor.executemany('''
+        INSERT OR REPLACE INTO exercise_sets (exercise_data_id, set_index, reps, load, rpe, flags)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', set_rows)
+
+def migrate_007_exercise_aliases(cursor: sqlite3.Cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_aliases (
+        alias_key TEXT PRIMARY KEY,
+        exercise_id INTEGER NOT NULL,
+        alias_name TEXT NOT NULL,
+        source TEXT NOT NULL DEFAULT 'name',
+        FOREIGN KEY(exercise_id) REFERENCES exercises(id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exercise_aliases_exercise ON exercise_aliases(exercise_id)")
+    # The alias key an entry was logged under, so a merge can be split again
+    cursor.execute("ALTER TABLE exercise_data ADD COLUMN alias_key TEXT")
+
+    cursor.execute("SELECT id, exercise_name FROM exercises ORDER BY id")
+    exercises = [(exercise_id, name, exercise_alias_key(name)) for exercise_id, name in cursor.fetchall()]
+    cursor.executemany(
+        "UPDATE exercise_data SET alias_key = ? WHERE exercise_id = ?",
+        [(alias_key, exercise_id) for exercise_id, _, alias_key in exercises],
+    )
+    # Spellings of the same exercise ("Pull ups", "Pull-ups", "Pull up") merge
+    # into the oldest one, as resolve_exercise_ids matches them; each spelling
+    # keeps its own alias
+    canonical_ids = {}
+    aliases = {}
+    merges = []
+    for exercise_id, name, alias_key in exercises:
+        singular_key = exercise_alias_key(name, singular=True)
+        if singular_key in canonical_ids:
+            merges.append((canonical_ids[singular_key], exercise_id))
+        else:
+            canonical_ids[singular_key] = exercise_id
+        aliases.setdefault(alias_key, (canonical_ids[singular_key], name))
+    cursor.executemany(
+        "INSERT INTO exercise_aliases (alias_key, exercise_id, alias_name) VALUES (?, ?, ?)",
+        [(alias_key, exercise_id, name) for alias_key, (exercise_id, name) in aliases.items()],
+    )
+    for table in ("exercise_data", "notes"):
+        cursor.executemany(f"UPDATE {table} SET exercise_id = ? WHERE exercise_id = ?", merges)
+    cursor.executemany("DELETE FROM exercises WHERE id = ?", [(duplicate_id,) for _, duplicate_id in merges])
+    if merges:
+        rebuild_exercise_stats(cursor)
+
+def migrate_008_search_index(cursor: sqlite3.Cursor):
+    # External-content FTS5 indexes: the text itself stays in the base tables
+    for table, column in (("workout_logs", "raw_text"), ("notes", "note_text")):
+        cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+            {column}, content='{table}', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts (rowid, {column}) VALUES (new.id, new.{column});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column} ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            INSERT INTO {table}_fts (rowid, {column}) VALUES (new.id, new.{column});
+        END
+        ''')
+        cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+def migrate_009_metric_series(cursor: sqlite3.Cursor):
+    # Canonical metrics (see METRIC_DEFINITIONS); daily_metrics rows point here
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        label TEXT,
+        unit TEXT
+    )
+    ''')
+    cursor.execute("ALTER TABLE daily_metrics ADD COLUMN metric_id INTEGER")
+    cursor.execute("ALTER TABLE daily_metrics ADD COLUMN numeric_value REAL")
+    # Daily mean of each metric's numeric values
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS metric_series (
+        metric_id INTEGER NOT NULL,
+        date_num INTEGER NOT NULL,
+        value REAL NOT NULL,
+        samples INTEGER NOT NULL,
+        PRIMARY KEY (metric_id, date_num)
+    ) WITHOUT ROWID
+    ''')
+    # Covers DAILY_VOLUME_QUERY
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exercise_daily_stats_date
+        ON exercise_daily_stats(date_num, tonnage, total_sets)
+    ''')
+
+    cursor.execute("SELECT id, metric_name, metric_value FROM daily_metrics")
+    rows = [(row_id, resolve_metric(name, value), value) for row_id, name, value in cursor.fetchall()]
+    definitions = {definition.name: definition for _, definition, _ in rows}
+    cursor.executemany(
+        "INSERT INTO metrics (name, label, unit) VALUES (?, ?, ?) ON CONFLICT(name) DO NOTHING",
+        [(d.name, d.label, d.unit) for d in definitions.values()],
+    )
+    cursor.execute("SELECT name, id FROM metrics")
+    metric_ids = dict(cursor.fetchall())
+    cursor.executemany(
+        "UPDATE daily_metrics SET metric_id = ?, numeric_value = ? WHERE id = ?",
+        [(metric_ids[definition.name], parse_metric_value(definition, value), row_id)
+         for row_id, definition, value in rows],
+    )
+    rebuild_metric_series(cursor)
+
+def migrate_010_change_tracking(cursor: sqlite3.Cursor):
+    # Bumped whenever a log or its rows change (WorkoutRepository.next_change_seq)
+    cursor.execute("ALTER TABLE workout_logs ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_logs_change_seq ON workout_logs(change_seq)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS deleted_logs (
+        workout_log_id INTEGER PRIMARY KEY,
+        change_seq INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deleted_logs_change_seq ON deleted_logs(change_seq)")
+
+def migrate_011_alias_suggestions(cursor: sqlite3.Cursor):
+    # Names one typo away from a known exercise: logged as their own exercise
+    # until a user merges them on the Admin page
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_alias_suggestions (
+        alias_key TEXT PRIMARY KEY,
+        exercise_id INTEGER NOT NULL,
+        FOREIGN KEY(alias_key) REFERENCES exercise_aliases(alias_key),
+        FOREIGN KEY(exercise_id) REFERENCES exercises(id)
+    ) WITHOUT ROWID
+    ''')
+
+# Append new migrations at the end; never reorder or edit applied ones.
+SCHEMA_MIGRATIONS = [
+    migrate_001_base_schema,
+    migrate_002_indexes_and_date_num,
+    migrate_003_exercise_daily_stats,
+    migrate_004_parse_jobs,
+    migrate_005_block_keys,
+    migrate_006_exercise_sets,
+    migrate_007_exercise_aliases,
+    migrate_008_search_index,
+    migrate_009_metric_series,
+    migrate_010_change_tracking,
+    migrate_011_alias_suggestions,
+]
+
+# Page queries, shared by the Streamlit pages and bench_queries.py
+EXERCISE_SETS_QUERY = '''
+    SELECT w.date, ed.sets, ed.reps, ed.weight,
+           (SELECT group_concat(CASE WHEN s.reps IS NOT NULL THEN s.reps
+                                     WHEN s.flags & 1 THEN 'Max' ELSE '?' END, '-')
+            FROM exercise_sets s WHERE s.exercise_data_id = ed.id) AS reps_by_set
+    FROM exercise_data ed
+    JOIN workout_logs w ON ed.workout_log_id = w.id
+    WHERE ed.exercise_id = ?
+    ORDER BY w.date_num
+'''
+
+EXERCISE_NOTES_QUERY = '''
+    SELECT w.date, n.note_text, n.sentiment
+    FROM notes n
+    JOIN workout_logs w ON n.workout_log_id = w.id
+    WHERE n.exercise_id = ?
+    ORDER BY w.date_num
+'''
+
+# Matches in a log's text and in its notes, ranked together by bm25 (lower is
+# better). Snippets are only built for the page of best logs, from each log's
+# best-ranked match (the bare note_id column of the MIN() row).
+SEARCH_QUERY = '''
+    WITH hits AS (
+        SELECT rowid AS log_id, NULL AS note_id, rank AS score
+        FROM workout_logs_fts
+        WHERE workout_logs_fts MATCH ?1
+        UNION ALL
+        SELECT n.workout_log_id, n.id, notes_fts.rank
+        FROM notes_fts
+        JOIN notes n ON n.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?1
+    ), best AS (
+        SELECT w.id, w.session_name, w.date, h.note_id, MIN(h.score) AS score
+        FROM hits h
+        JOIN workout_logs w ON w.id = h.log_id
+        WHERE (?3 IS NULL OR w.date_num >= ?3) AND (?4 IS NULL OR w.date_num <= ?4)
+        GROUP BY w.id
+        ORDER BY score
+        LIMIT ?2
+    )
+    SELECT b.id, b.session_name, b.date,
+           CASE WHEN b.note_id IS NULL THEN (
+               SELECT snippet(workout_logs_fts, 0, '**', '**', '…', 16) FROM workout_logs_fts
+               WHERE workout_logs_fts MATCH ?1 AND rowid = b.id
+           ) ELSE (
+               SELECT highlight(notes_fts, 0, '**', '**') FROM notes_fts
+               WHERE notes_fts MATCH ?1 AND rowid = b.note_id
+           ) END,
+           b.score
+    FROM best b
+    ORDER BY b.score
+'''
+SEARCH_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+def fts_match_query(text: str) -> str:
+    """
+    Turns what the user typed into an FTS5 query: "quoted text" stays a
+    phrase, every other word is quoted on its own, and all must match.
+    FTS5 operators and punctuation are therefore searched as plain text.
+    """
+    terms = []
+    for phrase, word in SEARCH_TERM_RE.findall(text or ""):
+        term = (phrase or word).strip()
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"')
+    return " ".join(terms)
+
+TRACKING_METRICS_QUERY = '''
+    SELECT w.date, d.metric_name, d.metric_value, d.sentiment
+    FROM daily_metrics d
+    JOIN workout_logs w ON d.workout_log_id = w.id
+    ORDER BY w.date_num
+'''
+
+###############################################################################
+# 4) Training Analytics
+###############################################################################
+# exercise_daily_stats holds one row per exercise and training day: volume,
+# best set, estimated 1RM and a rolling PR, computed from the individual sets
+# in exercise_sets. WorkoutRepository keeps it up to date incrementally (only
+# the days a write touched are recomputed), and rebuild_exercise_stats
+# recomputes everything with vectorized pandas code.
+E1RM_MAX_REPS = 12  # e1RM formulas get unreliable beyond this
+
+EXERCISE_STATS_COLUMNS = [
+    "exercise_id", "date_num", "total_sets", "total_reps", "tonnage", "best_weight",
+    "best_set_reps", "best_set_weight", "e1rm_epley", "e1rm_brzycki",
+]
+
+EXERCISE_STATS_QUERY = '''
+    SELECT date_num, total_sets, total_reps, tonnage, best_weight,
+           best_set_reps, best_set_weight, e1rm_epley, e1rm_brzycki, pr_e1rm, is_pr
+    FROM exercise_daily_stats
+    WHERE exercise_id = ?
+    ORDER BY date_num
+'''
+
+def epley_e1rm(weight, reps):
+    return np.where(reps == 1, weight, weight * (1 + reps / 30.0))
+
+def brzycki_e1rm(weight, reps):
+    return np.where(reps == 1, weight, weight * 36.0 / (37.0 - reps))
+
+def compute_exercise_stats(sets_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates set rows (exercise_id, date_num, sets, reps, weight), where
+    `sets` counts identical sets (1 for exercise_sets rows), into one row per
+    (exercise_id, date_num) with EXERCISE_STATS_COLUMNS.
+    Sets without reps still count towards sets and best weight.
+    """
+    df = sets_df.copy()
+    df["sets"] = pd.to_numeric(df["sets"], errors="coerce").fillna(0)
+    df["reps"] = pd.to_numeric(df["reps"], errors="coerce")
+    df["weight"] = pd.to_numeric(df["weight"], errors="coerce")
+    df["total_reps"] = df["sets"] * df["reps"]
+    df["tonnage"] = df["total_reps"] * df["weight"].fillna(0)
+
+    reps = df["reps"].to_numpy(dtype=float)
+    weight = df["weight"].to_numpy(dtype=float)
+    valid = (reps >= 1) & (reps <= E1RM_MAX_REPS) & (weight > 0)
+    df["e1rm_epley"] = np.where(valid, epley_e1rm(weight, reps), np.nan)
+    df["e1rm_brzycki"] = np.where(valid, brzycki_e1rm(weight, reps), np.nan)
+
+    keys = ["exercise_id", "date_num"]
+    grouped = df.groupby(keys, sort=True).agg(
+        total_sets=("sets", "sum"),
+        total_reps=("total_reps", "sum"),
+        tonnage=("tonnage", "sum"),
+        best_weight=("weight", "max"),
+        e1rm_epley=("e1rm_epley", "max"),
+        e1rm_brzycki=("e1rm_brzycki", "max"),
+    )
+    # Best set = the set with the highest Epley e1RM of the day
+    best = df.dropna(subset=["e1rm_epley"]).sort_values("e1rm_epley").groupby(keys).tail(1)
+    best = best.set_index(keys)[["reps", "weight"]].rename(columns={"reps": "best_set_reps", "weight": "best_set_weight"})
+    stats = grouped.join(best).reset_index()
+    return stats[EXERCISE_STATS_COLUMNS]
+
+def stats_to_rows(stats: pd.DataFrame) -> list:
+    """
+    DataFrame -> list of tuples for executemany, with NaN as NULL and numpy
+    scalars converted to Python types. Works column by column for speed.
+    """
+    columns = []
+    for name in stats.columns:
+        values = stats[name].to_numpy()
+        column = values.tolist()
+        if values.dtype.kind == "f":
+            for i in np.flatnonzero(np.isnan(values)):
+                column[i] = None
+        columns.append(column)
+    return list(zip(*columns))
+
+def fetch_exercise_sets(cursor: sqlite3.Cursor, where: str = "", params: tuple = ()) -> pd.DataFrame:
+    cursor.execute(f'''
+        SELECT ed.exercise_id, w.date_num, 1, s.reps, s.load
+        FROM exercise_data ed
+        JOIN workout_logs w ON ed.workout_log_id = w.id
+        JOIN exercise_sets s ON s.exercise_data_id = ed.id
+        WHERE w.date_num IS NOT NULL {where}
+    ''', params)
+    return pd.DataFrame(cursor.fetchall(), columns=["exercise_id", "date_num", "sets", "reps", "weight"])
+
+def insert_exercise_stats(cursor: sqlite3.Cursor, stats: pd.DataFrame):
+    cursor.executemany(f'''
+        INSERT OR REPLACE INTO exercise_daily_stats ({", ".join(EXERCISE_STATS_COLUMNS)})
+        VALUES ({", ".join("?" * len(EXERCISE_STATS_COLUMNS))})
+    ''', stats_to_rows(stats))
+
+def update_pr_flags(cursor: sqlite3.Cursor, exercise_id: int, from_date_num: int):
+    """
+    Recomputes the rolling PR (running max of the Epley e1RM) for one exercise,
+    starting at `from_date_num` and seeded with the best e1RM before it.
+    """
+    cursor.execute('''
+        SELECT MAX(e1rm_epley) FROM exercise_daily_stats
+        WHERE exercise_id = ? AND date_num < ?
+    ''', (exercise_id, from_date_num))
+    previous_best = cursor.fetchone()[0]
+    cursor.execute('''
+        SELECT date_num, e1rm_epley FROM exercise_daily_stats
+        WHERE exercise_id = ? AND date_num >= ?
+        ORDER BY date_num
+    ''', (exercise_id, from_date_num))
+    rows = cursor.fetchall()
+    if not rows:
+        return
+    dates = np.array([r[0] for r in rows])
+    e1rm = np.array([np.nan if r[1] is None else r[1] for r in rows], dtype=float)
+    pr_flags, running_best = rolling_prs(e1rm, previous_best)
+    cursor.executemany('''
+        UPDATE exercise_daily_stats SET pr_e1rm = ?, is_pr = ?
+        WHERE exercise_id = ? AND date_num = ?
+    ''', [
+        (None if np.isnan(best) else float(best), int(flag), exercise_id, int(date_num))
+        for date_num, best, flag in zip(dates, running_best, pr_flags)
+    ])
+
+def rolling_prs(e1rm: np.ndarray, previous_best=None):
+    """
+    Returns (is_pr, running_best) arrays for a date-ordered e1RM series.
+    A day is a PR when its e1RM beats every earlier day.
+    """
+    seed = -np.inf if previous_best is None else previous_best
+    filled = np.where(np.isnan(e1rm), -np.inf, e1rm)
+    running_best = np.maximum.accumulate(np.concatenate(([seed], filled)))
+    is_pr = filled > running_best[:-1]
+    best = running_best[1:].astype(float)
+    best[np.isneginf(best)] = np.nan
+    return is_pr, best
+
+def refresh_exercise_stats(cursor: sqlite3.Cursor, dirty_keys: set):
+    """
+    Incremental update: recomputes only the (exercise_id, date_num) days in
+    `dirty_keys`, then the PR flags of those exercises from the earliest
+    touched day onwards.
+    """
+    dirty_keys = {(exercise_id, date_num) for exercise_id, date_num in dirty_keys if date_num is not None}
+    if not dirty_keys:
+        return
+    cursor.executemany(
+        "DELETE FROM exercise_daily_stats WHERE exercise_id = ? AND date_num = ?", list(dirty_keys)
+    )
+    exercise_ids = sorted({exercise_id for exercise_id, _ in dirty_keys})
+    date_nums = sorted({date_num for _, date_num in dirty_keys})
+    sets_df = fetch_exercise_sets(
+        cursor,
+        f"AND ed.exercise_id IN ({','.join('?' * len(exercise_ids))}) "
+        f"AND w.date_num IN ({','.join('?' * len(date_nums))})",
+        tuple(exercise_ids) + tuple(date_nums),
+    )
+    if not sets_df.empty:
+        stats = compute_exercise_stats(sets_df)
+        keep = [key in dirty_keys for key in zip(stats["exercise_id"], stats["date_num"])]
+        insert_exercise_stats(cursor, stats[keep])
+    for exercise_id in exercise_ids:
+        from_date_num = min(date_num for ex_id, date_num in dirty_keys if ex_id == exercise_id)
+        update_pr_flags(cursor, exercise_id, from_date_num)
+
+def rebuild_exercise_stats(cursor: sqlite3.Cursor):
+    """
+    Full, vectorized rebuild of exercise_daily_stats from exercise_sets.
+    """
+    cursor.execute("DELETE FROM exercise_daily_stats")
+    # Plain scans joined in pandas are cheaper than a row-by-row SQL join
+    cursor.execute("SELECT exercise_data_id, reps, load FROM exercise_sets")
+    sets_df = pd.DataFrame(cursor.fetchall(), columns=["exercise_data_id", "reps", "weight"])
+    cursor.execute("SELECT id, exercise_id, workout_log_id FROM exercise_data")
+    entries = pd.DataFrame(cursor.fetchall(), columns=["id", "exercise_id", "workout_log_id"]).set_index("id")
+    cursor.execute("SELECT id, date_num FROM workout_logs WHERE date_num IS NOT NULL")
+    log_dates = pd.Series(dict(cursor.fetchall()), dtype="float64")
+    sets_df["sets"] = 1
+    sets_df["exercise_id"] = sets_df["exercise_data_id"].map(entries["exercise_id"])
+    sets_df["date_num"] = sets_df["exercise_data_id"].map(entries["workout_log_id"]).map(log_dates)
+    sets_df = sets_df.dropna(subset=["date_num"]).astype({"date_num": "int64"})
+    if sets_df.empty:
+        return
+    stats = compute_exercise_stats(sets_df)
+    stats = stats.sort_values(["exercise_id", "date_num"])
+    e1rm = stats["e1rm_epley"].to_numpy(dtype=float)
+    filled = pd.Series(np.where(np.isnan(e1rm), -np.inf, e1rm), index=stats.index)
+    running_best = filled.groupby(stats["exercise_id"]).cummax()
+    previous_best = running_best.groupby(stats["exercise_id"]).shift(1).fillna(-np.inf)
+    stats["pr_e1rm"] = running_best.replace(-np.inf, np.nan)
+    stats["is_pr"] = (filled > previous_best).astype(int)
+    columns = EXERCISE_STATS_COLUMNS + ["pr_e1rm", "is_pr"]
+    cursor.executemany(f'''
+        INSERT INTO exercise_daily_stats ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+    ''', stats_to_rows(stats[columns]))
+
+# Daily metrics. The LLM names metrics freely ("ShoulderInflammation",
+# "TrapPain", "Sleep") and values are free text ("poor (3 nights bad sleep)").
+# resolve_metric maps each name to a canonical MetricDefinition and
+# parse_metric_value reads a number on that metric's scale from the text.
+# metric_series keeps the daily mean per metric, maintained incrementally
+# like exercise_daily_stats.
+@dataclass(frozen=True)
+class MetricDefinition:
+    """
+    A canonical metric. `scale` lists (phrase, value) pairs tried in order on
+    free-text values; `scale_max` rescales "7/10"-style ratings.
+    """
+    name: str
+    label: str
+    unit: str = ""
+    scale: tuple = ()
+    scale_max: float = None
+
+RATING_SCALE = (
+    ("very poor", 1), ("terrible", 1), ("awful", 1), ("very good", 5), ("very high", 5),
+    ("excellent", 5), ("great", 5), ("poor", 2), ("bad", 2), ("low", 2), ("tired", 2),
+    ("okay", 3), ("ok", 3), ("average", 3), ("normal", 3), ("fine", 3), ("medium", 3),
+    ("good", 4), ("high", 4), ("rested", 4),
+)
+PAIN_SCALE = (
+    ("pain-free", 0), ("pain free", 0), ("no pain", 0), ("none", 0), ("gone", 0),
+    ("severe", 8), ("sharp", 7), ("worse", 6),
+    ("less", 3), ("mild", 3), ("a bit", 3), ("slight", 2), ("little", 2), ("better", 3),
+    ("present", 5), ("sore", 5), ("inflamed", 5), ("hurt", 5), ("pain", 5),
+)
+METRIC_DEFINITIONS = {
+    definition.name: definition for definition in (
+        MetricDefinition("sleep_hours", "Sleep", "h"),
+        MetricDefinition("sleep_quality", "Sleep quality", "1-5", RATING_SCALE, 5),
+        MetricDefinition("energy", "Energy", "1-5", RATING_SCALE, 5),
+        MetricDefinition("mood", "Mood", "1-5", RATING_SCALE, 5),
+        MetricDefinition("motivation", "Motivation", "1-5", RATING_SCALE, 5),
+        MetricDefinition("stress", "Stress", "1-5", RATING_SCALE, 5),
+        MetricDefinition("bodyweight", "Bodyweight", "kg"),
+    )
+}
+# Raw metric names (lowercase, letters and digits only) -> canonical names
+METRIC_NAME_ALIASES = {
+    "sleephours": "sleep_hours", "sleepduration": "sleep_hours", "hoursofsleep": "sleep_hours",
+    "sleepquality": "sleep_quality", "energy": "energy", "energylevel": "energy",
+    "mood": "mood", "motivation": "motivation", "stress": "stress", "stresslevel": "stress",
+    "bodyweight": "bodyweight", "weight": "bodyweight", "bw": "bodyweight",
+}
+PAIN_METRIC_RE = re.compile(r"^(?P<part>[a-z]*?)(?:pain|inflammation|soreness|sore|ache)$")
+SLEEP_HOURS_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:h\b|hrs?\b|hours?\b)", re.IGNORECASE)
+METRIC_RATIO_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*/\s*(\d+)")
+METRIC_NUMBER_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(kgs?|lbs?)?", re.IGNORECASE)
+
+def resolve_metric(raw_name: str, raw_value: str = "") -> MetricDefinition:
+    """
+    Canonical definition for a metric name as the LLM wrote it. Body-part
+    pains ("TrapPain", "ShoulderInflammation") become "<part>_pain" on a
+    0-10 scale; unknown names get an unscaled definition of their own.
+    """
+    key = re.sub(r"[^a-z0-9]", "", (raw_name or "").lower())
+    if key == "sleep":
+        key = "sleephours" if SLEEP_HOURS_RE.search(raw_value or "") else "sleepquality"
+    if key in METRIC_NAME_ALIASES:
+        return METRIC_DEFINITIONS[METRIC_NAME_ALIASES[key]]
+    pain = PAIN_METRIC_RE.match(key)
+    if pain:
+        part = pain.group("part") or "general"
+        return MetricDefinition(f"{part}_pain", f"{part.capitalize()} pain", "0-10", PAIN_SCALE, 10)
+    name = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", "_", (raw_name or "").strip())
+    name = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "unnamed"
+    return MetricDefinition(name, (raw_name or "").strip() or "Unnamed")
+
+def parse_metric_value(definition: MetricDefinition, raw_value: str):
+    """
+    The number a free-text value stands for on the metric's scale, or None.
+    """
+    text = (raw_value or "").strip().lower()
+    if not text:
+        return None
+    if definition.unit == "h":
+        match = SLEEP_HOURS_RE.search(text) or METRIC_NUMBER_RE.search(text)
+        return float(match.group(1).replace(",", ".")) if match else None
+    if definition.unit == "kg":
+        match = METRIC_NUMBER_RE.search(text)
+        if not match:
+            return None
+        value = float(match.group(1).replace(",", "."))
+        return round(value * LBS_TO_KG, 2) if (match.group(2) or "").startswith("lb") else value
+    if definition.scale:
+        ratio = METRIC_RATIO_RE.search(text)
+        if ratio and float(ratio.group(2)) > 0:
+            return round(float(ratio.group(1).replace(",", ".")) / float(ratio.group(2)) * definition.scale_max, 2)
+        for phrase, value in definition.scale:
+            if re.search(rf"(?<![a-z]){re.escape(phrase)}(?![a-z])", text):
+                return float(value)
+    match = METRIC_NUMBER_RE.match(text)
+    if not match or (definition.scale and match.end() != len(text)):
+        return None
+    value = float(match.group(1).replace(",", "."))
+    # Ratings above the scale, such as "7" for a 1-5 metric, are read as out
+    # of 10; anything above 10 is not on the scale at all
+    if definition.scale_max and value > definition.scale_max:
+        if value > 10:
+            return None
+        value = round(value / 10 * definition.scale_max, 2)
+    return value
+
+METRIC_SERIES_QUERY = '''
+    SELECT m.name, m.label, m.unit, s.date_num, s.value
+    FROM metric_series s
+    JOIN metrics m ON s.metric_id = m.id
+    ORDER BY s.metric_id, s.date_num
+'''
+
+DAILY_VOLUME_QUERY = '''
+    SELECT date_num, SUM(tonnage), SUM(total_sets)
+    FROM exercise_daily_stats
+    GROUP BY date_num
+    ORDER BY date_num
+'''
+
+def refresh_metric_series(cursor: sqlite3.Cursor, dirty_keys: set):
+    """
+    Recomputes the metric_series rows of the (metric_id, date_num) days in `dirty_keys`.
+    """
+    dirty_keys = {(metric_id, date_num) for metric_id, date_num in dirty_keys
+                  if metric_id is not None and date_num is not None}
+    if not dirty_keys:
+        return
+    cursor.executemany("DELETE FROM metric_series WHERE metric_id = ? AND date_num = ?", list(dirty_keys))
+    metric_ids = sorted({metric_id for metric_id, _ in dirty_keys})
+    date_nums = sorted({date_num for _, date_num in dirty_keys})
+    # May also recompute untouched combinations of these ids and days; REPLACE keeps them identical
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO metric_series (metric_id, date_num, value, samples)
+        SELECT d.metric_id, w.date_num, AVG(d.numeric_value), COUNT(*)
+        FROM daily_metrics d
+        JOIN workout_logs w ON d.workout_log_id = w.id
+        WHERE d.numeric_value IS NOT NULL
+          AND d.metric_id IN ({','.join('?' * len(metric_ids))})
+          AND w.date_num IN ({','.join('?' * len(date_nums))})
+        GROUP BY d.metric_id, w.date_num
+    ''', metric_ids + date_nums)
+
+def rebuild_metric_series(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM metric_series")
+    cursor.execute('''
+        INSERT INTO metric_series (metric_id, date_num, value, samples)
+        SELECT d.metric_id, w.date_num, AVG(d.numeric_value), COUNT(*)
+        FROM daily_metrics d
+        JOIN workout_logs w ON d.workout_log_id = w.id
+        WHERE d.numeric_value IS NOT NULL AND d.metric_id IS NOT NULL AND w.date_num IS NOT NULL
+        GROUP BY d.metric_id, w.date_num
+    ''')
+
+METRIC_CORRELATION_MIN_DAYS = 5
+
+def metric_volume_correlations(series: pd.DataFrame, volume: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pearson correlation of each metric (columns metric, date_num, value) with
+    training volume (columns date_num, tonnage): on the same day, and with the
+    volume of the previous training day. Needs METRIC_CORRELATION_MIN_DAYS
+    paired days, else NaN.
+    """
+    volume = volume.sort_values("date_num")
+    rows = []
+    for metric, values in series.groupby("metric", sort=False):
+        values = values.sort_values("date_num")
+        same_day = values.merge(volume, on="date_num")
+        previous = pd.merge_asof(values, volume, on="date_num", allow_exact_matches=False).dropna(subset=["tonnage"])
+        rows.append({
+            "metric": metric,
+            "days": len(same_day),
+            "same_day": same_day["value"].corr(same_day["tonnage"])
+                        if len(same_day) >= METRIC_CORRELATION_MIN_DAYS else np.nan,
+            "previous_session": previous["value"].corr(previous["tonnage"])
+                                if len(previous) >= METRIC_CORRELATION_MIN_DAYS else np.nan,
+        })
+    return pd.DataFrame(rows, columns=["metric", "days", "same_day", "previous_session"])
+
+###############################################################################
+# 5) Parse Cache
+###############################################################################
+# Parsed results are stored in a separate SQLite file next to the workout
+# database, keyed on a hash of the normalized raw text plus everything that
+# influences the model output (model, prompt version, generation parameters).
+PARSE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "parse_cache.db")
+PARSE_CACHE_MAX_ENTRIES = 5000
+PARSE_CACHE_MAX_AGE_SECONDS = 90 * 24 * 3600
+
+def normalize_raw_text(raw_text: str) -> str:
+    """
+    Normalizes a workout log so that cosmetic differences (line endings,
+    trailing whitespace, blank lines, unicode forms) map to the same cache key.
+    """
+    text = unicodedata.normalize("NFC", raw_text).replace("\r\n", "\n").replace("\r", "\n")
+    lines = [line.rstrip() for line in text.split("\n")]
+    normalized = []
+    for line in lines:
+        if not line and (not normalized or not normalized[-1]):
+            continue
+        normalized.append(line)
+    return "\n".join(normalized).strip()
+
+class ParseCache:
+    """
+    Persistent, content-addressed cache of LLM parses with LRU/age eviction.
+    Safe to share between Streamlit sessions (all access goes through a lock).
+    """
+
+    def __init__(self, path: str, max_entries: int = PARSE_CACHE_MAX_ENTRIES,
+                 max_age_seconds: int = PARSE_CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.entries = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS parse_cache (
+            cache_key TEXT PRIMARY KEY,
+            structured_json TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache(last_used_at)")
+        self._conn.commit()
+        self.entries = self._conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(raw_text: str) -> str:
+        key_material = json.dumps({
+            "text": normalize_raw_text(raw_text),
+            "model": MODEL_ID,
+            "backend": inference_backend_identity(INFERENCE_BACKEND, INFERENCE_URL),
+            "prompt_version": PROMPT_VERSION,
+            "max_new_tokens": MAX_NEW_TOKENS,
+            "temperature": TEMPERATURE,
+        }, sort_keys=True)
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT structured_json, created_at FROM parse_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE parse_cache SET last_used_at = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, structured_data: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO parse_cache (cache_key, structured_json, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    structured_json = excluded.structured_json,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+            ''', (key, json.dumps(structured_data), now, now))
+            self._evict(now)
+            self._conn.commit()
+            self.entries = self._conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+
+    def _evict(self, now: float):
+        # Age-based eviction first, then trim the least recently used entries.
+        self._conn.execute("DELETE FROM parse_cache WHERE created_at < ?", (now - self.max_age_seconds,))
+        self._conn.execute('''
+            DELETE FROM parse_cache WHERE cache_key IN (
+                SELECT cache_key FROM parse_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+
+    def stats(self) -> dict:
+        # Served from memory so the sidebar does not hit disk on every rerun
+        return {"hits": self.hits, "misses": self.misses, "entries": self.entries}
+
+@st.cache_resource
+def get_parse_cache() -> ParseCache:
+    """
+    One cache instance per process, shared across Streamlit sessions and reruns.
+    """
+    return ParseCache(PARSE_CACHE_PATH)
+
+###############################################################################
+# 6) Prompt Building & Parsing Logic
+###############################################################################
+# Bump whenever the system prompt or the few-shot examples change, so that
+# cached parses produced by the old prompt are no longer served.
+PROMPT_VERSION = 2
+# Few-shot examples included in each prompt, picked from PROMPT_EXAMPLES
+PROMPT_MAX_EXAMPLES = 2
+
+PROMPT_INSTRUCTIONS = """You extract structured workout information from text logs.
+Respond with valid JSON only, with keys "metrics", "exercises", "general_notes".
+- "metrics": daily metrics (sleep, pain, energy, etc.).
+- "exercises": sets, reps, weight (kg), plus notes relevant to that exercise.
+- "general_notes": remarks not tied to a specific exercise.
+Do not repeat the input or the examples.
+"""
+
+# Small example store; build_prompt picks the ones closest to the input.
+PROMPT_EXAMPLES = [
+    {
+        "input": """Prior notes:
+- Pretty tired after three nights of bad sleep.
+Pull ups
+- 6x4 15kg
+Inclined Bench press
+- 3xRPE 10 50kg 9-7-6
+- AMRAP 40kg 7reps
+- Notes: left shoulder felt fine""",
+        "output": {
+            "metrics": [
+                {"metric_name": "SleepQuality", "metric_value": "poor (3 nights bad sleep)", "sentiment": "negative"}
+            ],
+            "exercises": [
+                {"exercise_name": "Pull ups", "sets": 6, "reps": 4, "weight": 15.0, "notes": []},
+                {"exercise_name": "Inclined Bench press", "sets": 3, "reps": None, "weight": 50.0, "notes": [
+                    {"note_text": "AMRAP 40kg for 7 reps", "sentiment": "neutral"},
+                    {"note_text": "left shoulder felt fine", "sentiment": "positive"}
+                ]}
+            ],
+            "general_notes": []
+        },
+    },
+    {
+        "input": """Prior notes:
+- Body state: left shoulder less inflamed, left trap pain
+Military press
+- 6x6 50kg
+- Notes: felt good. Last set @8.5
+Pull ups
+- 6x4 +12.5kg""",
+        "output": {
+            "metrics": [
+                {"metric_name": "ShoulderInflammation", "metric_value": "less inflamed", "sentiment": "improving"},
+                {"metric_name": "TrapPain", "metric_value": "present", "sentiment": "neutral"}
+            ],
+            "exercises": [
+                {"exercise_name": "Military press", "sets": 6, "reps": 6, "weight": 50.0, "notes": [
+                    {"note_text": "felt good, last set @8.5", "sentiment": "positive"}
+                ]},
+                {"exercise_name": "Pull ups", "sets": 6, "reps": 4, "weight": 12.5, "notes": []}
+            ],
+            "general_notes": []
+        },
+    },
+    {
+        "input": """Regular DL deficit (blue disk)
+- 1x2 135kg
+- Notes:
+   - RPE: @8
+   - weak grip""",
+        "output": {
+            "metrics": [],
+            "exercises": [
+                {"exercise_name": "Regular DL deficit (blue disk)", "sets": 1, "reps": 2, "weight": 135.0, "notes": [
+                    {"note_text": "RPE @8", "sentiment": "neutral"},
+                    {"note_text": "weak grip", "sentiment": "negative"}
+                ]}
+            ],
+            "general_notes": []
+        },
+    },
+    {
+        "input": """Slept 8h, energy high, knees a bit sore.
+Gym was packed, had to cut the session short.""",
+        "output": {
+            "metrics": [
+                {"metric_name": "Sleep", "metric_value": "8h", "sentiment": "positive"},
+                {"metric_name": "Energy", "metric_value": "high", "sentiment": "positive"},
+                {"metric_name": "KneePain", "metric_value": "a bit sore", "sentiment": "negative"}
+            ],
+            "exercises": [],
+            "general_notes": [
+                {"note_text": "gym was packed, cut the session short", "category": "session", "sentiment": "negative"}
+            ]
+        },
+    },
+]
+
+PROMPT_WORD_RE = re.compile(r"[a-z]+|\d+", re.IGNORECASE)
+# Rough BPE token pattern: words, numbers and single punctuation marks
+PROMPT_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def prompt_terms(text: str) -> frozenset:
+    return frozenset(word.lower() for word in PROMPT_WORD_RE.findall(text))
+
+def render_prompt_example(example: dict) -> str:
+    output = json.dumps(example["output"], separators=(",", ":"), ensure_ascii=False)
+    return f"## EXAMPLE\nInput:\n{example['input']}\nOutput:\n{output}\n"
+
+# Worked out once at import time; only the example choice depends on the input
+PROMPT_EXAMPLE_TEXTS = [render_prompt_example(example) for example in PROMPT_EXAMPLES]
+PROMPT_EXAMPLE_TERMS = [prompt_terms(example["input"]) for example in PROMPT_EXAMPLES]
+
+def select_prompt_examples(raw_text: str, k: int = PROMPT_MAX_EXAMPLES) -> list:
+    """
+    Indices of the k examples most similar to the input (Jaccard similarity
+    of their word sets), in store order so equal selections give equal prompts.
+    """
+    terms = prompt_terms(raw_text)
+
+    def similarity(i):
+        example_terms = PROMPT_EXAMPLE_TERMS[i]
+        union = terms | example_terms
+        return len(terms & example_terms) / len(union) if union else 0.0
+
+    ranked = sorted(range(len(PROMPT_EXAMPLES)), key=lambda i: (-similarity(i), i))
+    return sorted(ranked[:k])
+
+def estimate_prompt_tokens(text: str) -> int:
+    """
+    Approximate token count; the model's tokenizer is not available locally.
+    """
+    return len(PROMPT_TOKEN_RE.findall(text))
+
+def build_prompt(raw_text: str):
+    """
+    Returns (prompt, estimated prompt tokens) for one LLM parse call.
+    """
+    examples = "".join(PROMPT_EXAMPLE_TEXTS[i] for i in select_prompt_examples(raw_text))
+    prompt = f'{PROMPT_INSTRUCTIONS}\n{examples}\nNEW INPUT:\n"""{raw_text}"""\nOutput:\n'
+    return prompt, estimate_prompt_tokens(prompt)
+
+# Most leftover blocks sent to the LLM in one call (see build_batch_prompt)
+PROMPT_MAX_BATCH_BLOCKS = 8
+
+PROMPT_BATCH_INSTRUCTIONS = """The input holds several blocks of one log, each starting with a line "### BLOCK <n>".
+Give every metric, exercise and note a "block" key with the number of the block it came from.
+"""
+
+PROMPT_BLOCK_MARKER_RE = re.compile(r"^### BLOCK (\d+)$", re.MULTILINE)
+
+def render_prompt_batch(texts: list) -> str:
+    return "\n".join(f"### BLOCK {n}\n{text}" for n, text in enumerate(texts, start=1))
+
+def split_prompt_batch(text: str) -> dict:
+    """
+    The inverse of render_prompt_batch: {block number: block text}.
+    """
+    parts = PROMPT_BLOCK_MARKER_RE.split(text)
+    return {int(number): body.strip("\n") for number, body in zip(parts[1::2], parts[2::2])}
+
+def render_prompt_batch_example(examples: list) -> str:
+    output = {"metrics": [], "exercises": [], "general_notes": []}
+    for n, example in enumerate(examples, start=1):
+        for key in output:
+            output[key].extend({**item, "block": n} for item in example["output"][key])
+    output = json.dumps(output, separators=(",", ":"), ensure_ascii=False)
+    inputs = render_prompt_batch([example["input"] for example in examples])
+    return f"## EXAMPLE\nInput:\n{inputs}\nOutput:\n{output}\n"
+
+def build_batch_prompt(texts: list):
+    """
+    Returns (prompt, estimated prompt tokens) for one LLM call parsing
+    several blocks; the chosen examples are shown as one batch as well.
+    """
+    batch_text = render_prompt_batch(texts)
+    examples = [PROMPT_EXAMPLES[i] for i in select_prompt_examples(batch_text)]
+    prompt = (f'{PROMPT_INSTRUCTIONS}{PROMPT_BATCH_INSTRUCTIONS}\n{render_prompt_batch_example(examples)}'
+              f'\nNEW INPUT:\n"""{batch_text}"""\nOutput:\n')
+    return prompt, estimate_prompt_tokens(prompt)
+
+# Block key of items parsed from the whole log in one LLM call
+WHOLE_LOG_BLOCK_KEY = "*"
+
+def categorize_and_extract_features(raw_text: str, only_block_keys=None, on_exercise=None) -> dict:
+    """
+    Parse the log block by block (see split_log_blocks). Blocks the local
+    fast-path parser understands cost nothing; the remaining blocks are sent
+    to the LLM together (see extract_blocks_with_llm). If the parser
+    understood too little of the log, the whole text goes to the LLM in one
+    call instead. In offline mode the LLM is never called.
+
+    Every extracted item is tagged with the "block_key" of the block it came
+    from, so an edit can re-parse only the blocks that changed. Pass
+    `only_block_keys` to parse just those blocks.
+
+    `on_exercise` is called with each exercise as soon as it is extracted.
+    """
+    local_result = parse_workout_locally(raw_text)
+    metrics = get_metrics()
+    if needs_whole_log_parse(local_result):
+        metrics.inc("gainsgpt_parsed_blocks_total", len(local_result.blocks), parser="llm_whole_log")
+        return tag_block_key(extract_features_with_llm(raw_text, on_exercise), WHOLE_LOG_BLOCK_KEY)
+
+    blocks = [
+        block for block in local_result.blocks
+        if only_block_keys is None or block["key"] in only_block_keys
+    ]
+    llm_blocks = [block for block in blocks if block["structured_data"] is None and not OFFLINE_MODE]
+    if llm_blocks:
+        metrics.inc("gainsgpt_parsed_blocks_total", len(llm_blocks), parser="llm")
+    llm_data = iter(extract_blocks_with_llm([block["text"] for block in llm_blocks], on_exercise))
+
+    parts = []
+    for block in blocks:
+        block_data = block["structured_data"]
+        if block_data is not None:
+            metrics.inc("gainsgpt_parsed_blocks_total", parser="local")
+            report_exercises(block_data, on_exercise)
+        elif OFFLINE_MODE:
+            metrics.inc("gainsgpt_parsed_blocks_total", parser="offline")
+            block_data = unparsed_block_data(block)
+        else:
+            block_data = next(llm_data)
+        parts.append(tag_block_key(block_data, block["key"]))
+    return merge_structured_data(*parts)
+
+def needs_whole_log_parse(local_result) -> bool:
+    return (not OFFLINE_MODE and bool(local_result.leftover_blocks)
+            and local_result.confidence < FAST_PARSE_MIN_CONFIDENCE)
+
+def tag_block_key(structured_data: dict, block_key: str) -> dict:
+    return {
+        key: [{**item, "block_key": block_key} for item in structured_data.get(key) or []]
+        for key in ("metrics", "exercises", "general_notes")
+    }
+
+def report_exercises(structured_data: dict, on_exercise=None):
+    if on_exercise is not None:
+        for exercise in structured_data.get("exercises") or []:
+            on_exercise(exercise)
+
+def extract_features_with_llm(raw_text: str, on_exercise=None) -> dict:
+    """
+    Build the final prompt, call the inference backend, parse out JSON, return structured data.
+    Results are served from the parse cache when the same text was parsed before.
+    """
+    metrics = get_metrics()
+    parse_cache = get_parse_cache()
+    cache_key = parse_cache.make_key(raw_text)
+    cached_data = parse_cache.get(cache_key)
+    if cached_data is not None:
+        metrics.inc("gainsgpt_parse_cache_total", result="hit")
+        report_exercises(cached_data, on_exercise)
+        return cached_data
+    metrics.inc("gainsgpt_parse_cache_total", result="miss")
+    return parse_with_llm(raw_text, cache_key, on_exercise)
+
+def parse_with_llm(raw_text: str, cache_key: str, on_exercise=None) -> dict:
+    with get_metrics().span("prompt_build"):
+        prompt_text, prompt_tokens = build_prompt(raw_text)
+    structured_data = generate_structured_data(prompt_text, prompt_tokens, on_exercise)
+    if not STREAMING_MODE:
+        report_exercises(structured_data, on_exercise)
+    cache_parse(cache_key, structured_data)
+    return structured_data
+
+def extract_blocks_with_llm(texts: list, on_exercise=None) -> list:
+    """
+    Structured data for each of several block texts, in order. Cached blocks
+    are served from the parse cache; the others go to the LLM together, up to
+    PROMPT_MAX_BATCH_BLOCKS per call, so the instructions and examples are
+    sent once instead of once per block. The answer is split back out by the
+    "block" key of each item, and a block the answer has nothing for (say,
+    because it was cut off) is parsed on its own.
+    """
+    metrics = get_metrics()
+    parse_cache = get_parse_cache()
+    cache_keys = [parse_cache.make_key(text) for text in texts]
+    results = [None] * len(texts)
+    missing = []
+    for i, cache_key in enumerate(cache_keys):
+        cached_data = parse_cache.get(cache_key)
+        metrics.inc("gainsgpt_parse_cache_total", result="miss" if cached_data is None else "hit")
+        if cached_data is None:
+            missing.append(i)
+        else:
+            report_exercises(cached_data, on_exercise)
+            results[i] = cached_data
+    if len(missing) == 1:
+        results[missing[0]] = parse_with_llm(texts[missing[0]], cache_keys[missing[0]], on_exercise)
+        return results
+
+    for start in range(0, len(missing), PROMPT_MAX_BATCH_BLOCKS):
+        batch = missing[start:start + PROMPT_MAX_BATCH_BLOCKS]
+        with metrics.span("prompt_build"):
+            prompt_text, prompt_tokens = build_batch_prompt([texts[i] for i in batch])
+        batch_data = split_batch_data(generate_structured_data(prompt_text, prompt_tokens, on_exercise), len(batch))
+        for i, block_data in zip(batch, batch_data):
+            if block_data is None:
+                metrics.inc("gainsgpt_batch_parse_misses_total")
+                results[i] = parse_with_llm(texts[i], cache_keys[i], on_exercise)
+                continue
+            if not STREAMING_MODE:
+                report_exercises(block_data, on_exercise)
+            cache_parse(cache_keys[i], block_data)
+            results[i] = block_data
+    return results
+
+def split_batch_data(structured_data: dict, count: int) -> list:
+    """
+    Splits the answer to a batch prompt into the data of each of its `count`
+    blocks, by the "block" key of each item. None for a block without items;
+    items with no valid block number are dropped.
+    """
+    blocks = [None] * count
+    for key in ("metrics", "exercises", "general_notes"):
+        for item in structured_data.get(key) or []:
+            if not isinstance(item, dict):
+                continue
+            item = dict(item)
+            number = item.pop("block", None)
+            if not isinstance(number, int) or not 1 <= number <= count:
+                continue
+            if blocks[number - 1] is None:
+                blocks[number - 1] = {"metrics": [], "exercises": [], "general_notes": []}
+            blocks[number - 1][key].append(item)
+    return blocks
+
+def generate_structured_data(prompt_text: str, prompt_tokens: int, on_exercise=None) -> dict:
+    """
+    Calls the inference backend with a built prompt and parses the JSON out of
+    its answer. Exercises are reported as they stream in (in STREAMING_MODE).
+    """
+    metrics = get_metrics()
+    # Average prompt size is gainsgpt_prompt_tokens_total / gainsgpt_prompts_total
+    metrics.inc("gainsgpt_prompts_total")
+    metrics.inc("gainsgpt_prompt_tokens_total", prompt_tokens)
+
+    if STREAMING_MODE:
+        generated_text = generate_json_streaming(prompt_text, on_exercise)
+    else:
+        generated_text = call_inference_api(prompt_text)
+    logger.debug("Generated text: %s", generated_text)
+    with metrics.span("json_extraction"):
+        structured_data = parse_json_lenient(generated_text)
+    if not isinstance(structured_data, dict):
+        structured_data = {
+            "metrics": [],
+            "exercises": [],
+            "general_notes": []
+        }
+    return structured_data
+
+def cache_parse(cache_key: str, structured_data: dict):
+    # Only cache successful parses, so failures are retried on the next call
+    if structured_data.get("metrics") or structured_data.get("exercises") or structured_data.get("general_notes"):
+        get_parse_cache().put(cache_key, structured_data)
+    else:
+        get_metrics().inc("gainsgpt_empty_parses_total")
+
+def generate_json_streaming(prompt: str, on_exercise=None) -> str:
+    """
+    Streams the completion through an IncrementalJSONParser, reporting each
+    exercise as soon as its object closes, and stops generating once the
+    top-level object is complete. Returns the text generated up to that point.
+    """
+    metrics = get_metrics()
+    parser = IncrementalJSONParser()
+    stream = stream_inference_api(prompt)
+    start = time.perf_counter()
+    first_piece = True
+    try:
+        for piece in stream:
+            if first_piece:
+                metrics.observe("gainsgpt_span_seconds", time.perf_counter() - start, span="inference_first_token")
+                first_piece = False
+            for exercise in parser.feed(piece):
+                if on_exercise is not None:
+                    on_exercise(exercise)
+            if parser.done:
+                break
+    finally:
+        stream.close()
+        metrics.observe("gainsgpt_span_seconds", time.perf_counter() - start, span="inference_http")
+    return parser.text[:parser.end] if parser.done else parser.text
+
+# Python literals the model sometimes emits instead of JSON ones
+PYTHON_JSON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+
+class IncrementalJSONParser:
+    """
+    Consumes generated text piece by piece and tracks just enough JSON state
+    (strings, nesting, the current top-level key) to know when the first
+    top-level object closes (`done`, `end`) and to hand out each object of the
+    top-level "exercises" array as soon as it is complete.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.end = None
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._item_start = None
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None
+
+    def feed(self, piece: str) -> list:
+        """
+        Adds generated text; returns the exercises completed by it.
+        """
+        self.text += piece
+        text = self.text
+        items = []
+        while self._pos < len(text) and self.end is None:
+            i = self._pos
+            ch = text[i]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+            elif not self._stack:
+                # Text before the object is ignored
+                if ch == "{":
+                    self._stack.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                if len(self._stack) == 1 and self._last_string is not None:
+                    try:
+                        self._key = json.loads(self._last_string)
+                    except ValueError:
+                        self._key = None
+            elif ch in "{[":
+                self._stack.append(ch)
+                if ch == "{" and self._stack[1:] == ["[", "{"] and self._key == "exercises":
+                    self._item_start = i
+            elif ch in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self.end = i + 1
+                elif len(self._stack) == 2 and self._item_start is not None:
+                    item = parse_json_lenient(text[self._item_start:i + 1])
+                    if isinstance(item, dict):
+                        items.append(item)
+                    self._item_start = None
+        return items
+
+def repair_json(text: str):
+    """
+    Cleans the first JSON object in `text`: drops the text around it, maps
+    Python literals to JSON ones and removes trailing commas. Returns the
+    cleaned text and the places where a truncated object could be cut and
+    closed, as (position, closing brackets) pairs in text order.
+    """
+    out = []
+    cut_points = []
+    stack = []
+    in_string = escape = False
+    i = text.find("{")
+    if i == -1:
+        return "", cut_points
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < len(text) and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.extend(PYTHON_JSON_LITERALS.get(word, word))
+            i = j
+            continue
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            if is_cut_point(stack):
+                cut_points.append((len(out), closing_brackets(stack)))
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                # Anything after the top-level object is dropped
+                break
+            if is_cut_point(stack):
+                cut_points.append((len(out), closing_brackets(stack)))
+        elif ch == ",":
+            if is_cut_point(stack):
+                cut_points.append((len(out), closing_brackets(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out), cut_points
+
+def is_cut_point(stack: list) -> bool:
+    # Cut between top-level keys or the elements of a top-level array only, so
+    # an exercise or metric cut off anywhere inside (even deep in its notes)
+    # is dropped whole rather than kept with missing fields
+    return len(stack) == 1 or (len(stack) == 2 and stack[-1] == "[")
+
+def closing_brackets(stack: list) -> str:
+    return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+def parse_json_lenient(text: str):
+    """
+    Parses the first JSON object in model output, repairing common faults
+    (see repair_json). Output cut off mid-object keeps every array element and
+    top-level key that was complete. Returns None if nothing can be recovered.
+    """
+    cleaned, cut_points = repair_json(text)
+    if not cleaned:
+        return None
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        pass
+    for position, closers in reversed(cut_points):
+        try:
+            return json.loads(cleaned[:position] + closers)
+        except ValueError:
+            continue
+    return None
+
+def merge_structured_data(*parts: dict) -> dict:
+    """
+    Concatenates the metrics, exercises and general notes of several parses.
+    """
+    merged = {"metrics": [], "exercises": [], "general_notes": []}
+    for part in parts:
+        for key in merged:
+            merged[key].extend(part.get(key) or [])
+    return merged
 
 ###############################################################################
-# 1) Hugging Face Inference API Configuration
+# 7) Rule-Based Fast-Path Parser
 ###############################################################################
-# Change MODEL_ID or HF_API_KEY as needed
-MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.3"  
-HF_API_KEY = os.getenv("HF_TOKEN", "YOUR_HF_API_TOKEN")
-HF_API_URL = f"https://api-inference.huggingface.co/models/{MODEL_ID}"
+# Handles the common log grammar locally (see data/ex_workout_*.txt):
+#
+#   Prior notes:
+#   - free text about sleep, pain, ...      -> always left to the LLM (metrics)
+#   Military press                          -> exercise name line
+#   - 6x6 50kg                              -> sets x reps weight
+#   - Notes: felt good. Last set @8.5       -> exercise notes
+#
+# Exercise blocks that contain a line the grammar does not cover are left to
+# the LLM as a whole, so they keep their context.
+FAST_PARSE_MIN_CONFIDENCE = 0.5
+LBS_TO_KG = 0.45359237
+
+SET_NOTATION_RE = re.compile(
+    r"^(?P<sets>\d+)\s*[x×]\s*"
+    r"(?P<reps>(?:\d+|max|rpe\s*\d+(?:[.,]\d+)?)(?:\s*[-+/,]\s*(?:\d+|max))*)"
+    r"(?:(?:\s+|\s*@\s*)(?P<plus>\+)?\s*(?P<weight>\d+(?:[.,]\d+)?)\s*(?P<unit>kgs?|lbs?)?)?"
+    r"(?:\s+(?P<trailing_reps>\d+(?:\s*-\s*\d+)+))?\s*$",
+    re.IGNORECASE,
+)
+SET_RPE_RE = re.compile(r"^rpe\s*(?P<rpe>\d+(?:[.,]\d+)?)$", re.IGNORECASE)
+SET_REPS_SEPARATOR_RE = re.compile(r"\s*[-+/,]\s*")
+AMRAP_RE = re.compile(r"^amrap\b", re.IGNORECASE)
+# "AMRAP 40kg 7reps", "AMRAP 7 reps @ +10kg": loads and reps in any order
+AMRAP_SET_RE = re.compile(
+    r"^amrap(?P<items>(?:\s*@?\s*\+?\s*\d+(?:[.,]\d+)?\s*(?:kgs?|lbs?|reps?)?)*)\s*$", re.IGNORECASE
+)
+AMRAP_ITEM_RE = re.compile(r"(?P<plus>\+)?\s*(?P<value>\d+(?:[.,]\d+)?)\s*(?P<unit>kgs?|lbs?|reps?)?", re.IGNORECASE)
+NOTES_HEADER_RE = re.compile(r"^notes?\s*:\s*(?P<text>.*)$", re.IGNORECASE)
+PRIOR_NOTES_RE = re.compile(r"^prior\s+notes?\s*:?\s*$", re.IGNORECASE)
+BULLET_RE = re.compile(r"^\s*[-*•]\s*")
 
-def call_hf_inference_api(prompt: str, max_tokens=1024, temperature=0.1) -> str:
+POSITIVE_NOTE_WORDS = ("pain-free", "pain free", "no pain", "good", "great", "fine", "easy", "strong", "smooth", "solid", "better")
+NEGATIVE_NOTE_WORDS = ("pain", "hurt", "weak", "tired", "bad", "sore", "tough", "inflamed", "fail", "worse")
+
+@dataclass
+class LocalParseResult:
     """
-    Calls the Hugging Face Inference API for text generation.
-    Returns the model's generated text.
+    `blocks` are split_log_blocks() dicts with "structured_data" set to the
+    local parse, or None when the grammar did not cover the block.
     """
-    headers = {
-        "Authorization": f"Bearer {HF_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "inputs": prompt,
-        "parameters": {
-            "max_new_tokens": max_tokens,
-            "temperature": temperature,
-            "do_sample": False,
-            "return_full_text": False
+    blocks: list = field(default_factory=list)
+    confidence: float = 1.0
+
+    @property
+    def leftover_blocks(self) -> list:
+        return [block for block in self.blocks if block["structured_data"] is None]
+
+    @property
+    def structured_data(self) -> dict:
+        return merge_structured_data(*(b["structured_data"] for b in self.blocks if b["structured_data"] is not None))
+
+def unparsed_block_data(block: dict) -> dict:
+    """
+    Keeps a block the parser could not understand as a general note, so
+    nothing is lost when the LLM is not available.
+    """
+    return {"general_notes": [{"note_text": block["text"], "category": "unparsed", "sentiment": "neutral"}]}
+
+def guess_note_sentiment(note_text: str) -> str:
+    text = note_text.lower()
+    is_positive = any(word in text for word in POSITIVE_NOTE_WORDS)
+    # Drop positive phrases first so "pain-free" does not count as "pain"
+    for word in POSITIVE_NOTE_WORDS:
+        text = text.replace(word, "")
+    if any(word in text for word in NEGATIVE_NOTE_WORDS):
+        return "negative"
+    return "positive" if is_positive else "neutral"
+
+def parse_set_notation(text: str):
+    """
+    Parses "6x6 50kg", "6x4 +12.5kg", "3x12-10-9 9kg", "3xRPE 10 50kg 9-7-6", ...
+    Returns {"sets", "reps", "weight", "set_details"} or None. Reps are None
+    when they vary between sets, matching the LLM output format; the
+    per-set reps, load, RPE and AMRAP/bodyweight-plus flags are in
+    "set_details".
+    """
+    match = SET_NOTATION_RE.match(text.strip())
+    if not match:
+        return None
+    sets = int(match.group("sets"))
+    weight = None
+    if match.group("weight"):
+        weight = float(match.group("weight").replace(",", "."))
+        if (match.group("unit") or "").lower().startswith("lb"):
+            weight = round(weight * LBS_TO_KG, 2)
+
+    rpe = None
+    tokens = SET_REPS_SEPARATOR_RE.split(match.group("reps"))
+    rpe_match = SET_RPE_RE.match(tokens[0])
+    if rpe_match:
+        # "3xRPE 10 50kg 9-7-6": the target RPE comes first, the reps last
+        rpe = float(rpe_match.group("rpe").replace(",", "."))
+        tokens = SET_REPS_SEPARATOR_RE.split(match.group("trailing_reps") or "")
+    # A single value applies to every set; a short list repeats its last value
+    tokens = (tokens + tokens[-1:] * sets)[:min(sets, MAX_SETS_PER_EXERCISE)]
+    set_details = [
+        {
+            "reps": int(token) if token.isdigit() else None,
+            "load": weight,
+            "rpe": rpe,
+            "amrap": token.lower() == "max",
+            "bodyweight_plus": bool(match.group("plus")),
         }
+        for token in tokens
+    ]
+    distinct_reps = {detail["reps"] for detail in set_details}
+    return {
+        "sets": sets,
+        "reps": distinct_reps.pop() if len(distinct_reps) == 1 else None,
+        "weight": weight,
+        "set_details": set_details,
     }
-    try:
-        response = requests.post(HF_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        output = response.json()
-        if isinstance(output, list) and len(output) > 0:
-            return output[0].get("generated_text", "")
-        elif isinstance(output, dict) and "generated_text" in output:
-            return output["generated_text"]
+
+def parse_amrap_set(text: str):
+    """
+    Parses an AMRAP line such as "AMRAP 40kg 7reps" into one set detail with
+    the AMRAP flag, or None. A number without a unit is the reps.
+    """
+    match = AMRAP_SET_RE.match(text.strip())
+    if not match:
+        return None
+    detail = {"reps": None, "load": None, "rpe": None, "amrap": True, "bodyweight_plus": False}
+    for item in AMRAP_ITEM_RE.finditer(match.group("items")):
+        value = float(item.group("value").replace(",", "."))
+        unit = (item.group("unit") or "").lower()
+        if unit.startswith(("kg", "lb")):
+            detail["load"] = round(value * LBS_TO_KG, 2) if unit.startswith("lb") else value
+            detail["bodyweight_plus"] = bool(item.group("plus"))
+        elif detail["reps"] is None and value.is_integer():
+            detail["reps"] = int(value)
         else:
-            return ""
-    except Exception as e:
-        print("Error calling HF Inference API:", e)
-        return ""
+            return None
+    return detail
+
+def split_log_blocks(raw_text: str) -> list:
+    """
+    Splits a log into blocks: a "Prior notes:" block, then one block per
+    exercise name line with the bullet lines that follow it.
+    Each block is a dict with "kind", "header", "lines", "text" and "key".
+    The key hashes the normalized block text plus its occurrence number, so
+    it is stable across edits elsewhere in the log.
+    """
+    blocks = []
+    current = None
+    for line in raw_text.splitlines():
+        if not line.strip():
+            continue
+        stripped = line.strip()
+        if PRIOR_NOTES_RE.match(stripped):
+            current = {"kind": "prior_notes", "header": stripped, "lines": []}
+            blocks.append(current)
+        elif BULLET_RE.match(line) or line[:1].isspace() or NOTES_HEADER_RE.match(stripped):
+            if current is None:
+                current = {"kind": "text", "header": None, "lines": []}
+                blocks.append(current)
+            current["lines"].append(line)
+        else:
+            current = {"kind": "exercise", "header": stripped, "lines": []}
+            blocks.append(current)
+    occurrences = {}
+    for block in blocks:
+        block["text"] = block_to_text(block)
+        digest = hashlib.sha1(normalize_raw_text(block["text"]).encode("utf-8")).hexdigest()[:16]
+        occurrences[digest] = occurrences.get(digest, -1) + 1
+        block["key"] = f"{digest}:{occurrences[digest]}"
+    return blocks
+
+def block_to_text(block: dict) -> str:
+    header = [block["header"]] if block["header"] else []
+    return "\n".join(header + block["lines"])
+
+def parse_exercise_block(block: dict):
+    """
+    Returns the exercise dict for a block fully covered by the grammar, else None.
+    The sets of every set line ("2x5 60kg", "3x5 100kg", "AMRAP 80kg 7reps")
+    are kept in order in "set_details"; the summary "weight" is the heaviest load.
+    """
+    total_sets = 0
+    set_details = []
+    notes = []
+    in_notes = False
+    for line in block["lines"]:
+        content = BULLET_RE.sub("", line).strip()
+        notes_header = NOTES_HEADER_RE.match(content)
+        if notes_header:
+            in_notes = True
+            if notes_header.group("text"):
+                notes.append(notes_header.group("text"))
+            continue
+        set_data = parse_set_notation(content)
+        amrap_set = parse_amrap_set(content) if set_data is None else None
+        if set_data:
+            total_sets += set_data["sets"]
+            set_details.extend(set_data["set_details"])
+        elif amrap_set:
+            total_sets += 1
+            set_details.append(amrap_set)
+        elif in_notes or AMRAP_RE.match(content):
+            notes.append(content)
+        else:
+            return None
+    if not total_sets:
+        return None
+    set_details = set_details[:MAX_SETS_PER_EXERCISE]
+    distinct_reps = {detail["reps"] for detail in set_details}
+    loads = [detail["load"] for detail in set_details if detail["load"] is not None]
+    return {
+        "exercise_name": block["header"],
+        "sets": total_sets,
+        "reps": distinct_reps.pop() if len(distinct_reps) == 1 else None,
+        "weight": max(loads) if loads else None,
+        "set_details": set_details,
+        "notes": [{"note_text": note, "sentiment": guess_note_sentiment(note)} for note in notes],
+    }
+
+def parse_workout_locally(raw_text: str) -> LocalParseResult:
+    """
+    Rule-based parse of the common log grammar. Returns every block with its
+    structured data (None for blocks it did not understand) and the share of
+    non-empty lines it covered.
+    """
+    blocks = split_log_blocks(raw_text)
+    total_lines = 0
+    parsed_lines = 0
+    for block in blocks:
+        block_lines = len(block["lines"]) + (1 if block["header"] else 0)
+        total_lines += block_lines
+        exercise = parse_exercise_block(block) if block["kind"] == "exercise" else None
+        if exercise is not None:
+            block["structured_data"] = {"metrics": [], "exercises": [exercise], "general_notes": []}
+            parsed_lines += block_lines
+        else:
+            block["structured_data"] = None
+    confidence = parsed_lines / total_lines if total_lines else 1.0
+    return LocalParseResult(blocks, confidence)
 
 ###############################################################################
-# 2) Database Setup and Functions
+# 8) Edit / Delete Functions
 ###############################################################################
-def init_db():
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    
-    # Tables creation
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS workout_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_name TEXT,
-        date TEXT,
-        raw_text TEXT
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS exercises (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        exercise_name TEXT UNIQUE
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS exercise_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        workout_log_id INTEGER,
-        exercise_id INTEGER,
-        sets INTEGER,
-        reps INTEGER,
-        weight REAL,
-        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id),
-        FOREIGN KEY(exercise_id) REFERENCES exercises(id)
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS notes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        workout_log_id INTEGER,
-        exercise_id INTEGER,
-        note_text TEXT,
-        category TEXT,
-        sentiment TEXT,
-        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id),
-        FOREIGN KEY(exercise_id) REFERENCES exercises(id)
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS daily_metrics (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        workout_log_id INTEGER,
-        metric_name TEXT,
-        metric_value TEXT,
-        sentiment TEXT,
-        FOREIGN KEY(workout_log_id) REFERENCES workout_logs(id)
+def delete_workout_log(log_id: int):
+    """
+    Deletes all associated data (notes, metrics, exercises_data) for the workout,
+    then removes the workout_log entry itself, in one transaction.
+    """
+    current_repository().delete_log(log_id)
+
+def edit_workout_log(log_id: int, new_session_name: str, new_date_str: str, new_raw_text: str,
+                     on_exercise=None):
+    """
+    1) Split the old and new text into blocks and diff their keys.
+    2) Re-parse only the added/changed blocks.
+    3) In one transaction: delete the rows of removed blocks, update the
+       workout_log and insert the rows of added blocks.
+    Logs that were parsed as a whole, stored before block tracking, or never
+    parsed successfully are re-parsed in full instead.
+    Parsing happens first, so an InferenceError leaves the stored log untouched.
+    `on_exercise` is called with each exercise as it is extracted.
+    """
+    repository = current_repository()
+    stored_keys = repository.get_stored_block_keys(log_id)
+    new_local_result = parse_workout_locally(new_raw_text)
+    if (None in stored_keys or WHOLE_LOG_BLOCK_KEY in stored_keys
+            or repository.get_parse_status(log_id) != "parsed"
+            or needs_whole_log_parse(new_local_result)):
+        structured_data = categorize_and_extract_features(new_raw_text, on_exercise=on_exercise)
+        repository.replace_log(log_id, new_session_name, new_date_str, new_raw_text, structured_data)
+        return
+
+    old_keys = {block["key"] for block in split_log_blocks(repository.get_log_text(log_id))}
+    new_keys = {block["key"] for block in new_local_result.blocks}
+    added_keys = new_keys - old_keys
+    added_data = categorize_and_extract_features(new_raw_text, only_block_keys=added_keys, on_exercise=on_exercise)
+    repository.apply_log_edit(
+        log_id, new_session_name, new_date_str, new_raw_text, old_keys - new_keys, added_data
     )
-    ''')
+
+###############################################################################
+# 9) Core process function for new logs
+###############################################################################
+def process_workout_entry(session_name: str, date_str: str, raw_text: str):
+    """
+    Parses the log and stores it with all its structured data in one transaction.
+    Parsing happens before anything is written, so an InferenceError propagates
+    to the caller and nothing is saved.
+    """
+    structured_data = categorize_and_extract_features(raw_text)
+    logger.debug("Structured data: %s", structured_data)
+    log_id = current_repository().save_new_log(session_name, date_str, raw_text, structured_data)
     
-    conn.commit()
-    conn.close()
+    # If structured_data contains empty objects, issue a warning to the user
+    if not structured_data.get("metrics") and not structured_data.get("exercises") and not structured_data.get("general_notes"):
+        st.warning("The AI model could not extract any structured data from your workout notes.")
+    return log_id
 
-def insert_workout_log(session_name: str, date_str: str, raw_text: str):
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO workout_logs (session_name, date, raw_text)
-        VALUES (?, ?, ?)
-    ''', (session_name, date_str, raw_text))
-    conn.commit()
-    log_id = cursor.lastrowid
-    conn.close()
+###############################################################################
+# 10) Background Parse Queue
+###############################################################################
+# Submitting a log stores it together with a "pending" row in parse_jobs and
+# returns immediately. ParseWorker threads claim pending jobs, parse them and
+# write the results; failed parses are retried with exponential backoff until
+# PARSE_JOB_MAX_ATTEMPTS. Claiming is an atomic UPDATE, so several worker
+# threads or processes (see parse_worker.py) can share the same queue.
+PARSE_WORKER_CONCURRENCY = 2
+PARSE_JOB_MAX_ATTEMPTS = 5
+PARSE_JOB_RETRY_BASE_SECONDS = 10.0
+PARSE_JOB_STALE_SECONDS = 600.0
+PARSE_WORKER_POLL_SECONDS = 5.0
+# Jobs a worker may claim (parameters: now, now - PARSE_JOB_STALE_SECONDS)
+DUE_PARSE_JOBS_WHERE = '''
+    (j.status = 'pending' AND j.next_attempt_at <= ?) OR (j.status = 'running' AND j.updated_at < ?)
+'''
+
+def submit_workout_entry(session_name: str, date_str: str, raw_text: str) -> int:
+    """
+    Stores the log and queues it for parsing, without waiting for the LLM.
+    Logs the local fast-path parser fully understands are stored parsed right away.
+    """
+    local_result = parse_workout_locally(raw_text)
+    repository = current_repository()
+    if OFFLINE_MODE or not local_result.leftover_blocks:
+        return repository.save_new_log(session_name, date_str, raw_text, categorize_and_extract_features(raw_text))
+    with repository.unit_of_work() as cursor:
+        log_id = repository.insert_log(cursor, session_name, date_str, raw_text)
+        cursor.execute('''
+            INSERT INTO parse_jobs (workout_log_id, status, updated_at)
+            VALUES (?, 'pending', ?)
+        ''', (log_id, time.time()))
+    wake_parse_workers()
     return log_id
 
-def get_exercise_id(exercise_name: str):
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM exercises WHERE exercise_name = ?', (exercise_name,))
-    result = cursor.fetchone()
-    if not result:
-        cursor.execute('INSERT INTO exercises (exercise_name) VALUES (?)', (exercise_name,))
-        conn.commit()
-        exercise_id = cursor.lastrowid
-    else:
-        exercise_id = result[0]
-    conn.close()
-    return exercise_id
+def retry_parse_job(log_id: int):
+    with current_repository().unit_of_work() as cursor:
+        cursor.execute('''
+            UPDATE parse_jobs
+            SET status = 'pending', attempts = 0, last_error = NULL, next_attempt_at = 0, updated_at = ?
+            WHERE workout_log_id = ?
+        ''', (time.time(), log_id))
+    wake_parse_workers()
 
-def insert_exercise_data(workout_log_id: int, exercise_id: int, sets: int, reps: int, weight: float):
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO exercise_data (workout_log_id, exercise_id, sets, reps, weight)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (workout_log_id, exercise_id, sets, reps, weight))
-    conn.commit()
-    conn.close()
-
-def insert_note(workout_log_id: int, exercise_id: int, note_text: str, category: str, sentiment: str):
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO notes (workout_log_id, exercise_id, note_text, category, sentiment)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (workout_log_id, exercise_id if exercise_id else None, note_text, category, sentiment))
-    conn.commit()
-    conn.close()
-
-def insert_daily_metric(workout_log_id: int, metric_name: str, metric_value: str, sentiment: str):
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO daily_metrics (workout_log_id, metric_name, metric_value, sentiment)
-        VALUES (?, ?, ?, ?)
-    ''', (workout_log_id, metric_name, metric_value, sentiment))
-    conn.commit()
-    conn.close()
+class ParseWorker:
+    """
+    Runs `concurrency` daemon threads that drain the parse_jobs queue.
+    """
 
-###############################################################################
-# 3) Prompt Building & Parsing Logic
-###############################################################################
-def build_system_prompt_with_examples() -> str:
-    example_input_1 = """
-Prior notes:
-- Pretty tired after three nights of bad sleep.
-Pull ups
-- 6x4 15kg
-Inclined Bench press
-- 3xRPE 10 50kg 9-7-6
-- AMRAP 40kg 7reps
-- Notes: left shoulder felt fine
-"""
-    example_output_1 = {
-        "metrics": [
-            {"metric_name": "SleepQuality", "metric_value": "poor (3 nights bad sleep)", "sentiment": "negative"}
-        ],
-        "exercises": [
-            {
-                "exercise_name": "Pull ups",
-                "sets": 6,
-                "reps": 4,
-                "weight": 15.0,
-                "notes": []
-            },
-            {
-                "exercise_name": "Inclined Bench press",
-                "sets": 3,
-                "reps": None,
-                "weight": 50.0,
-                "notes": [
-                    {"note_text": "AMRAP 40kg for 7 reps", "sentiment": "neutral"},
-                    {"note_text": "left shoulder felt fine", "sentiment": "positive"}
-                ]
-            }
-        ],
-        "general_notes": []
-    }
+    def __init__(self, repository: WorkoutRepository, concurrency: int = PARSE_WORKER_CONCURRENCY):
+        self.repository = repository
+        self.concurrency = concurrency
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
 
-    example_input_2 = """
-Prior notes:
-- Body state: left shoulder less inflamed, left trap pain
-Military press
-- 6x6 50kg
-- Notes: felt good. Last set @8.5
-Pull ups
-- 6x4 +12.5kg
-"""
-    example_output_2 = {
-        "metrics": [
-            {"metric_name": "ShoulderInflammation", "metric_value": "less inflamed", "sentiment": "improving"},
-            {"metric_name": "TrapPain", "metric_value": "present", "sentiment": "neutral"}
-        ],
-        "exercises": [
-            {
-                "exercise_name": "Military press",
-                "sets": 6,
-                "reps": 6,
-                "weight": 50.0,
-                "notes": [
-                    {"note_text": "felt good, last set @8.5", "sentiment": "positive"}
-                ]
-            },
-            {
-                "exercise_name": "Pull ups",
-                "sets": 6,
-                "reps": 4,
-                "weight": 12.5,
-                "notes": []
-            }
-        ],
-        "general_notes": []
-    }
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"parse-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
 
-    system_str = f"""
-You are a helpful assistant that extracts structured workout information from text logs.
-We want valid JSON with keys: "metrics", "exercises", "general_notes".
-- "metrics": daily metrics (sleep, pain, energy, etc.).
-- "exercises": parse sets, reps, weight, plus any notes relevant to that exercise.
-- "general_notes": additional remarks not tied to a specific exercise.
-
-## EXAMPLE 1
-Input:
-{example_input_1}
-Output (JSON):
-{json.dumps(example_output_1, indent=2)}
-
-## EXAMPLE 2
-Input:
-{example_input_2}
-Output (JSON):
-{json.dumps(example_output_2, indent=2)}
-
-Now parse the following text. Respond with valid JSON only. DO NOT include the input text or the examples above in your response.
-"""
-    return system_str
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.process_next_job():
+                self._wake.wait(PARSE_WORKER_POLL_SECONDS)
+                self._wake.clear()
+
+    def process_next_job(self) -> bool:
+        """
+        Claims and processes one job. Returns False when none was due.
+        """
+        job = self.claim_next_job()
+        if job is None:
+            return False
+        self.process_job(*job)
+        return True
+
+    def claim_next_job(self):
+        """
+        Atomically moves the oldest due pending job to "running".
+        A job "running" for longer than PARSE_JOB_STALE_SECONDS was left by
+        a worker that died, and is claimed again like a pending one.
+        Returns (log_id, raw_text, attempts) or None.
+        """
+        now = time.time()
+        stale_before = now - PARSE_JOB_STALE_SECONDS
+        # Look for work without taking the write lock; idle polls stay read-only
+        rows = self.repository.query(f'''
+            SELECT j.workout_log_id, w.raw_text, j.attempts, j.status
+            FROM parse_jobs j
+            JOIN workout_logs w ON w.id = j.workout_log_id
+            WHERE {DUE_PARSE_JOBS_WHERE}
+            ORDER BY j.next_attempt_at, j.workout_log_id
+            LIMIT 1
+        ''', (now, stale_before))
+        if not rows:
+            return None
+        log_id, raw_text, attempts, status = rows[0]
+        with self.repository.unit_of_work() as cursor:
+            cursor.execute('''
+                UPDATE parse_jobs SET status = 'running', updated_at = ?
+                WHERE workout_log_id = ? AND (status = 'pending' OR (status = 'running' AND updated_at < ?))
+            ''', (time.time(), log_id, stale_before))
+            if cursor.rowcount != 1:
+                return None
+        if status == "running":
+            self.repository.metrics.inc("gainsgpt_parse_jobs_total", outcome="reclaimed")
+        return log_id, raw_text, attempts
+
+    def process_job(self, log_id: int, raw_text: str, attempts: int):
+        progress = []
 
-def categorize_and_extract_features(raw_text: str) -> dict:
+        def on_exercise(exercise):
+            progress.append(exercise)
+            self.repository.record_parse_progress(log_id, progress)
+
+        metrics = self.repository.metrics
+        try:
+            with metrics.span("parse_job"):
+                structured_data = categorize_and_extract_features(raw_text, on_exercise=on_exercise)
+        except Exception as e:
+            self.record_failure(log_id, attempts + 1, e)
+            return
+        finally:
+            self.repository.clear_parse_progress(log_id)
+        extracted = any(structured_data.get(k) for k in ("metrics", "exercises", "general_notes"))
+        with self.repository.unit_of_work("parse_job") as cursor:
+            # Drop the result if the log was edited or deleted while we parsed
+            cursor.execute('''
+                SELECT w.raw_text FROM parse_jobs j
+                JOIN workout_logs w ON w.id = j.workout_log_id
+                WHERE j.workout_log_id = ? AND j.status = 'running'
+            ''', (log_id,))
+            row = cursor.fetchone()
+            if row is None or row[0] != raw_text:
+                metrics.inc("gainsgpt_parse_jobs_total", outcome="discarded")
+                return
+            metrics.inc("gainsgpt_parse_jobs_total", outcome="parsed")
+            self.repository.delete_structured_data(cursor, log_id)
+            self.repository.insert_structured_data(cursor, log_id, structured_data)
+            cursor.execute('''
+                UPDATE parse_jobs SET status = 'parsed', attempts = ?, last_error = ?, updated_at = ?
+                WHERE workout_log_id = ?
+            ''', (attempts + 1, None if extracted else "No structured data could be extracted.", time.time(), log_id))
+
+    def record_failure(self, log_id: int, attempts: int, error: Exception):
+        logger.warning("Parse of log %s failed (attempt %s)", log_id, attempts, exc_info=error)
+        if attempts >= PARSE_JOB_MAX_ATTEMPTS:
+            status, next_attempt_at = "failed", 0
+        else:
+            status = "pending"
+            next_attempt_at = time.time() + PARSE_JOB_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        self.repository.metrics.inc(
+            "gainsgpt_parse_jobs_total", outcome="failed" if status == "failed" else "retry_scheduled"
+        )
+        with self.repository.unit_of_work("parse_job_failure") as cursor:
+            cursor.execute('''
+                UPDATE parse_jobs
+                SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ?
+                WHERE workout_log_id = ? AND status = 'running'
+            ''', (status, attempts, str(error), next_attempt_at, time.time(), log_id))
+
+class ShardParseWorker(ParseWorker):
     """
-    Build the final prompt, call the HF Inference API, parse out JSON, return structured data.
+    Parse workers for several databases: `paths`, or every user database in
+    SHARD_DIR (re-listed on each poll) when None. Each poll checks the
+    databases in turn for a due job with a cheap query, and leases a
+    repository from `registry` only to claim and parse it, so idle databases
+    can still be closed by the registry.
     """
-    system_prompt = build_system_prompt_with_examples()
-    prompt_text = f"""{system_prompt}\nNEW INPUT:\n\"\"\"{raw_text}\"\"\"\n"""
 
-    generated_text = call_hf_inference_api(prompt_text)
-    
-    # DEBUG
-    print("Generated Text:", generated_text)
-    
-    # Attempt to extract JSON from the text
-    start_idx = generated_text.find("{")
-    end_idx = generated_text.rfind("}")
-    if start_idx == -1 or end_idx == -1:
-        return {
-            "metrics": [],
-            "exercises": [],
-            "general_notes": []
-        }
+    def __init__(self, registry: ShardRegistry, paths: list = None, shared_catalog: bool = True,
+                 concurrency: int = PARSE_WORKER_CONCURRENCY):
+        super().__init__(None, concurrency)
+        self.registry = registry
+        self.paths = paths
+        self.shared_catalog = shared_catalog
+        self._rotation = 0
+
+    def process_next_job(self) -> bool:
+        paths = list_shard_paths() if self.paths is None else self.paths
+        # Start one database further on each poll, so a busy user cannot starve the others
+        self._rotation += 1
+        start = self._rotation % len(paths) if paths else 0
+        for path in paths[start:] + paths[:start]:
+            if not has_due_parse_job(path):
+                continue
+            with self.registry.lease(path, self.shared_catalog) as repository:
+                if ParseWorker(repository).process_next_job():
+                    return True
+        return False
 
-    json_str = generated_text[start_idx:end_idx+1]
+def has_due_parse_job(path: str) -> bool:
+    """
+    Whether the database at `path` has a job a worker may claim now. Uses a
+    short-lived connection, so checking does not keep the database open.
+    """
+    now = time.time()
     try:
-        structured_data = json.loads(json_str)
-    except:
-        structured_data = {
-            "metrics": [],
-            "exercises": [],
-            "general_notes": []
-        }
-    return structured_data
+        conn = sqlite3.connect(path, timeout=DB_POOL_TIMEOUT)
+        try:
+            row = conn.execute(
+                f"SELECT 1 FROM parse_jobs j WHERE {DUE_PARSE_JOBS_WHERE} LIMIT 1",
+                (now, now - PARSE_JOB_STALE_SECONDS),
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.OperationalError:
+        # Not migrated yet: it has no parse_jobs table
+        return False
+    return row is not None
+
+@st.cache_resource
+def get_parse_worker() -> ParseWorker:
+    """
+    One set of worker threads per process, shared by all Streamlit sessions.
+    In multi-user mode they serve every user's database, whether or not the
+    user has a session open.
+    """
+    if SHARD_DIR:
+        worker = ShardParseWorker(get_shard_registry())
+    else:
+        worker = ShardParseWorker(get_shard_registry(), [DB_PATH], shared_catalog=False)
+    worker.start()
+    return worker
+
+def wake_parse_workers():
+    get_parse_worker().wake()
 
 ###############################################################################
-# 4) Edit / Delete Functions
+# 11) Streamlit App with Edit/Delete in the "Log" section
 ###############################################################################
-def delete_workout_log(log_id: int):
+LOG_PAGE_SIZE = 20
+
+def render_existing_logs():
     """
-    Deletes all associated data (notes, metrics, exercises_data) for the workout,
-    then removes the workout_log entry itself.
+    Lists logs one page at a time (keyset pagination on id) with date-range and
+    session-name filters. A log's raw text is only fetched once it is opened.
     """
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
+    st.subheader("Existing Logs")
+    col_from, col_to, col_name = st.columns(3)
+    date_from = col_from.date_input("From", value=None, key="logs_date_from")
+    date_to = col_to.date_input("To", value=None, key="logs_date_to")
+    name_filter = col_name.text_input("Session name contains", key="logs_name_filter")
     
-    # Remove data from child tables
-    cursor.execute("DELETE FROM daily_metrics WHERE workout_log_id = ?", (log_id,))
-    cursor.execute("DELETE FROM exercise_data WHERE workout_log_id = ?", (log_id,))
-    cursor.execute("DELETE FROM notes WHERE workout_log_id = ?", (log_id,))
+    # Filters changed: start again from the newest log
+    filters = (date_from, date_to, name_filter)
+    if st.session_state.get("logs_filters") != filters:
+        st.session_state["logs_filters"] = filters
+        st.session_state["logs_page_cursors"] = [None]
+    cursors = st.session_state["logs_page_cursors"]
     
-    # Finally remove the workout_log
-    cursor.execute("DELETE FROM workout_logs WHERE id = ?", (log_id,))
+    logs, has_more = current_repository().list_logs(
+        before_id=cursors[-1],
+        date_from=int(date_from.strftime("%Y%m%d")) if date_from else None,
+        date_to=int(date_to.strftime("%Y%m%d")) if date_to else None,
+        session_name_filter=name_filter,
+        limit=LOG_PAGE_SIZE,
+    )
+    if not logs:
+        st.write("No logs found.")
+    if any(status in ("pending", "running") for _, _, _, status, _ in logs):
+        col_info, col_refresh = st.columns([3, 1])
+        col_info.caption("Some logs are still being parsed in the background.")
+        if col_refresh.button("Refresh"):
+            st.rerun()
+    for log_id, s_name, dt, status, parse_error in logs:
+        render_log_entry(log_id, s_name, dt, status, parse_error)
     
-    conn.commit()
-    conn.close()
+    col_prev, col_page, col_next = st.columns(3)
+    if col_prev.button("Previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    col_page.caption(f"Page {len(cursors)}")
+    if col_next.button("Next", disabled=not has_more):
+        cursors.append(logs[-1][0])
+        st.rerun()
+
+SEARCH_RESULTS_LIMIT = 20
 
-def edit_workout_log(log_id: int, new_session_name: str, new_date_str: str, new_raw_text: str):
+def render_search():
     """
-    1) Remove old child data for this workout (metrics, exercise_data, notes).
-    2) Update the workout_log with new data.
-    3) Re-parse the raw text with the LLM to generate new structured data.
-    4) Insert newly parsed data into the child tables.
+    Full-text search over logs and notes, best matches first.
     """
-    conn = sqlite3.connect('workout_app.db')
-    cursor = conn.cursor()
-    
-    # Delete old references
-    cursor.execute("DELETE FROM daily_metrics WHERE workout_log_id = ?", (log_id,))
-    cursor.execute("DELETE FROM exercise_data WHERE workout_log_id = ?", (log_id,))
-    cursor.execute("DELETE FROM notes WHERE workout_log_id = ?", (log_id,))
-    
-    # Update the workout_logs entry
-    cursor.execute("""
-        UPDATE workout_logs
-        SET session_name = ?, date = ?, raw_text = ?
-        WHERE id = ?
-    """, (new_session_name, new_date_str, new_raw_text, log_id))
-    conn.commit()
-    conn.close()
-
-    # Re-run parsing for the updated text
-    structured_data = categorize_and_extract_features(new_raw_text)
-    
-    # Insert newly parsed data
-    # (We do it the same way as in process_workout_entry, but referencing our existing log_id)
-    for metric in structured_data.get("metrics", []):
-        metric_name = metric.get("metric_name", "")
-        metric_value = metric.get("metric_value", "")
-        sentiment = metric.get("sentiment", "")
-        insert_daily_metric(log_id, metric_name, metric_value, sentiment)
-    
-    for exercise in structured_data.get("exercises", []):
-        exercise_name = exercise.get("exercise_name", "")
-        sets_ = exercise.get("sets", 0)
-        reps_ = exercise.get("reps", 0)
-        weight_ = exercise.get("weight", 0.0)
-        
-        exercise_id = get_exercise_id(exercise_name)
-        insert_exercise_data(log_id, exercise_id, sets_, reps_, weight_)
-        
-        for note in exercise.get("notes", []):
-            note_text = note.get("note_text", "")
-            note_sentiment = note.get("sentiment", "")
-            insert_note(log_id, exercise_id, note_text, "exercise_note", note_sentiment)
-    
-    for note in structured_data.get("general_notes", []):
-        note_text = note.get("note_text", "")
-        category = note.get("category", "")
-        sentiment = note.get("sentiment", "")
-        insert_note(log_id, None, note_text, category, sentiment)
+    st.subheader("Search")
+    col_text, col_from, col_to = st.columns([2, 1, 1])
+    text = col_text.text_input("Search logs and notes", key="search_text",
+                               placeholder='e.g. weak grip, "left shoulder"')
+    date_from = col_from.date_input("From", value=None, key="search_date_from")
+    date_to = col_to.date_input("To", value=None, key="search_date_to")
+    if not text.strip():
+        return
+    results = current_repository().search_logs(
+        text,
+        date_from=int(date_from.strftime("%Y%m%d")) if date_from else None,
+        date_to=int(date_to.strftime("%Y%m%d")) if date_to else None,
+        limit=SEARCH_RESULTS_LIMIT,
+    )
+    if not results:
+        st.write("No matches.")
+    for log_id, s_name, dt, snippet in results:
+        st.markdown(f"**{s_name}** ({dt}, log ID {log_id})  \n{snippet}")
 
-###############################################################################
-# 5) Core process function for new logs
-###############################################################################
-def process_workout_entry(session_name: str, date_str: str, raw_text: str):
-    log_id = insert_workout_log(session_name, date_str, raw_text)
-    structured_data = categorize_and_extract_features(raw_text)
-    
-    # DEBUG
-    print("Structured Data:", structured_data)
+PARSE_STATUS_LABELS = {"pending": "⏳ pending", "running": "⚙️ parsing", "failed": "❌ parse failed"}
+
+def render_log_entry(log_id: int, s_name: str, dt: str, status: str = "parsed", parse_error: str = None):
+    label = f"Log ID: {log_id} - {s_name} ({dt})"
+    if status in PARSE_STATUS_LABELS:
+        label += f" [{PARSE_STATUS_LABELS[status]}]"
+    if not st.toggle(label, key=f"open_{log_id}"):
+        return
+    text = current_repository().get_log_text(log_id)
+    st.write(text)
+    if status in ("pending", "running"):
+        render_extracted_exercises(current_repository().get_parse_progress(log_id))
+    if status == "failed":
+        st.error(f"Parsing failed: {parse_error}")
+        if st.button("Retry parsing", key=f"retry_{log_id}"):
+            retry_parse_job(log_id)
+            st.rerun()
+    elif parse_error:
+        st.warning(parse_error)
     
-    # If structured_data contains empty objects, issue a warning to the user
-    if not structured_data.get("metrics") and not structured_data.get("exercises") and not structured_data.get("general_notes"):
-        st.warning("The AI model could not extract any structured data from your workout notes.")
+    # EDIT Section
+    if st.button(f"Edit Log {log_id}", key=f"edit_{log_id}"):
+        st.session_state[f"editing_{log_id}"] = True
+    delete_button = st.button(f"Delete Log {log_id}", key=f"delete_{log_id}")
+    if st.session_state.get(f"editing_{log_id}"):
+        st.info("Edit the workout below, then press 'Update'")
+        new_session_name = st.text_input("Session Name", value=s_name, key=f"ses_{log_id}")
+        new_date_val = st.date_input("Date", value=datetime.strptime(dt, "%Y-%m-%d"), key=f"dat_{log_id}")
+        new_date_str = new_date_val.strftime("%Y-%m-%d")
+        new_raw_text = st.text_area("Workout Notes", value=text, key=f"raw_{log_id}")
+        if st.button("Update", key=f"update_{log_id}"):
+            progress_placeholder = st.empty()
+            extracted = []
+
+            def on_exercise(exercise):
+                extracted.append(exercise)
+                with progress_placeholder.container():
+                    render_extracted_exercises(extracted)
+
+            try:
+                with st.spinner("Re-parsing and updating..."):
+                    edit_workout_log(log_id, new_session_name, new_date_str, new_raw_text, on_exercise)
+            except InferenceError as e:
+                st.error(f"The log was not updated: the AI model could not be reached ({e}).")
+            else:
+                st.session_state[f"editing_{log_id}"] = False
+                st.success("Workout updated successfully!")
+                st.rerun()  # Refresh the page to show updated data
+    # Deletion logic without st.confirm_dialog
+    if delete_button:
+        with st.spinner(f"Deleting log {log_id}..."):
+            delete_workout_log(log_id)
+        st.warning(f"Log {log_id} has been deleted.")
+        st.rerun()  # Refresh the page
+
+def render_extracted_exercises(exercises: list):
+    """
+    Exercises extracted so far by a parse that is still running.
+    """
+    if not exercises:
         return
+    st.write("**Extracted so far**")
+    for exercise in exercises:
+        st.write(
+            f"- {exercise.get('exercise_name', '')}: {exercise.get('sets')} sets x "
+            f"{exercise.get('reps')} reps @ {exercise.get('weight')} kg"
+        )
 
-    # Store metrics
-    for metric in structured_data.get("metrics", []):
-        metric_name = metric.get("metric_name", "")
-        metric_value = metric.get("metric_value", "")
-        sentiment = metric.get("sentiment", "")
-        insert_daily_metric(log_id, metric_name, metric_value, sentiment)
+def render_exercise_trends(repository: WorkoutRepository, exercise_id: int):
+    """
+    Trend charts from the precomputed exercise_daily_stats table.
+    """
+    stats_rows = repository.cached_query(EXERCISE_STATS_QUERY, (exercise_id,), name="exercise_stats")
+    if not stats_rows:
+        return
+    stats = pd.DataFrame(stats_rows, columns=[
+        "date_num", "total_sets", "total_reps", "tonnage", "best_weight",
+        "best_set_reps", "best_set_weight", "e1rm_epley", "e1rm_brzycki", "pr_e1rm", "is_pr",
+    ])
+    stats.index = pd.to_datetime(stats["date_num"].astype(str), format="%Y%m%d")
     
-    # Store exercises
-    for exercise in structured_data.get("exercises", []):
-        exercise_name = exercise.get("exercise_name", "")
-        sets_ = exercise.get("sets", 0)
-        reps_ = exercise.get("reps", 0)
-        weight_ = exercise.get("weight", 0.0)
-        
-        exercise_id = get_exercise_id(exercise_name)
-        insert_exercise_data(log_id, exercise_id, sets_, reps_, weight_)
-        
-        for note in exercise.get("notes", []):
-            note_text = note.get("note_text", "")
-            note_sentiment = note.get("sentiment", "")
-            insert_note(log_id, exercise_id, note_text, "exercise_note", note_sentiment)
+    st.write("**Estimated 1RM**")
+    st.line_chart(stats[["e1rm_epley", "e1rm_brzycki", "pr_e1rm"]].rename(columns={
+        "e1rm_epley": "Epley", "e1rm_brzycki": "Brzycki", "pr_e1rm": "Best so far",
+    }))
+    st.write("**Volume**")
+    st.bar_chart(stats[["tonnage"]].rename(columns={"tonnage": "Tonnage (kg)"}))
     
-    # Store general notes
-    for note in structured_data.get("general_notes", []):
-        note_text = note.get("note_text", "")
-        category = note.get("category", "")
-        sentiment = note.get("sentiment", "")
-        insert_note(log_id, None, note_text, category, sentiment)
+    prs = stats[stats["is_pr"] == 1]
+    if not prs.empty:
+        st.write("**Personal records (e1RM)**")
+        for day, row in prs.iloc[::-1].iterrows():
+            st.write(
+                f"- **Date**: {day.strftime('%Y-%m-%d')}, e1RM: {row['e1rm_epley']:.1f} "
+                f"({row['best_set_reps']:.0f} x {row['best_set_weight']:g})"
+            )
+    st.write("---")
+
+def render_metric_trends(repository: WorkoutRepository):
+    """
+    Charts of the numeric metric series and their correlation with training volume.
+    """
+    series_rows = repository.cached_query(METRIC_SERIES_QUERY, name="metric_series")
+    if not series_rows:
+        return
+    series = pd.DataFrame(series_rows, columns=["metric", "label", "unit", "date_num", "value"])
+    labels = {
+        metric: f"{label} ({unit})" if unit else label
+        for metric, label, unit in series[["metric", "label", "unit"]].drop_duplicates("metric").itertuples(index=False)
+    }
+    by_days = series.groupby("metric", sort=False).size().sort_values(ascending=False)
+    selected = st.multiselect(
+        "Metrics", list(by_days.index), default=list(by_days.index[:3]), format_func=labels.get
+    )
+    if not selected:
+        return
+    chart = series[series["metric"].isin(selected)].pivot(index="date_num", columns="metric", values="value")
+    chart.index = pd.to_datetime(chart.index.astype(str), format="%Y%m%d")
+    st.line_chart(chart.rename(columns=labels))
+
+    volume_rows = repository.cached_query(DAILY_VOLUME_QUERY, name="daily_volume")
+    if not volume_rows:
+        return
+    volume = pd.DataFrame(volume_rows, columns=["date_num", "tonnage", "total_sets"])
+    correlations = metric_volume_correlations(series[series["metric"].isin(selected)], volume)
+    st.write("**Correlation with training volume** (Pearson r against tonnage)")
+    st.dataframe(
+        correlations.assign(metric=correlations["metric"].map(labels)).rename(columns={
+            "metric": "Metric", "days": "Days", "same_day": "Same day", "previous_session": "Previous session",
+        }).round(2),
+        hide_index=True,
+    )
+    paired = series[series["metric"] == selected[0]].merge(volume, on="date_num")
+    if not paired.empty:
+        st.scatter_chart(paired, x="tonnage", y="value", x_label="Tonnage (kg)", y_label=labels[selected[0]])
+    st.write("---")
+
+def render_admin_page():
+    """
+    Spans and counters collected in this process since it started.
+    """
+    st.subheader("Instrumentation")
+    server = get_metrics_server()
+    if server is not None:
+        st.caption(f"Prometheus endpoint: http://{METRICS_HOST}:{server.server_port}/metrics")
+    snapshot = get_metrics().snapshot()
+    if not snapshot["spans"] and not snapshot["counters"]:
+        st.write("Nothing recorded yet.")
+        return
+    if snapshot["spans"]:
+        st.write("**Spans** (quantiles estimated from histogram buckets)")
+        spans = pd.DataFrame(snapshot["spans"]).sort_values("total_s", ascending=False)
+        st.dataframe(spans.round(3), hide_index=True)
+    if snapshot["counters"]:
+        st.write("**Counters**")
+        st.dataframe(pd.DataFrame(snapshot["counters"]), hide_index=True)
+    if st.button("Refresh"):
+        st.rerun()
+
+def render_exercise_aliases():
+    """
+    Merge spellings of the same exercise, or split a wrong match back out.
+    """
+    st.subheader("Exercise Aliases")
+    repository = current_repository()
+    suggestions = repository.cached_query('''
+        SELECT s.alias_key, a.alias_name, e.exercise_name
+        FROM exercise_alias_suggestions s
+        JOIN exercise_aliases a ON a.alias_key = s.alias_key
+        JOIN exercises e ON s.exercise_id = e.id
+        ORDER BY a.alias_name
+    ''', name="alias_suggestions")
+    for alias_key, alias_name, exercise_name in suggestions:
+        col1, col2, col3 = st.columns([4, 1, 1])
+        col1.write(f"Is **{alias_name}** the same exercise as **{exercise_name}**?")
+        if col2.button("Merge", key=f"accept_{alias_key}"):
+            repository.accept_alias_suggestion(alias_key)
+            st.rerun()
+        if col3.button("Dismiss", key=f"dismiss_{alias_key}"):
+            repository.dismiss_alias_suggestion(alias_key)
+            st.rerun()
+
+    exercises = repository.cached_query(
+        "SELECT id, exercise_name FROM exercises ORDER BY exercise_name", name="exercise_list"
+    )
+    if len(exercises) >= 2:
+        exercise_names = dict(exercises)
+        col1, col2 = st.columns(2)
+        source_id = col1.selectbox("Merge", list(exercise_names), format_func=exercise_names.get)
+        target_id = col2.selectbox("into", list(exercise_names), format_func=exercise_names.get, index=1)
+        if st.button("Merge exercises"):
+            try:
+                repository.merge_exercises(source_id, target_id)
+                st.success(f"Merged {exercise_names[source_id]} into {exercise_names[target_id]}.")
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
+    aliases = repository.cached_query('''
+        SELECT a.alias_key, a.alias_name, e.exercise_name, a.source
+        FROM exercise_aliases a
+        JOIN exercises e ON a.exercise_id = e.id
+        WHERE a.source != 'name'
+        ORDER BY e.exercise_name, a.alias_name
+    ''', name="exercise_aliases")
+    if not aliases:
+        st.write("No merged or fuzzy-matched names.")
+        return
+    st.dataframe(
+        pd.DataFrame(aliases, columns=["alias_key", "Logged as", "Exercise", "Matched by"]).drop(columns="alias_key"),
+        hide_index=True,
+    )
+    alias_labels = {alias_key: f"{alias_name} ({exercise_name})" for alias_key, alias_name, exercise_name, _ in aliases}
+    alias_key = st.selectbox("Split", list(alias_labels), format_func=alias_labels.get)
+    if st.button("Split into its own exercise"):
+        try:
+            repository.split_exercise_alias(alias_key)
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
 
-###############################################################################
-# 6) Streamlit App with Edit/Delete in the "Log" section
-###############################################################################
 def main():
     st.title("GainsGPT")
     st.write("A workout log and exercise tracker powered by AI.")
     
+    # In multi-user mode every page reads the signed-in user's own database
+    if SHARD_DIR and not st.user.get("is_logged_in"):
+        st.button("Log in", on_click=st.login)
+        st.stop()
+    if SHARD_DIR:
+        st.sidebar.button("Log out", on_click=st.logout)
+    
     init_db()
+    get_parse_worker()
+    get_metrics_server()
     
-    page = st.sidebar.selectbox("Navigation", ["Log", "Exercises", "Tracking"])
+    page = st.sidebar.selectbox("Navigation", ["Log", "Exercises", "Tracking", "Admin"])
+    
+    cache_stats = get_parse_cache().stats()
+    st.sidebar.caption(
+        f"Parse cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries"
+    )
     
     if page == "Log":
         st.subheader("Add a New Workout Log")
@@ -439,61 +4123,20 @@ def main():
         
         if st.button("Submit Workout Log"):
             if session_name and raw_text:
-                with st.spinner("Parsing your log via Hugging Face Inference API..."):
-                    process_workout_entry(session_name, date_str, raw_text)
-                st.success("Workout log submitted successfully!")
+                submit_workout_entry(session_name, date_str, raw_text)
+                st.success("Workout log submitted! It will be parsed in the background.")
             else:
                 st.warning("Please provide both a session name and some notes.")
         
-        # Existing Logs
-        st.subheader("Existing Logs")
-        conn = sqlite3.connect('workout_app.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, session_name, date, raw_text FROM workout_logs ORDER BY id DESC")
-        logs = cursor.fetchall()
-        for log in logs:
-           log_id, s_name, dt, text = log
-           with st.expander(f"Log ID: {log_id} - {s_name} ({dt})"):
-              st.write(text)
-              
-              # EDIT Section
-              edit_button = st.button(f"Edit Log {log_id}", key=f"edit_{log_id}")
-              delete_button = st.button(f"Delete Log {log_id}", key=f"delete_{log_id}")
-              if edit_button:
-                    st.info("Edit the workout below, then press 'Update'")
-                    new_session_name = st.text_input("Session Name", value=s_name, key=f"ses_{log_id}")
-                    new_date_val = st.date_input("Date", value=datetime.strptime(dt, "%Y-%m-%d"), key=f"dat_{log_id}")
-                    new_date_str = new_date_val.strftime("%Y-%m-%d")
-                    new_raw_text = st.text_area("Workout Notes", value=text, key=f"raw_{log_id}")
-                    if st.button("Update", key=f"update_{log_id}"):
-                       with st.spinner("Re-parsing and updating..."):
-                          edit_workout_log(log_id, new_session_name, new_date_str, new_raw_text)
-                       st.success("Workout updated successfully!")
-                       st.rerun()  # Refresh the page to show updated data
-              # Deletion logic without st.confirm_dialog
-              if delete_button:
-                    # st.warning(f"Are you sure you want to delete log {log_id}? This action cannot be undone.")
-                    # if f"confirm_delete_{log_id}" not in st.session_state:
-                    #     st.session_state[f"confirm_delete_{log_id}"] = False
-
-                    # if st.button(f"Yes, delete log {log_id}", key=f"confirm_delete_{log_id}"):
-                    #     st.session_state[f"confirm_delete_{log_id}"] = True
-
-                    # if st.session_state[f"confirm_delete_{log_id}"]:
-                    with st.spinner(f"Deleting log {log_id}..."):
-                        delete_workout_log(log_id)
-                    st.warning(f"Log {log_id} has been deleted.")
-                    # st.session_state[f"confirm_delete_{log_id}"] = False
-                    st.rerun()  # Refresh the page
-                    
-        conn.close()
+        render_search()
+        render_existing_logs()
     
     elif page == "Exercises":
         st.subheader("Exercises Database")
-        conn = sqlite3.connect('workout_app.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, exercise_name FROM exercises ORDER BY exercise_name")
-        exercises_list = cursor.fetchall()
+        repository = current_repository()
+        exercises_list = repository.cached_query(
+            "SELECT id, exercise_name FROM exercises ORDER BY exercise_name", name="exercise_list"
+        )
         
         if exercises_list:
             exercise_names = [ex[1] for ex in exercises_list]
@@ -507,34 +4150,24 @@ def main():
                     break
             
             if exercise_id:
+                render_exercise_trends(repository, exercise_id)
+                
                 # Show sets/reps/weight data
-                cursor.execute('''
-                    SELECT w.date, ed.sets, ed.reps, ed.weight
-                    FROM exercise_data ed
-                    JOIN workout_logs w ON ed.workout_log_id = w.id
-                    WHERE ed.exercise_id = ?
-                    ORDER BY w.date
-                ''', (exercise_id,))
-                data_rows = cursor.fetchall()
+                data_rows = repository.cached_query(EXERCISE_SETS_QUERY, (exercise_id,), name="exercise_sets")
                 
                 st.write(f"**Tracking data for {selected_exercise}:**")
                 if data_rows:
                     for row in data_rows:
-                        workout_date, sets_, reps_, weight_ = row
+                        workout_date, sets_, reps_, weight_, reps_by_set = row
+                        if reps_ is None and reps_by_set:
+                            reps_ = reps_by_set
                         st.write(f"- **Date**: {workout_date}, Sets: {sets_}, Reps: {reps_}, Weight: {weight_}")
                 else:
                     st.write("No data for this exercise yet.")
                 
                 st.write("---")
                 st.write(f"**Notes for {selected_exercise}:**")
-                cursor.execute('''
-                    SELECT w.date, n.note_text, n.sentiment
-                    FROM notes n
-                    JOIN workout_logs w ON n.workout_log_id = w.id
-                    WHERE n.exercise_id = ?
-                    ORDER BY w.date
-                ''', (exercise_id,))
-                note_rows = cursor.fetchall()
+                note_rows = repository.cached_query(EXERCISE_NOTES_QUERY, (exercise_id,), name="exercise_notes")
                 if note_rows:
                     for row in note_rows:
                         nd, note_text, senti = row
@@ -543,29 +4176,23 @@ def main():
                     st.write("No notes for this exercise yet.")
         else:
             st.write("No exercises tracked yet.")
-        
-        conn.close()
     
     elif page == "Tracking":
         st.subheader("Tracked Metrics")
-        conn = sqlite3.connect('workout_app.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT w.date, d.metric_name, d.metric_value, d.sentiment
-            FROM daily_metrics d
-            JOIN workout_logs w ON d.workout_log_id = w.id
-            ORDER BY w.date
-        ''')
-        metrics_rows = cursor.fetchall()
+        render_metric_trends(current_repository())
+        metrics_rows = current_repository().cached_query(TRACKING_METRICS_QUERY, name="tracking_metrics")
         
         if metrics_rows:
-            for row in metrics_rows:
-                dt, m_name, m_val, senti = row
-                st.write(f"- **Date**: {dt} | **Metric**: {m_name} | **Value**: {m_val} | **Sentiment**: {senti}")
+            with st.expander(f"All entries ({len(metrics_rows)})"):
+                for row in metrics_rows:
+                    dt, m_name, m_val, senti = row
+                    st.write(f"- **Date**: {dt} | **Metric**: {m_name} | **Value**: {m_val} | **Sentiment**: {senti}")
         else:
             st.write("No metrics recorded yet.")
-        
-        conn.close()
+
+    elif page == "Admin":
+        render_admin_page()
+        render_exercise_aliases()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
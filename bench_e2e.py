@@ -0,0 +1,323 @@
+"""
+End-to-end benchmark for the ingest, edit, delete and page-render paths.
+
+For each history size (1k, 10k and 100k logs by default) it builds a
+synthetic workout history in the style of data/ex_workout_*.txt, then times
+process_workout_entry, edit_workout_log, delete_workout_log and the queries
+behind the Log, Exercises and Tracking pages. LLM calls go to an in-process
+stub backend that answers like the mock server (see mock_hf_server.py), with
+optional simulated latency, so no network is used.
+
+Per path it reports throughput, p50/p95/p99 latency, committed transactions,
+estimated fsyncs and peak Python memory. SQLite does not expose its fsync
+count, so it is estimated from the journal settings. Automatic WAL
+checkpoints are paused while a path is timed. The WAL frames the path
+wrote are then checkpointed in one go, and the checkpoints and fsyncs that
+SQLite would have made are derived from that frame count (see
+estimate_fsyncs). Peak memory comes from a shorter second pass under
+tracemalloc, so the tracing overhead does not skew the latencies.
+
+Usage:
+    python bench_e2e.py --sizes 1000,10000,100000 --ops 200 --output bench_e2e.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import app
+from bench_queries import EXERCISE_NAMES, percentile
+from mock_hf_server import fake_completion
+
+PRIOR_NOTES = [
+    "Body state: left shoulder less inflamed. Pain now localized in left trap",
+    "Pretty tired after three nights of bad sleep.",
+    "Slept 8h, energy high, knees a bit sore.",
+    "Lower back tight after yesterday's deadlifts.",
+    "Felt great, ate well.",
+]
+EXERCISE_NOTES = ["felt good. Last set @8.5", "weak grip", "left shoulder felt fine", "RPE: @8", "slow bar speed"]
+FREE_TEXT_LINES = ["Gym was packed, had to cut the session short", "Forgot my belt today", "Tried a new warm-up"]
+HISTORY_BATCH_SIZE = 1000
+# SQLite's default; SQLITE_PRAGMAS in app.py leaves it alone
+WAL_AUTOCHECKPOINT_PAGES = 1000
+
+class StubBackend(app.InferenceBackend):
+    """
+    Answers like mock_hf_server.py, in-process. Streams the answer in small
+    pieces so the incremental JSON parser is exercised too.
+    """
+
+    def __init__(self, latency: float = 0.0, chunk_size: int = 8):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def generate(self, prompt: str, max_tokens=app.MAX_NEW_TOKENS, temperature=app.TEMPERATURE) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return fake_completion(prompt)
+
+    def generate_stream(self, prompt: str, max_tokens=app.MAX_NEW_TOKENS, temperature=app.TEMPERATURE):
+        text = self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+
+def synthetic_log(rng: random.Random) -> str:
+    lines = []
+    if rng.random() < 0.6:
+        lines += ["Prior notes:", f"- {rng.choice(PRIOR_NOTES)}", ""]
+    for name in rng.sample(EXERCISE_NAMES, rng.randint(3, 7)):
+        lines.append(name)
+        sets, weight = rng.randint(1, 6), rng.choice([2.5 * i for i in range(4, 60)])
+        if rng.random() < 0.2:
+            reps = "-".join(str(rng.randint(6, 12)) for _ in range(sets))
+            lines.append(f"- {sets}x{reps} {weight:g}kg")
+        else:
+            lines.append(f"- {sets}x{rng.randint(1, 12)} {weight:g}kg")
+        if rng.random() < 0.3:
+            lines.append(f"- Notes: {rng.choice(EXERCISE_NOTES)}")
+        lines.append("")
+    if rng.random() < 0.2:
+        lines.append(rng.choice(FREE_TEXT_LINES))
+    return "\n".join(lines)
+
+def edited_log(rng: random.Random, raw_text: str) -> str:
+    """
+    Changes one set line, as a typical edit does.
+    """
+    lines = raw_text.splitlines()
+    set_lines = [i for i, line in enumerate(lines) if app.SET_NOTATION_RE.match(line.lstrip("- ").strip())]
+    if not set_lines:
+        return raw_text + f"\n{rng.choice(FREE_TEXT_LINES)}"
+    i = rng.choice(set_lines)
+    lines[i] = f"- {rng.randint(1, 6)}x{rng.randint(1, 12)} {rng.randint(10, 150)}kg"
+    return "\n".join(lines)
+
+def use_database(path: str):
+    """
+    Points the app at a fresh database and parse cache.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    app.DB_PATH = path
+    app.PARSE_CACHE_PATH = os.path.join(os.path.dirname(path), "parse_cache.db")
+    app.get_shard_registry().close_all()
+    app.get_parse_cache.clear()
+    return app.get_repository()
+
+def build_history(repository: app.WorkoutRepository, n_logs: int, rng: random.Random) -> list:
+    """
+    Writes n_logs parsed logs in large batches, as an import would.
+    Parsing is the offline fast path, so building the history costs no LLM calls.
+    """
+    start_day = date(2000, 1, 1)
+    days = [start_day + timedelta(days=i) for i in range(n_logs)]
+    rng.shuffle(days)
+    offline_mode, app.OFFLINE_MODE = app.OFFLINE_MODE, True
+    try:
+        for batch_start in range(0, n_logs, HISTORY_BATCH_SIZE):
+            with repository.unit_of_work() as cursor:
+                for i in range(batch_start, min(n_logs, batch_start + HISTORY_BATCH_SIZE)):
+                    raw_text = synthetic_log(rng)
+                    log_id = repository.insert_log(cursor, f"Session {i}", days[i].isoformat(), raw_text)
+                    repository.insert_structured_data(cursor, log_id, app.categorize_and_extract_features(raw_text))
+    finally:
+        app.OFFLINE_MODE = offline_mode
+    repository.conn.execute("ANALYZE")
+    return [row[0] for row in repository.query("SELECT id FROM workout_logs")]
+
+class TransactionCounter:
+    """
+    Counts COMMITs on a connection through its trace callback.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.commits = 0
+
+    def __enter__(self):
+        self.conn.set_trace_callback(self._trace)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.conn.set_trace_callback(None)
+
+    def _trace(self, statement: str):
+        if statement.lstrip().upper().startswith("COMMIT"):
+            self.commits += 1
+
+def estimate_fsyncs(conn, commits: int, wal_frames: int) -> int:
+    """
+    WAL mode syncs the WAL on every commit with synchronous=FULL and only at
+    checkpoints with NORMAL. A checkpoint syncs the WAL and the database file.
+    SQLite checkpoints automatically every wal_autocheckpoint frames.
+    """
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    if synchronous == 0:
+        return 0
+    checkpoints = math.ceil(wal_frames / WAL_AUTOCHECKPOINT_PAGES) if wal_frames else 0
+    return 2 * checkpoints + (commits if synchronous >= 2 else 0)
+
+def time_path(repository: app.WorkoutRepository, operation, ops: int) -> dict:
+    conn = repository.conn
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA wal_autocheckpoint = 0")
+    samples = []
+    try:
+        with TransactionCounter(conn) as counter:
+            wall_start = time.perf_counter()
+            for i in range(ops):
+                start = time.perf_counter()
+                operation(i)
+                samples.append((time.perf_counter() - start) * 1000)
+            wall_s = time.perf_counter() - wall_start
+    finally:
+        checkpoint_start = time.perf_counter()
+        # TRUNCATE reports the emptied WAL, so read the frame count from a PASSIVE run first
+        _, wal_frames, _ = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        checkpoint_ms = (time.perf_counter() - checkpoint_start) * 1000
+        conn.execute(f"PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT_PAGES}")
+    return {
+        "ops": ops,
+        "throughput_ops_s": round(ops / wall_s, 1) if wall_s else None,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "commits": counter.commits,
+        "wal_frames": wal_frames,
+        "estimated_fsyncs": estimate_fsyncs(conn, counter.commits, wal_frames),
+        "checkpoint_ms": round(checkpoint_ms, 3),
+    }
+
+def peak_memory_mb(operation, ops: int) -> float:
+    tracemalloc.start()
+    try:
+        for i in range(ops):
+            operation(i)
+        return round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+    finally:
+        tracemalloc.stop()
+
+def bench_paths(repository: app.WorkoutRepository, log_ids: list, ops: int, rng: random.Random) -> dict:
+    live_ids = list(log_ids)
+    exercise_ids = [row[0] for row in repository.query("SELECT id FROM exercises")]
+    next_day = [date(2100, 1, 1)]
+
+    def ingest(_):
+        next_day[0] += timedelta(days=1)
+        live_ids.append(app.process_workout_entry("Bench", next_day[0].isoformat(), synthetic_log(rng)))
+
+    def edit(_):
+        log_id = rng.choice(live_ids)
+        app.edit_workout_log(log_id, "Bench edit", "2099-01-01", edited_log(rng, repository.get_log_text(log_id)))
+
+    def delete(_):
+        log_id = live_ids.pop(rng.randrange(len(live_ids)))
+        app.delete_workout_log(log_id)
+
+    def log_page(_):
+        # A random page, so most renders miss the query cache
+        rows, _ = repository.list_logs(before_id=rng.choice(live_ids) + 1, limit=app.LOG_PAGE_SIZE)
+        if rows:
+            repository.get_log_text(rows[0][0])
+
+    def exercises_page(_):
+        params = (rng.choice(exercise_ids),)
+        repository.query(app.EXERCISE_STATS_QUERY, params)
+        repository.query(app.EXERCISE_SETS_QUERY, params)
+        repository.query(app.EXERCISE_NOTES_QUERY, params)
+
+    def tracking_page(_):
+        repository.query(app.METRIC_SERIES_QUERY)
+        repository.query(app.DAILY_VOLUME_QUERY)
+        repository.query(app.TRACKING_METRICS_QUERY)
+
+    paths = {
+        "ingest": (ingest, ops),
+        "edit": (edit, ops),
+        "delete": (delete, min(ops, len(live_ids) // 2)),
+        "log_page": (log_page, ops),
+        "exercises_page": (exercises_page, ops),
+        "tracking_page": (tracking_page, max(1, ops // 10)),
+    }
+    results = {}
+    for name, (operation, n_ops) in paths.items():
+        results[name] = time_path(repository, operation, n_ops)
+        results[name]["peak_python_mb"] = peak_memory_mb(operation, max(1, n_ops // 10))
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes: list, ops: int, llm_latency: float, seed: int = 0) -> dict:
+    backend = StubBackend(latency=llm_latency)
+    # Route every LLM call to the in-process stub
+    app.get_inference_client = lambda: backend
+    results = {
+        "config": {"sizes": sizes, "ops": ops, "llm_latency_s": llm_latency, "seed": seed,
+                   "streaming": app.STREAMING_MODE},
+        "revision": git_revision(),
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_logs in sizes:
+            rng = random.Random(seed)
+            repository = use_database(os.path.join(tmp, f"history_{n_logs}", "workout_app.db"))
+            start = time.perf_counter()
+            log_ids = build_history(repository, n_logs, rng)
+            build_s = time.perf_counter() - start
+            calls_before = backend.calls
+            paths = bench_paths(repository, log_ids, ops, rng)
+            results["sizes"][str(n_logs)] = {
+                "build_s": round(build_s, 2),
+                "exercise_rows": repository.query("SELECT COUNT(*) FROM exercise_data")[0][0],
+                "llm_calls": backend.calls - calls_before,
+                "parse_cache": app.get_parse_cache().stats(),
+                "paths": paths,
+            }
+            repository.conn.close()
+            app.get_parse_cache()._conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GainsGPT ingest, edit and page paths end to end.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Comma-separated history sizes in logs (default: 1000,10000,100000)")
+    parser.add_argument("--ops", type=int, default=200, help="Timed operations per path (default: 200)")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="Simulated seconds per LLM call (default: 0)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = run(sizes, args.ops, args.llm_latency, args.seed)
+    for n_logs, size_result in results["sizes"].items():
+        print(f"== {n_logs} logs (built in {size_result['build_s']} s, {size_result['llm_calls']} LLM calls)")
+        for name, r in size_result["paths"].items():
+            print(
+                f"{name}: {r['throughput_ops_s']} ops/s, p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, "
+                f"p99 {r['p99_ms']} ms, {r['commits']} commits, ~{r['estimated_fsyncs']} fsyncs, "
+                f"peak {r['peak_python_mb']} MB"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Query benchmark for the Exercises, Tracking and search pages.
+
+Builds a synthetic database (100k+ exercise_data rows by default), once with
+only the base schema and once with all migrations applied. For each page
+query it records the EXPLAIN QUERY PLAN output and p50/p99 latency, and it
+times a full rebuild of the exercise analytics table.
+
+Usage:
+    python bench_queries.py --logs 20000 --runs 200 --output bench_queries.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import app
+
+BASE_EXERCISE_NAMES = [
+    "Military press", "Pull ups", "Regular DL deficit (blue disk)", "Leg extension",
+    "Cable standing chest flies", "Inclined Bench press multipower", "Pec fly", "Squat",
+    "Bench press", "Barbell row", "Romanian deadlift", "Lateral raise",
+]
+# A realistic catalog has many exercises, each appearing in a small share of logs
+EXERCISE_NAMES = [f"{name} v{i}" for i in range(12) for name in BASE_EXERCISE_NAMES]
+METRIC_NAMES = ["SleepQuality", "ShoulderInflammation", "TrapPain", "Energy"]
+NOTE_TEXTS = [
+    "felt good", "weak grip", "left shoulder felt fine", "slow bar speed", "knees a bit sore",
+    "pain in the left trap", "easy, add weight next time", "bad sleep, low energy", "RPE 8 on the last set",
+]
+# Rare, medium and very common search terms
+SEARCH_TERMS = ["trap", '"left shoulder"', "grip", "felt"]
+# Full-text search before the FTS5 index, for the base schema
+BASE_SEARCH_QUERY = '''
+    SELECT DISTINCT w.id, w.session_name, w.date
+    FROM workout_logs w
+    LEFT JOIN notes n ON n.workout_log_id = w.id
+    WHERE w.raw_text LIKE ? OR n.note_text LIKE ?
+    ORDER BY w.id DESC
+    LIMIT 20
+'''
+# The Exercises page query before exercise_sets existed, for the base schema
+BASE_EXERCISE_SETS_QUERY = '''
+    SELECT w.date, ed.sets, ed.reps, ed.weight
+    FROM exercise_data ed
+    JOIN workout_logs w ON ed.workout_log_id = w.id
+    WHERE ed.exercise_id = ?
+    ORDER BY w.date_num
+'''
+
+def build_database(path: str, n_logs: int, exercises_per_log: int, schema_version: int, seed: int = 0):
+    rng = random.Random(seed)
+    conn = app.open_connection(path)
+    repository = app.WorkoutRepository(conn)
+    with repository.unit_of_work() as cursor:
+        app.apply_migrations(cursor, target_version=1)
+        cursor.executemany("INSERT INTO exercises (exercise_name) VALUES (?)", [(name,) for name in EXERCISE_NAMES])
+        cursor.execute("SELECT exercise_name, id FROM exercises")
+        exercise_ids = dict(cursor.fetchall())
+        start_day = date(2015, 1, 1)
+        # Insert in random date order so id order and date order differ, as with imports
+        days = [start_day + timedelta(days=i) for i in range(n_logs)]
+        rng.shuffle(days)
+        for i, day in enumerate(days):
+            cursor.execute(
+                "INSERT INTO workout_logs (session_name, date, raw_text) VALUES (?, ?, ?)",
+                (f"Session {i}", day.isoformat(), "synthetic"),
+            )
+            log_id = cursor.lastrowid
+            names = rng.sample(EXERCISE_NAMES, exercises_per_log)
+            note_text = rng.choice(NOTE_TEXTS)
+            cursor.execute(
+                "UPDATE workout_logs SET raw_text = ? WHERE id = ?",
+                ("\n".join(f"{name}\n- 3x8 50kg" for name in names) + f"\n- notes: {note_text}", log_id),
+            )
+            cursor.executemany(
+                "INSERT INTO exercise_data (workout_log_id, exercise_id, sets, reps, weight) VALUES (?, ?, ?, ?, ?)",
+                [(log_id, exercise_ids[n], rng.randint(1, 6), rng.randint(1, 12), rng.randint(10, 150)) for n in names],
+            )
+            cursor.execute(
+                "INSERT INTO notes (workout_log_id, exercise_id, note_text, category, sentiment) VALUES (?, ?, ?, ?, ?)",
+                (log_id, exercise_ids[names[0]], note_text, "exercise_note", "neutral"),
+            )
+            cursor.execute(
+                "INSERT INTO daily_metrics (workout_log_id, metric_name, metric_value, sentiment) VALUES (?, ?, ?, ?)",
+                (log_id, rng.choice(METRIC_NAMES), "ok", "neutral"),
+            )
+        app.apply_migrations(cursor, target_version=schema_version)
+    if schema_version < 2:
+        # Queries order by date_num; give the baseline the column without any index
+        conn.execute("ALTER TABLE workout_logs ADD COLUMN date_num INTEGER")
+        conn.execute("UPDATE workout_logs SET date_num = CAST(REPLACE(date, '-', '') AS INTEGER)")
+    conn.execute("ANALYZE")
+    return conn, list(exercise_ids.values())
+
+def sqlite3_scalar(path: str, sql: str):
+    conn = app.open_connection(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def bench_query(conn, sql: str, params_list: list, runs: int) -> dict:
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params_list[0]).fetchall()]
+    samples = []
+    for i in range(runs):
+        params = params_list[i % len(params_list)]
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "plan": plan,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
+
+def run(n_logs: int, exercises_per_log: int, runs: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, schema_version in (("base_schema", 1), ("migrated", len(app.SCHEMA_MIGRATIONS))):
+            conn, exercise_ids = build_database(
+                os.path.join(tmp, f"{label}.db"), n_logs, exercises_per_log, schema_version
+            )
+            exercise_params = [(exercise_id,) for exercise_id in exercise_ids]
+            results[label] = {
+                "exercise_sets": bench_query(
+                    conn, app.EXERCISE_SETS_QUERY if schema_version > 1 else BASE_EXERCISE_SETS_QUERY,
+                    exercise_params, runs,
+                ),
+                "exercise_notes": bench_query(conn, app.EXERCISE_NOTES_QUERY, exercise_params, runs),
+                "tracking_metrics": bench_query(conn, app.TRACKING_METRICS_QUERY, [()], max(1, runs // 10)),
+            }
+            if schema_version == len(app.SCHEMA_MIGRATIONS):
+                search_params = [(app.fts_match_query(term), 20, None, None) for term in SEARCH_TERMS]
+                results[label]["search"] = bench_query(conn, app.SEARCH_QUERY, search_params, runs)
+            else:
+                search_params = [(f"%{term.strip(chr(34))}%",) * 2 for term in SEARCH_TERMS]
+                results[label]["search"] = bench_query(conn, BASE_SEARCH_QUERY, search_params, runs)
+            if schema_version >= 3:
+                results[label]["exercise_stats"] = bench_query(conn, app.EXERCISE_STATS_QUERY, exercise_params, runs)
+                start = time.perf_counter()
+                with app.WorkoutRepository(conn).unit_of_work() as cursor:
+                    app.rebuild_exercise_stats(cursor)
+                results[label]["analytics_rebuild_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            conn.close()
+            total_sets = sqlite3_scalar(os.path.join(tmp, f"{label}.db"), "SELECT SUM(sets) FROM exercise_data")
+    results["config"] = {
+        "logs": n_logs, "exercise_rows": n_logs * exercises_per_log, "total_sets": total_sets, "runs": runs,
+    }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Exercises, Tracking and search queries.")
+    parser.add_argument("--logs", type=int, default=20000, help="Synthetic workout logs (default: 20000)")
+    parser.add_argument("--exercises-per-log", type=int, default=6, help="exercise_data rows per log (default: 6)")
+    parser.add_argument("--runs", type=int, default=200, help="Timed executions per query (default: 200)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.logs, args.exercises_per_log, args.runs)
+    for label in ("base_schema", "migrated"):
+        print(f"== {label}")
+        for query_name, result in results[label].items():
+            if not isinstance(result, dict):
+                print(f"{query_name}: {result}")
+                continue
+            print(f"{query_name}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+            for step in result["plan"]:
+                print(f"    {step}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Bulk import of historical workout logs into the GainsGPT database.
+
+Accepts directories of text files (like data/ex_workout_*.txt), single text
+files and JSONL dumps with one {"session_name", "date", "raw_text"} object per
+line. Logs are parsed concurrently by a bounded worker pool, inference calls
+are rate limited, and results are written in large transactions. Every
+committed log is recorded in the import_progress table in the same
+transaction, so a killed run resumes where it stopped.
+
+Usage:
+    python import_logs.py data/ --workers 4 --rate 2 --batch-size 100
+    GAINSGPT_SHARD_DIR=shards python import_logs.py data/ --user alice@example.com
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import app
+
+DATE_IN_NAME_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+def iter_text_file(path: str):
+    with open(path, encoding="utf-8") as f:
+        raw_text = f.read()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = DATE_IN_NAME_RE.search(stem)
+    if match:
+        date_str = match.group(1)
+    else:
+        date_str = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d")
+    yield os.path.abspath(path), stem, date_str, raw_text
+
+def iter_jsonl_file(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield (
+                f"{os.path.abspath(path)}:{line_no}",
+                record.get("session_name") or f"Imported {line_no}",
+                record.get("date") or datetime.now().strftime("%Y-%m-%d"),
+                record["raw_text"],
+            )
+
+def iter_sources(paths: list):
+    """
+    Yields (source_id, session_name, date_str, raw_text) for every input log.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full_path = os.path.join(path, name)
+                if name.endswith(".txt"):
+                    yield from iter_text_file(full_path)
+                elif name.endswith(".jsonl"):
+                    yield from iter_jsonl_file(full_path)
+        elif path.endswith(".jsonl"):
+            yield from iter_jsonl_file(path)
+        else:
+            yield from iter_text_file(path)
+
+def load_completed_sources(repository: app.WorkoutRepository) -> set:
+    return {row[0] for row in repository.query("SELECT source_id FROM import_progress")}
+
+def write_batch(repository: app.WorkoutRepository, batch: list):
+    """
+    Writes a batch of parsed logs and their checkpoints in one transaction.
+    """
+    imported_at = datetime.now().isoformat(timespec="seconds")
+    with repository.unit_of_work() as cursor:
+        for source_id, session_name, date_str, raw_text, structured_data in batch:
+            log_id = repository.insert_log(cursor, session_name, date_str, raw_text)
+            repository.insert_structured_data(cursor, log_id, structured_data)
+            cursor.execute(
+                "INSERT INTO import_progress (source_id, workout_log_id, imported_at) VALUES (?, ?, ?)",
+                (source_id, log_id, imported_at),
+            )
+
+def parse_source(source: tuple):
+    source_id, session_name, date_str, raw_text = source
+    return source_id, session_name, date_str, raw_text, app.categorize_and_extract_features(raw_text)
+
+def run_import(paths: list, workers: int, rate: float, batch_size: int, user: str = None) -> dict:
+    repository = app.get_repository(user)
+    if rate > 0:
+        app.get_inference_client().rate_limiter = app.RateLimiter(rate, burst=workers)
+
+    completed = load_completed_sources(repository)
+
+    stats = {"imported": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+    batch = []
+    pending = set()
+
+    def flush():
+        if batch:
+            write_batch(repository, batch)
+            stats["imported"] += len(batch)
+            batch.clear()
+            elapsed = time.perf_counter() - start
+            print(f"[{stats['imported']} imported] {stats['imported'] / elapsed:.1f} logs/s", flush=True)
+
+    def collect(done):
+        for future in done:
+            try:
+                batch.append(future.result())
+            except app.InferenceError as e:
+                stats["failed"] += 1
+                print(f"Failed to parse log: {e}", file=sys.stderr)
+            if len(batch) >= batch_size:
+                flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for source in iter_sources(paths):
+            if source[0] in completed:
+                stats["skipped"] += 1
+                continue
+            # Keep the number of in-flight parses bounded so memory stays flat
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(parse_source, source))
+        done, _ = wait(pending)
+        collect(done)
+    flush()
+
+    stats["elapsed_seconds"] = time.perf_counter() - start
+    stats["parse_cache"] = app.get_parse_cache().stats()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import workout logs into GainsGPT.")
+    parser.add_argument("paths", nargs="+", help="Directories, .txt files or .jsonl dumps to import")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent parses (default: 4)")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="Max inference requests per second, 0 to disable (default: 2)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Logs per database transaction (default: 100)")
+    parser.add_argument("--user", help="Import into this user's database (multi-user mode, see GAINSGPT_SHARD_DIR)")
+    args = parser.parse_args()
+
+    stats = run_import(args.paths, args.workers, args.rate, args.batch_size, args.user)
+    elapsed = stats["elapsed_seconds"]
+    throughput = stats["imported"] / elapsed if elapsed else 0.0
+    print(
+        f"Imported {stats['imported']} logs ({stats['skipped']} already imported, {stats['failed']} failed) "
+        f"in {elapsed:.1f}s, {throughput:.1f} logs/s"
+    )
+    cache = stats["parse_cache"]
+    print(f"Parse cache: {cache['hits']} hits, {cache['misses']} misses")
+    if stats["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Local stand-in for the Hugging Face Inference API, for load tests and CI
+runs without network access.
+
+It answers in the HF response format (also on TGI's /generate and
+/generate_stream paths, and in the OpenAI format on /v1/completions),
+streams tokens as server-sent events when asked to, and can inject latency,
+503 "model loading" and 429 "rate limited" errors.
+Completions are deterministic: the workout text is taken from the prompt and
+parsed with the app's local fast-path parser, or looked up in a file of
+recorded responses (see GAINSGPT_RECORD_PATH in app.py).
+
+Usage:
+    python mock_hf_server.py --port 8080 --latency 0.5 --error-rate 0.05
+    GAINSGPT_BACKEND=hf GAINSGPT_INFERENCE_URL=http://127.0.0.1:8080 streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+
+PROMPT_INPUT_MARKER = 'NEW INPUT:\n"""'
+
+def workout_text_from_prompt(prompt: str) -> str:
+    start = prompt.rfind(PROMPT_INPUT_MARKER)
+    if start == -1:
+        return prompt
+    text = prompt[start + len(PROMPT_INPUT_MARKER):]
+    end = text.rfind('"""')
+    return text[:end] if end != -1 else text
+
+def local_parse(text: str) -> dict:
+    parts = []
+    for block in app.parse_workout_locally(text).blocks:
+        parts.append(block["structured_data"] or app.unparsed_block_data(block))
+    return app.merge_structured_data(*parts)
+
+def fake_completion(prompt: str) -> str:
+    """
+    What a well-behaved model would answer, computed with the local parser.
+    Fragments the parser cannot read become general notes. Batch prompts
+    (see app.build_batch_prompt) get each item tagged with its block number.
+    """
+    text = workout_text_from_prompt(prompt)
+    batch = app.split_prompt_batch(text)
+    if not batch:
+        return json.dumps(local_parse(text), ensure_ascii=False)
+    output = {"metrics": [], "exercises": [], "general_notes": []}
+    for number, block_text in batch.items():
+        for key, items in local_parse(block_text).items():
+            output[key].extend({**item, "block": number} for item in items)
+    return json.dumps(output, ensure_ascii=False)
+
+class MockInferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, token_delay=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, loading_seconds=0.0, responses_path=None, seed=0):
+        super().__init__(address, MockInferenceHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.loading_until = time.monotonic() + loading_seconds
+        self.replay = app.ReplayBackend(responses_path) if responses_path else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_503": 0, "errors_429": 0}
+
+    def draw(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def completion(self, prompt: str) -> str:
+        if self.replay is not None:
+            return self.replay.generate(prompt)
+        return fake_completion(prompt)
+
+class MockInferenceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        server.count("requests")
+        openai_format = self.path.rstrip("/").endswith("/v1/completions")
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = payload["prompt"] if openai_format else payload["inputs"]
+        except (ValueError, KeyError):
+            return self.send_json(400, {"error": "Expected a JSON body with the prompt"})
+
+        loading_left = server.loading_until - time.monotonic()
+        if loading_left > 0 or server.draw() < server.error_rate:
+            server.count("errors_503")
+            return self.send_json(503, {
+                "error": "Model is currently loading", "estimated_time": max(loading_left, 1.0)
+            })
+        if server.draw() < server.rate_limit_rate:
+            server.count("errors_429")
+            return self.send_json(429, {"error": "Rate limit reached"}, {"Retry-After": "1"})
+
+        time.sleep(server.latency + server.jitter * server.draw())
+        try:
+            text = server.completion(prompt)
+        except app.InferenceError as e:
+            return self.send_json(500, {"error": str(e)})
+
+        if openai_format:
+            if payload.get("stream"):
+                self.send_stream(text, openai_format=True)
+            else:
+                self.send_json(200, {"object": "text_completion", "choices": [{"index": 0, "text": text}]})
+        elif self.path.rstrip("/").endswith("/generate_stream") or payload.get("stream"):
+            self.send_stream(text)
+        elif self.path.rstrip("/").endswith("/generate"):
+            self.send_json(200, {"generated_text": text})
+        else:
+            self.send_json(200, [{"generated_text": text}])
+
+    def send_json(self, status: int, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, text: str, openai_format: bool = False):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        # Token-sized pieces that keep their leading whitespace, so they join back to `text`
+        pieces, position = [], 0
+        for match in app.PROMPT_TOKEN_RE.finditer(text):
+            pieces.append(text[position:match.end()])
+            position = match.end()
+        if position < len(text):
+            pieces.append(text[position:])
+        try:
+            for index, piece in enumerate(pieces):
+                if openai_format:
+                    event = {"object": "text_completion", "choices": [{"index": 0, "text": piece}]}
+                else:
+                    event = {"token": {"id": index, "text": piece, "special": False}, "generated_text": None}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if self.server.token_delay:
+                    time.sleep(self.server.token_delay)
+            if openai_format:
+                self.wfile.write(b"data: [DONE]\n\n")
+            else:
+                final = {"token": {"id": len(pieces), "text": "</s>", "special": True}, "generated_text": text}
+                self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (early stop); nothing left to do
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the HF Inference API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--loading-seconds", type=float, default=0.0,
+                        help="Answer 503 'model loading' for this long after startup")
+    parser.add_argument("--responses", help="JSONL of recorded prompt/response pairs to replay")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockInferenceServer(
+        (args.host, args.port), latency=args.latency, jitter=args.jitter, token_delay=args.token_delay,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        loading_seconds=args.loading_seconds, responses_path=args.responses, seed=args.seed,
+    )
+    print(f"Mock inference server on http://{args.host}:{server.server_port}. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {server.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Runs GainsGPT background parse workers in a separate process.
+
+The Streamlit app already starts worker threads in its own process; run this
+as well to add parsing capacity or to keep draining the queue while the app
+is down. Jobs are claimed atomically, so any number of workers can share the
+same database.
+
+Usage:
+    python parse_worker.py --concurrency 4 --metrics-port 9465
+    GAINSGPT_SHARD_DIR=shards python parse_worker.py --user alice@example.com
+    GAINSGPT_SHARD_DIR=shards python parse_worker.py --all-users
+"""
+import argparse
+import time
+
+import app
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued GainsGPT parse jobs.")
+    parser.add_argument("--concurrency", type=int, default=app.PARSE_WORKER_CONCURRENCY,
+                        help=f"Parallel parses (default: {app.PARSE_WORKER_CONCURRENCY})")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus metrics on this local port (default: off)")
+    users = parser.add_mutually_exclusive_group()
+    users.add_argument("--user", help="Drain this user's queue (multi-user mode, see GAINSGPT_SHARD_DIR)")
+    users.add_argument("--all-users", action="store_true",
+                       help="Drain the queues of every user database in GAINSGPT_SHARD_DIR")
+    args = parser.parse_args()
+    if args.all_users and not app.SHARD_DIR:
+        parser.error("--all-users needs GAINSGPT_SHARD_DIR")
+
+    if args.metrics_port:
+        app.start_metrics_server(app.get_metrics(), args.metrics_port)
+        print(f"Metrics on http://{app.METRICS_HOST}:{args.metrics_port}/metrics")
+
+    registry = app.get_shard_registry()
+    if args.all_users:
+        worker = app.ShardParseWorker(registry, concurrency=args.concurrency)
+        location = f"every database in {app.SHARD_DIR}"
+    else:
+        path = app.shard_path(args.user)
+        worker = app.ShardParseWorker(registry, [path], args.user is not None, concurrency=args.concurrency)
+        location = path
+    worker.start()
+    print(f"Parse worker running with {args.concurrency} threads on {location}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        worker.stop()
+
+if __name__ == "__main__":
+    main()
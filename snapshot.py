@@ -0,0 +1,437 @@
+"""
+Export and import of the GainsGPT database as a portable snapshot.
+
+An export writes one file per table, as Parquet (needs pyarrow) or
+gzip-compressed JSONL, plus a manifest.json. Rows are streamed in chunks, so
+memory stays flat however long the history is. Parsed data is exported as
+stored, so restoring a snapshot never re-runs LLM parsing. The parse queue
+is exported too: logs still waiting to be parsed are parsed after a restore
+(a parse that was running when the snapshot was taken starts over). On
+import the analytics rows of the exercises and metrics the snapshot touches
+are recomputed, a chunk of them at a time, and the search index is rebuilt.
+
+The manifest records a watermark, the highest change sequence number in the
+snapshot (see WorkoutRepository.next_change_seq). Exporting with
+--since-manifest writes only the logs changed or deleted after that
+watermark. The exercise and metric catalogs and the parse queue are always
+exported in full.
+
+An import runs in a single transaction. A full snapshot goes into a new or
+empty database, or replaces its data with --replace; an older schema version
+is loaded first and then migrated. An incremental snapshot is applied on top
+of a database restored from the same source.
+
+Usage:
+    python snapshot.py export backups/full --format parquet
+    python snapshot.py export backups/since-full --since-manifest backups/full/manifest.json
+    python snapshot.py import backups/full --db restored.db
+    python snapshot.py import backups/since-full --db restored.db
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+import app
+
+SNAPSHOT_CHUNK_ROWS = 5000
+# Exercises (or metrics) whose analytics rows are recomputed together on import
+STATS_CHUNK_IDS = 100
+MANIFEST_NAME = "manifest.json"
+FILE_EXTENSIONS = {"parquet": ".parquet", "jsonl": ".jsonl.gz"}
+
+# Rows of the logs changed after the watermark (?), per log-owned table, in load order
+LOG_TABLES = {
+    "workout_logs": "SELECT {columns} FROM workout_logs t WHERE t.change_seq > ? ORDER BY t.id",
+    "exercise_data": '''
+        SELECT {columns} FROM exercise_data t
+        WHERE t.workout_log_id IN (SELECT id FROM workout_logs WHERE change_seq > ?)
+        ORDER BY t.id
+    ''',
+    "exercise_sets": '''
+        SELECT {columns} FROM exercise_sets t
+        WHERE t.exercise_data_id IN (
+            SELECT ed.id FROM exercise_data ed JOIN workout_logs w ON ed.workout_log_id = w.id
+            WHERE w.change_seq > ?
+        )
+        ORDER BY t.exercise_data_id, t.set_index
+    ''',
+    "notes": '''
+        SELECT {columns} FROM notes t
+        WHERE t.workout_log_id IN (SELECT id FROM workout_logs WHERE change_seq > ?)
+        ORDER BY t.id
+    ''',
+    "daily_metrics": '''
+        SELECT {columns} FROM daily_metrics t
+        WHERE t.workout_log_id IN (SELECT id FROM workout_logs WHERE change_seq > ?)
+        ORDER BY t.id
+    ''',
+    "deleted_logs": "SELECT {columns} FROM deleted_logs t WHERE t.change_seq > ? ORDER BY t.workout_log_id",
+}
+# Small lookup tables, and the parse queue (whose status changes do not mark
+# the log changed), always exported whole
+CATALOG_TABLES = {
+    "exercises": "SELECT {columns} FROM exercises t ORDER BY t.id",
+    "exercise_aliases": "SELECT {columns} FROM exercise_aliases t ORDER BY t.alias_key",
+    "exercise_alias_suggestions": "SELECT {columns} FROM exercise_alias_suggestions t ORDER BY t.alias_key",
+    "metrics": "SELECT {columns} FROM metrics t ORDER BY t.id",
+    "parse_jobs": "SELECT {columns} FROM parse_jobs t ORDER BY t.workout_log_id",
+}
+LOAD_ORDER = [
+    "exercises", "metrics", "exercise_aliases", "exercise_alias_suggestions", "workout_logs",
+    "exercise_data", "exercise_sets", "notes", "daily_metrics", "deleted_logs", "parse_jobs",
+]
+
+def table_columns(cursor, table: str) -> list:
+    """
+    (name, declared type) of each column of `table`.
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [(row[1], (row[2] or "").upper()) for row in cursor.fetchall()]
+
+def arrow_schema(cursor, table: str, columns: list):
+    """
+    Arrow types from the declared SQLite types. SQLite does not enforce them,
+    so a numeric column holding any text (e.g. reps "8-10") is exported as string.
+    """
+    import pyarrow as pa
+
+    checks = []
+    for name, declared in columns:
+        allowed = "'integer', 'null'" if "INT" in declared else "'integer', 'real', 'null'"
+        checks.append(f"SUM(typeof({name}) NOT IN ({allowed}))")
+    cursor.execute(f"SELECT {', '.join(checks)} FROM {table}")
+    mixed = cursor.fetchone()
+    fields = []
+    for (name, declared), has_other_types in zip(columns, mixed):
+        if "INT" in declared and not has_other_types:
+            fields.append(pa.field(name, pa.int64()))
+        elif any(t in declared for t in ("REAL", "FLOA", "DOUB")) and not has_other_types:
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+def iter_chunks(cursor, chunk_rows: int):
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+def write_parquet(cursor, table: str, columns: list, sql: str, params: tuple, path: str, chunk_rows: int) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(cursor, table, columns)
+    string_columns = {field.name for field in schema if field.type == pa.string()}
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        cursor.execute(sql, params)
+        for rows in iter_chunks(cursor, chunk_rows):
+            arrays = []
+            for index, field in enumerate(schema):
+                values = [row[index] for row in rows]
+                if field.name in string_columns:
+                    values = [None if value is None else str(value) for value in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+def write_jsonl(cursor, table: str, columns: list, sql: str, params: tuple, path: str, chunk_rows: int) -> int:
+    names = [name for name, _ in columns]
+    count = 0
+    # Level 6 rather than gzip's default 9: about twice as fast, files about 25% larger
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        cursor.execute(sql, params)
+        for rows in iter_chunks(cursor, chunk_rows):
+            f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in rows)
+            count += len(rows)
+    return count
+
+def export_snapshot(db_path: str, out_dir: str, file_format: str = "parquet", since: int = 0,
+                    chunk_rows: int = SNAPSHOT_CHUNK_ROWS) -> dict:
+    """
+    Writes the snapshot and returns its manifest. `since` = 0 exports everything.
+    """
+    if file_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow (pip install pyarrow), or use --format jsonl.")
+    os.makedirs(out_dir, exist_ok=True)
+    conn = app.open_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        # One read transaction, so every table comes from the same snapshot
+        cursor.execute("BEGIN")
+        cursor.execute("PRAGMA user_version")
+        schema_version = cursor.fetchone()[0]
+        if schema_version != len(app.SCHEMA_MIGRATIONS):
+            raise SystemExit(
+                f"{db_path} is at schema version {schema_version}; open it with the app once to migrate it."
+            )
+        cursor.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(change_seq) FROM workout_logs), 0),
+                       COALESCE((SELECT MAX(change_seq) FROM deleted_logs), 0))
+        ''')
+        watermark = cursor.fetchone()[0]
+        write = write_parquet if file_format == "parquet" else write_jsonl
+        tables = {}
+        for table, sql in list(CATALOG_TABLES.items()) + list(LOG_TABLES.items()):
+            columns = table_columns(cursor, table)
+            path = os.path.join(out_dir, table + FILE_EXTENSIONS[file_format])
+            params = () if table in CATALOG_TABLES else (since,)
+            query = sql.format(columns=", ".join(f"t.{name}" for name, _ in columns))
+            start = time.perf_counter()
+            rows = write(cursor, table, columns, query, params, path, chunk_rows)
+            tables[table] = {"file": os.path.basename(path), "rows": rows,
+                             "seconds": round(time.perf_counter() - start, 3)}
+        cursor.execute("COMMIT")
+    finally:
+        conn.close()
+
+    manifest = {
+        "format": file_format,
+        "schema_version": schema_version,
+        "since": since,
+        "watermark": watermark,
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": tables,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def read_chunks(path: str, file_format: str, chunk_rows: int):
+    """
+    Yields (column names, list of row tuples) chunks from one snapshot file.
+    """
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            columns = [column.to_pylist() for column in batch.columns]
+            yield names, list(zip(*columns))
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        names, rows = None, []
+        for line in f:
+            record = json.loads(line)
+            if names is None:
+                names = list(record)
+            rows.append(tuple(record.get(name) for name in names))
+            if len(rows) >= chunk_rows:
+                yield names, rows
+                rows = []
+        if rows:
+            yield names, rows
+
+def delete_logs(cursor, log_ids: list):
+    """
+    Removes logs and everything stored for them, before their new rows load.
+    """
+    for start in range(0, len(log_ids), 500):
+        chunk = log_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f'''
+            DELETE FROM exercise_sets WHERE exercise_data_id IN (
+                SELECT id FROM exercise_data WHERE workout_log_id IN ({placeholders})
+            )
+        ''', chunk)
+        for table in ("exercise_data", "notes", "daily_metrics", "parse_jobs", "import_progress"):
+            cursor.execute(f"DELETE FROM {table} WHERE workout_log_id IN ({placeholders})", chunk)
+        cursor.execute(f"DELETE FROM workout_logs WHERE id IN ({placeholders})", chunk)
+
+def stats_ids(cursor, log_ids: list) -> tuple:
+    """
+    (exercise ids, metric ids) with rows in the given logs.
+    """
+    exercise_ids, metric_ids = set(), set()
+    for start in range(0, len(log_ids), 500):
+        chunk = log_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"SELECT DISTINCT exercise_id FROM exercise_data WHERE workout_log_id IN ({placeholders})", chunk)
+        exercise_ids.update(row[0] for row in cursor.fetchall())
+        cursor.execute(f'''
+            SELECT DISTINCT metric_id FROM daily_metrics
+            WHERE workout_log_id IN ({placeholders}) AND metric_id IS NOT NULL
+        ''', chunk)
+        metric_ids.update(row[0] for row in cursor.fetchall())
+    return exercise_ids, metric_ids
+
+def refresh_stats(cursor, exercise_ids: set, metric_ids: set, chunk_ids: int = STATS_CHUNK_IDS):
+    """
+    Recomputes every day of the exercise_daily_stats and metric_series rows
+    of the given exercises and metrics, chunk_ids of them at a time. Rows of
+    exercises and metrics no longer in the catalogs are dropped.
+    """
+    cursor.execute("SELECT DISTINCT exercise_id FROM exercise_daily_stats WHERE exercise_id NOT IN (SELECT id FROM exercises)")
+    exercise_ids = sorted(set(exercise_ids) | {row[0] for row in cursor.fetchall()})
+    for start in range(0, len(exercise_ids), chunk_ids):
+        chunk = exercise_ids[start:start + chunk_ids]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f'''
+            SELECT exercise_id, date_num FROM exercise_daily_stats WHERE exercise_id IN ({placeholders})
+            UNION
+            SELECT ed.exercise_id, w.date_num FROM exercise_data ed JOIN workout_logs w ON ed.workout_log_id = w.id
+            WHERE ed.exercise_id IN ({placeholders})
+        ''', chunk + chunk)
+        app.refresh_exercise_stats(cursor, set(cursor.fetchall()))
+
+    cursor.execute("SELECT DISTINCT metric_id FROM metric_series WHERE metric_id NOT IN (SELECT id FROM metrics)")
+    metric_ids = sorted(set(metric_ids) | {row[0] for row in cursor.fetchall()})
+    for start in range(0, len(metric_ids), chunk_ids):
+        chunk = metric_ids[start:start + chunk_ids]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f'''
+            SELECT metric_id, date_num FROM metric_series WHERE metric_id IN ({placeholders})
+            UNION
+            SELECT d.metric_id, w.date_num FROM daily_metrics d JOIN workout_logs w ON d.workout_log_id = w.id
+            WHERE d.metric_id IN ({placeholders})
+        ''', chunk + chunk)
+        app.refresh_metric_series(cursor, set(cursor.fetchall()))
+
+def enqueue_unparsed_logs(cursor, log_ids: list):
+    """
+    Queues the logs without any parsed rows or parse job, for snapshots taken
+    before the parse queue was exported.
+    """
+    now = time.time()
+    for start in range(0, len(log_ids), 500):
+        chunk = log_ids[start:start + 500]
+        cursor.execute(f'''
+            INSERT INTO parse_jobs (workout_log_id, status, updated_at)
+            SELECT w.id, 'pending', ? FROM workout_logs w
+            WHERE w.id IN ({",".join("?" * len(chunk))})
+              AND NOT EXISTS (SELECT 1 FROM parse_jobs j WHERE j.workout_log_id = w.id)
+              AND NOT EXISTS (SELECT 1 FROM exercise_data ed WHERE ed.workout_log_id = w.id)
+              AND NOT EXISTS (SELECT 1 FROM notes n WHERE n.workout_log_id = w.id)
+              AND NOT EXISTS (SELECT 1 FROM daily_metrics d WHERE d.workout_log_id = w.id)
+        ''', [now] + chunk)
+
+def changed_log_ids(snapshot_dir: str, manifest: dict, chunk_rows: int) -> list:
+    log_ids = []
+    for table, id_column in (("workout_logs", "id"), ("deleted_logs", "workout_log_id")):
+        path = os.path.join(snapshot_dir, manifest["tables"][table]["file"])
+        for names, rows in read_chunks(path, manifest["format"], chunk_rows):
+            index = names.index(id_column)
+            log_ids.extend(row[index] for row in rows)
+    return log_ids
+
+def import_snapshot(db_path: str, snapshot_dir: str, replace: bool = False,
+                    chunk_rows: int = SNAPSHOT_CHUNK_ROWS) -> dict:
+    """
+    Loads a snapshot in one transaction and refreshes the derived tables.
+    Returns the number of rows loaded per table.
+    """
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    incremental = manifest["since"] > 0
+    conn = app.open_connection(db_path)
+    repository = app.WorkoutRepository(conn)
+    loaded = {}
+    try:
+        with repository.unit_of_work("snapshot_import") as cursor:
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+            if version == 0 and not incremental:
+                # New database: load at the snapshot's version, migrate afterwards
+                app.apply_migrations(cursor, target_version=manifest["schema_version"])
+            elif version != manifest["schema_version"]:
+                raise SystemExit(
+                    f"The snapshot is at schema version {manifest['schema_version']} and {db_path} at {version}; "
+                    "restore it into a new database file instead."
+                )
+            cursor.execute("SELECT COUNT(*) FROM workout_logs")
+            has_logs = cursor.fetchone()[0] > 0
+            snapshot_log_ids = changed_log_ids(snapshot_dir, manifest, chunk_rows)
+            exercise_ids, metric_ids = set(), set()
+            if incremental:
+                if not has_logs:
+                    raise SystemExit("Incremental snapshots apply on top of a restored full snapshot.")
+                exercise_ids, metric_ids = stats_ids(cursor, snapshot_log_ids)
+                delete_logs(cursor, snapshot_log_ids)
+            elif has_logs and not replace:
+                raise SystemExit(f"{db_path} already has logs; use --replace to overwrite them.")
+            elif has_logs:
+                cursor.execute("SELECT id FROM workout_logs")
+                log_ids = [row[0] for row in cursor.fetchall()]
+                exercise_ids, metric_ids = stats_ids(cursor, log_ids)
+                delete_logs(cursor, log_ids)
+                cursor.execute("DELETE FROM deleted_logs")
+            # Snapshots of older schema versions lack the tables added since
+            tables = [table for table in LOAD_ORDER if table in manifest["tables"]]
+            # Catalogs are exported whole; this also drops exercises merged away since
+            for table in CATALOG_TABLES:
+                if table in tables:
+                    cursor.execute(f"DELETE FROM {table}")
+
+            for table in tables:
+                path = os.path.join(snapshot_dir, manifest["tables"][table]["file"])
+                verb = "INSERT OR REPLACE" if table == "deleted_logs" else "INSERT"
+                loaded[table] = 0
+                for names, rows in read_chunks(path, manifest["format"], chunk_rows):
+                    cursor.executemany(
+                        f"{verb} INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", rows
+                    )
+                    loaded[table] += len(rows)
+            if incremental:
+                cursor.execute("DELETE FROM deleted_logs WHERE workout_log_id IN (SELECT id FROM workout_logs)")
+            if "parse_jobs" in tables:
+                # Nothing is parsing them in this database
+                cursor.execute(
+                    "UPDATE parse_jobs SET status = 'pending', updated_at = ? WHERE status = 'running'", (time.time(),)
+                )
+
+            app.apply_migrations(cursor)
+            if "parse_jobs" not in tables:
+                enqueue_unparsed_logs(cursor, snapshot_log_ids)
+            loaded_exercise_ids, loaded_metric_ids = stats_ids(cursor, snapshot_log_ids)
+            refresh_stats(cursor, exercise_ids | loaded_exercise_ids, metric_ids | loaded_metric_ids)
+    finally:
+        conn.close()
+    return loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a GainsGPT database snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a snapshot directory")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--format", choices=sorted(FILE_EXTENSIONS), default="parquet")
+    export_parser.add_argument("--since", type=int, default=0,
+                               help="Only logs changed after this watermark (default: everything)")
+    export_parser.add_argument("--since-manifest", help="Take --since from a previous snapshot's manifest.json")
+    import_parser = commands.add_parser("import", help="Load a snapshot directory")
+    import_parser.add_argument("snapshot_dir")
+    import_parser.add_argument("--replace", action="store_true", help="Replace the logs already in the database")
+    for command_parser in (export_parser, import_parser):
+        command_parser.add_argument("--db", help=f"Database file (default: {app.DB_PATH})")
+        command_parser.add_argument("--user", help="Use this user's database (multi-user mode, see GAINSGPT_SHARD_DIR)")
+        command_parser.add_argument("--chunk-rows", type=int, default=SNAPSHOT_CHUNK_ROWS)
+    args = parser.parse_args()
+    if args.db is None:
+        args.db = app.shard_path(args.user)
+        os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+
+    start = time.perf_counter()
+    if args.command == "export":
+        since = args.since
+        if args.since_manifest:
+            with open(args.since_manifest) as f:
+                since = json.load(f)["watermark"]
+        manifest = export_snapshot(args.db, args.out_dir, args.format, since, args.chunk_rows)
+        counts = {table: info["rows"] for table, info in manifest["tables"].items()}
+        print(f"Exported {counts} to {args.out_dir} (watermark {manifest['watermark']}).")
+    else:
+        counts = import_snapshot(args.db, args.snapshot_dir, args.replace, args.chunk_rows)
+        print(f"Imported {counts} into {args.db}.")
+    print(f"Done in {time.perf_counter() - start:.1f} s.")
+
+if __name__ == "__main__":
+    main()
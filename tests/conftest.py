@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+@pytest.fixture
+def repository(tmp_path):
+    """
+    A repository on a fresh, fully migrated database.
+    """
+    repository = app.WorkoutRepository(app.open_connection(str(tmp_path / "workout.db")))
+    with repository.unit_of_work("migrations") as cursor:
+        app.apply_migrations(cursor)
+    yield repository
+    repository.conn.close()
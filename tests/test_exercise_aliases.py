@@ -0,0 +1,102 @@
+import pytest
+
+import app
+
+KNOWN_NAMES = ["Back squat", "Push press", "Lat pulldown", "Military press"]
+
+def resolve(repository, names):
+    with repository.unit_of_work("resolve") as cursor:
+        return repository.resolve_exercise_ids(cursor, names)
+
+def suggestions(repository):
+    return repository.query('''
+        SELECT a.alias_name, e.exercise_name
+        FROM exercise_alias_suggestions s
+        JOIN exercise_aliases a ON a.alias_key = s.alias_key
+        JOIN exercises e ON s.exercise_id = e.id
+        ORDER BY a.alias_name
+    ''')
+
+@pytest.fixture
+def index():
+    index = app.ExerciseAliasIndex()
+    for exercise_id, name in enumerate(KNOWN_NAMES, start=1):
+        index.add(app.exercise_alias_key(name), exercise_id, name)
+    return index
+
+def test_alias_key_spellings():
+    assert {app.exercise_alias_key(name) for name in ("Pull-ups", "Pull ups", "pullups", "PULL UPS")} == {"pullups"}
+    assert app.exercise_alias_key("Pull ups", singular=True) == "pullup"
+    assert app.exercise_alias_key("RDL") == "romaniandeadlift"
+    assert app.exercise_alias_key("Military pres") == "militarypres"
+
+@pytest.mark.parametrize("name", ["Hack squat", "Bush press"])
+def test_first_letter_of_a_word_is_never_a_typo(index, name):
+    assert index.fuzzy_match(app.exercise_alias_key(name), app.alias_word_starts(name)) is None
+
+@pytest.mark.parametrize("name, exercise_id", [("Lap pulldown", 3), ("Military pres", 4)])
+def test_one_typo_inside_a_word_is_a_candidate(index, name, exercise_id):
+    assert index.fuzzy_match(app.exercise_alias_key(name), app.alias_word_starts(name)) == exercise_id
+
+def test_fuzzy_match_keeps_digits_apart(index):
+    index.add("squatv1", 9, "Squat v1")
+    assert index.fuzzy_match("squatv10", {0}) is None
+
+def test_one_typo_names_are_suggested_not_merged(repository):
+    known_ids = resolve(repository, KNOWN_NAMES)
+    new_ids = resolve(repository, ["Hack squat", "Bush press", "Lap pulldown", "Military pres"])
+    assert len(set(new_ids.values()) | set(known_ids.values())) == 8
+    assert suggestions(repository) == [("Lap pulldown", "Lat pulldown"), ("Military pres", "Military press")]
+
+def test_plural_only_matches_a_known_alias(repository):
+    ids = resolve(repository, ["Pull ups", "Military press"])
+    assert resolve(repository, ["Pull up"])["Pull up"] == ids["Pull ups"]
+    assert resolve(repository, ["pullups", "Pull-up"]) == {"pullups": ids["Pull ups"], "Pull-up": ids["Pull ups"]}
+    # Both numbers in one batch still share an exercise
+    batch = resolve(repository, ["Dips", "Dip"])
+    assert batch["Dips"] == batch["Dip"]
+
+def test_aliases_stored_under_a_singular_key_still_match(repository):
+    with repository.unit_of_work("legacy") as cursor:
+        cursor.execute("INSERT INTO exercises (id, exercise_name) VALUES (7, 'Pull ups')")
+        cursor.execute("INSERT INTO exercise_aliases (alias_key, exercise_id, alias_name) VALUES ('pullup', 7, 'Pull ups')")
+    assert resolve(repository, ["Pull ups", "Pull-up"]) == {"Pull ups": 7, "Pull-up": 7}
+
+def test_accepting_a_suggestion_merges_the_exercises(repository):
+    ids = resolve(repository, ["Military press"])
+    resolve(repository, ["Military pres"])
+    repository.accept_alias_suggestion("militarypres")
+    assert resolve(repository, ["Military pres"]) == {"Military pres": ids["Military press"]}
+    assert suggestions(repository) == []
+    assert repository.query("SELECT exercise_name FROM exercises") == [("Military press",)]
+
+def test_dismissing_a_suggestion_keeps_both_exercises(repository):
+    resolve(repository, ["Lat pulldown"])
+    resolve(repository, ["Lap pulldown"])
+    repository.dismiss_alias_suggestion("lappulldown")
+    assert suggestions(repository) == []
+    assert len(repository.query("SELECT id FROM exercises")) == 2
+    with pytest.raises(ValueError):
+        repository.accept_alias_suggestion("lappulldown")
+
+def test_catalog_spells_names_by_exact_key_and_never_learns_them(tmp_path):
+    catalog = app.ExerciseCatalog(app.open_connection(str(tmp_path / "catalog.db")))
+    repositories = []
+    for user in ("a", "b"):
+        repository = app.WorkoutRepository(app.open_connection(str(tmp_path / f"{user}.db")), catalog=catalog)
+        with repository.unit_of_work("migrations") as cursor:
+            app.apply_migrations(cursor)
+        repositories.append(repository)
+    first, second = repositories
+    resolve(first, ["Militray press", "squats", "Zercher carry"])
+    resolve(second, ["Military press", "Zercher carries"])
+    assert first.query("SELECT exercise_name FROM exercises ORDER BY id") == [
+        ("Militray press",), ("Squat",), ("Zercher carry",),
+    ]
+    assert second.query("SELECT exercise_name FROM exercises ORDER BY id") == [("Military press",), ("Zercher carries",)]
+    assert catalog.conn.execute(
+        "SELECT COUNT(*) FROM curated_exercises WHERE exercise_name LIKE 'Zercher%' OR exercise_name = 'Militray press'"
+    ).fetchone()[0] == 0
+    for repository in repositories:
+        repository.conn.close()
+    catalog.conn.close()
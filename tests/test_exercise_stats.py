@@ -0,0 +1,70 @@
+import pytest
+
+import app
+
+STATS_SQL = "SELECT * FROM exercise_daily_stats ORDER BY exercise_id, date_num"
+SERIES_SQL = "SELECT * FROM metric_series ORDER BY metric_id, date_num"
+
+def log_data(raw_text, **metrics):
+    data = app.categorize_and_extract_features(raw_text)
+    data["metrics"] = [{"metric_name": name, "metric_value": value} for name, value in metrics.items()]
+    return data
+
+def save(repository, date_str, raw_text, **metrics):
+    return repository.save_new_log("Session", date_str, raw_text, log_data(raw_text, **metrics))
+
+def current(repository):
+    return repository.query(STATS_SQL), repository.query(SERIES_SQL)
+
+def rebuilt(repository):
+    """
+    exercise_daily_stats and metric_series as a full rebuild computes them,
+    leaving the incrementally maintained tables as they were.
+    """
+    incremental = current(repository)
+    cursor = repository.conn.cursor()
+    cursor.execute("SAVEPOINT rebuild")
+    app.rebuild_exercise_stats(cursor)
+    app.rebuild_metric_series(cursor)
+    cursor.execute(STATS_SQL)
+    stats = cursor.fetchall()
+    cursor.execute(SERIES_SQL)
+    series = cursor.fetchall()
+    cursor.execute("ROLLBACK TO rebuild")
+    cursor.execute("RELEASE rebuild")
+    assert current(repository) == incremental
+    return stats, series
+
+@pytest.fixture
+def history(repository, monkeypatch):
+    """
+    Four sessions whose squat and bench PRs depend on each other, plus daily metrics.
+    """
+    monkeypatch.setattr(app, "current_repository", lambda: repository)
+    monkeypatch.setattr(app, "OFFLINE_MODE", True)
+    return [
+        save(repository, "2024-05-01", "Squat\n- 3x5 100kg\nBench press\n- 3x5 60kg", Energy="good", Sleep="7h"),
+        save(repository, "2024-05-03", "Squat\n- 3x5 105kg", Energy="3", TrapPain="mild"),
+        save(repository, "2024-05-03", "Bench press\n- 3x5 62.5kg", Energy="poor"),
+        save(repository, "2024-05-06", "Squat\n- 3x3 110kg\nBench press\n- 3x5 65kg", Sleep="8h"),
+    ]
+
+def test_history_is_already_consistent(repository, history):
+    stats, series = current(repository)
+    assert stats and series
+    assert (stats, series) == rebuilt(repository)
+
+def test_block_edit_matches_a_full_rebuild(repository, history):
+    assert repository.get_stored_block_keys(history[1]) != {app.WHOLE_LOG_BLOCK_KEY}
+    app.edit_workout_log(history[1], "Session", "2024-05-03", "Squat\n- 3x5 115kg\nDeadlift\n- 1x5 140kg")
+    assert current(repository) == rebuilt(repository)
+
+def test_replace_with_a_new_date_matches_a_full_rebuild(repository, history):
+    raw_text = "Squat\n- 5x5 90kg"
+    repository.replace_log(history[0], "Session", "2024-05-08", raw_text, log_data(raw_text, Energy="great"))
+    assert current(repository) == rebuilt(repository)
+
+def test_delete_matches_a_full_rebuild(repository, history):
+    repository.delete_log(history[0])
+    repository.delete_log(history[2])
+    assert current(repository) == rebuilt(repository)
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+import app
+from mock_hf_server import MockInferenceServer
+
+PROMPT = 'NEW INPUT:\n"""Squat\n- 3x5 100kg"""\nOutput:\n'
+
+@pytest.fixture
+def server():
+    server = MockInferenceServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def delays(monkeypatch):
+    """
+    Backoff delays the client waited, without waiting for them.
+    """
+    delays = []
+    real_sleep = app.time.sleep
+
+    def sleep(seconds):
+        if threading.current_thread() is threading.main_thread():
+            delays.append(seconds)
+        else:
+            real_sleep(seconds)
+
+    monkeypatch.setattr(app.time, "sleep", sleep)
+    return delays
+
+def client(server):
+    return app.HFInferenceClient(f"http://127.0.0.1:{server.server_address[1]}",
+                                 max_retries=3, backoff_base=0.5, backoff_max=3.0)
+
+def test_model_loading_is_retried_then_raised(server, delays):
+    server.error_rate = 1.0
+    with pytest.raises(app.ModelLoadingError):
+        client(server).generate(PROMPT)
+    assert server.stats["errors_503"] == 4
+    # Exponential backoff, but never shorter than the server's estimated_time (1 s)
+    assert delays == [1.0, 1.0, 2.0]
+
+def test_rate_limits_honour_retry_after(server, delays):
+    server.rate_limit_rate = 1.0
+    with pytest.raises(app.RateLimitError):
+        client(server).generate(PROMPT)
+    assert server.stats["errors_429"] == 4
+    assert delays == [1.0, 1.0, 1.0]
+
+def test_request_succeeds_once_the_model_has_loaded(server, monkeypatch):
+    server.loading_until = app.time.monotonic() + 600
+    delays = []
+    real_sleep = app.time.sleep
+
+    def sleep(seconds):
+        if threading.current_thread() is not threading.main_thread():
+            return real_sleep(seconds)
+        delays.append(seconds)
+        if len(delays) == 2:
+            server.loading_until = 0
+
+    monkeypatch.setattr(app.time, "sleep", sleep)
+    text = client(server).generate(PROMPT)
+    assert app.json.loads(text)["exercises"][0]["exercise_name"] == "Squat"
+    assert server.stats == {"requests": 3, "errors_503": 2, "errors_429": 0}
+    # The server's estimated_time (about 600 s) is capped at backoff_max
+    assert delays == [3.0, 3.0]
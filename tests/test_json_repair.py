@@ -0,0 +1,45 @@
+import pytest
+
+import app
+
+COMPLETE = ('{"metrics": [{"metric_name": "Sleep", "metric_value": "7h"}], "exercises": ['
+            '{"exercise_name": "Squat", "sets": 3, "notes": []}, '
+            '{"exercise_name": "Bench press", "sets": 3, "notes": [{"note_text": "easy", "sentiment": "positive"}, '
+            '{"note_text": "left shoulder fine", "sentiment": "positive"}], "weight": 60}], '
+            '"general_notes": [{"note_text": "short session"}]}')
+
+def truncated_after(marker):
+    return COMPLETE[:COMPLETE.index(marker) + len(marker)]
+
+def exercise_names(data):
+    return [exercise["exercise_name"] for exercise in data["exercises"]]
+
+def test_complete_output_with_python_literals_and_trailing_commas():
+    text = 'Sure! {"metrics": [], "exercises": [{"exercise_name": "Squat", "reps": None, "amrap": True,},], } Done.'
+    assert app.parse_json_lenient(text) == {
+        "metrics": [], "exercises": [{"exercise_name": "Squat", "reps": None, "amrap": True}],
+    }
+
+@pytest.mark.parametrize("marker, depth", [
+    ('"weight": 6', "exercise field"),
+    ('{"note_text": "left sh', "string in a note"),
+    ('"sentiment": "positive"}, ', "between notes"),
+    ('"sets": 3, "notes": [{', "start of the notes"),
+])
+def test_an_exercise_cut_off_inside_is_dropped_whole(marker, depth):
+    data = app.parse_json_lenient(truncated_after(marker))
+    assert exercise_names(data) == ["Squat"], depth
+    assert data["metrics"] == [{"metric_name": "Sleep", "metric_value": "7h"}]
+
+def test_a_metric_cut_off_inside_is_dropped():
+    assert app.parse_json_lenient(truncated_after('{"metric_name": "Sl')) == {"metrics": []}
+
+def test_a_cut_between_top_level_keys_keeps_every_complete_item():
+    data = app.parse_json_lenient(truncated_after('"general_notes": [{"note_text": "sho'))
+    assert exercise_names(data) == ["Squat", "Bench press"]
+    assert data["exercises"][1]["weight"] == 60
+    assert data["general_notes"] == []
+
+def test_nothing_to_recover():
+    assert app.parse_json_lenient("no JSON here") is None
+    assert app.parse_json_lenient('{"metri') == {}
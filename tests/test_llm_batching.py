@@ -0,0 +1,90 @@
+import pytest
+
+import app
+from mock_hf_server import fake_completion
+
+LOG = """Squat
+- 3x5 100kg
+Bench press
+- 3x8 60kg
+Deadlift
+- 1x5 140kg
+Pull ups
+- 6x4 15kg
+- did them slowly, with a pause
+Face pulls
+- some sets, light band
+Overhead press
+- 5x5 40kg"""
+
+@pytest.fixture
+def prompts(tmp_path, monkeypatch):
+    """
+    Prompts sent to the (mock) model, with a fresh parse cache.
+    """
+    prompts = []
+
+    def complete(prompt):
+        prompts.append(prompt)
+        return fake_completion(prompt)
+
+    parse_cache = app.ParseCache(str(tmp_path / "parse_cache.db"))
+    monkeypatch.setattr(app, "get_parse_cache", lambda: parse_cache)
+    monkeypatch.setattr(app, "call_inference_api", complete)
+    monkeypatch.setattr(app, "STREAMING_MODE", False)
+    monkeypatch.setattr(app, "OFFLINE_MODE", False)
+    return prompts
+
+def block_keys(structured_data):
+    return {item["block_key"] for items in structured_data.values() for item in items}
+
+def test_leftover_blocks_share_one_llm_call(prompts):
+    blocks = app.parse_workout_locally(LOG).blocks
+    reported = []
+    structured_data = app.categorize_and_extract_features(LOG, on_exercise=reported.append)
+    assert len(prompts) == 1
+    assert block_keys(structured_data) == {block["key"] for block in blocks}
+    notes = [note["note_text"].split("\n")[0] for note in structured_data["general_notes"]]
+    assert notes == ["Pull ups", "Face pulls"]
+    assert [exercise["exercise_name"] for exercise in reported] == ["Squat", "Bench press", "Deadlift", "Overhead press"]
+    assert not any("block" in item for items in structured_data.values() for item in items)
+
+    # Each block was cached on its own
+    assert app.categorize_and_extract_features(LOG) == structured_data
+    assert len(prompts) == 1
+
+def test_blocks_missing_from_the_answer_are_parsed_alone(prompts, monkeypatch):
+    def first_block_only(prompt):
+        prompts.append(prompt)
+        answer = app.json.loads(fake_completion(prompt))
+        if "### BLOCK 2" in prompt:
+            answer = {key: [item for item in items if item["block"] == 1] for key, items in answer.items()}
+        return app.json.dumps(answer)
+
+    monkeypatch.setattr(app, "call_inference_api", first_block_only)
+    blocks = app.parse_workout_locally(LOG).blocks
+    structured_data = app.categorize_and_extract_features(LOG)
+    assert len(prompts) == 2 and "### BLOCK" not in prompts[1].split("NEW INPUT")[1]
+    assert block_keys(structured_data) == {block["key"] for block in blocks}
+
+def test_batch_prompt_round_trip():
+    assert app.split_prompt_batch(app.render_prompt_batch(["a", "b\nc"])) == {1: "a", 2: "b\nc"}
+    assert app.split_prompt_batch("Squat\n- 3x5") == {}
+
+def test_split_batch_data_drops_items_without_a_block():
+    answer = {"metrics": [{"metric_name": "Sleep", "block": 2}], "exercises": [
+        {"exercise_name": "Squat", "block": 1}, {"exercise_name": "Lunge"}, {"exercise_name": "Row", "block": 5},
+    ]}
+    first, second, third = app.split_batch_data(answer, 3)
+    assert first == {"metrics": [], "exercises": [{"exercise_name": "Squat"}], "general_notes": []}
+    assert second["metrics"] == [{"metric_name": "Sleep"}]
+    assert third is None
+
+def test_prompt_size_goes_to_metrics_not_stdout(prompts, monkeypatch, capsys):
+    metrics = app.MetricsRegistry()
+    monkeypatch.setattr(app, "get_metrics", lambda: metrics)
+    app.categorize_and_extract_features(LOG)
+    assert capsys.readouterr().out == ""
+    rendered = metrics.render_prometheus()
+    assert "gainsgpt_prompts_total 1" in rendered
+    assert app.re.search(r"gainsgpt_prompt_tokens_total [1-9]", rendered)
@@ -0,0 +1,86 @@
+import pytest
+
+import app
+
+def parse_exercise(raw_text):
+    result = app.parse_workout_locally(raw_text)
+    assert result.confidence == 1.0
+    (exercise,) = result.structured_data["exercises"]
+    return exercise
+
+def set_tuples(exercise):
+    return [(d["reps"], d["load"], d["amrap"]) for d in exercise["set_details"]]
+
+def test_every_set_line_becomes_sets():
+    exercise = parse_exercise("Squat\n- 2x5 60kg\n- 3x5 100kg\n- 1x3 110kg")
+    assert exercise["sets"] == 6
+    assert exercise["reps"] is None
+    assert exercise["weight"] == 110.0
+    assert set_tuples(exercise) == [(5, 60.0, False)] * 2 + [(5, 100.0, False)] * 3 + [(3, 110.0, False)]
+    assert exercise["notes"] == []
+
+def test_same_reps_on_every_line_are_the_summary_reps():
+    exercise = parse_exercise("Bench press\n- 3x8 50kg\n- 2x8 55kg")
+    assert (exercise["sets"], exercise["reps"], exercise["weight"]) == (5, 8, 55.0)
+
+def test_amrap_line_is_a_flagged_set():
+    exercise = parse_exercise("Bench press\n- 3x8 50kg\n- AMRAP 40kg 7reps\n- Notes: felt good")
+    assert set_tuples(exercise)[-1] == (7, 40.0, True)
+    assert exercise["sets"] == 4
+    assert [note["note_text"] for note in exercise["notes"]] == ["felt good"]
+
+def test_amrap_line_alone_and_reversed_order():
+    exercise = parse_exercise("Dips\n- AMRAP 12 reps @ +10kg")
+    assert exercise["set_details"] == [
+        {"reps": 12, "load": 10.0, "rpe": None, "amrap": True, "bodyweight_plus": True}
+    ]
+
+def test_amrap_free_text_stays_a_note():
+    exercise = parse_exercise("Bench press\n- 3x5 50kg\n- AMRAP felt hard")
+    assert exercise["sets"] == 3
+    assert [note["note_text"] for note in exercise["notes"]] == ["AMRAP felt hard"]
+
+def test_multi_line_block_is_stored_set_by_set(repository):
+    data = app.parse_workout_locally("Squat\n- 2x5 60kg\n- 3x5 100kg\n- 1x3 110kg").structured_data
+    log_id = repository.save_new_log("Legs", "2024-03-01", "x", data)
+    rows = repository.query('''
+        SELECT s.set_index, s.reps, s.load FROM exercise_sets s
+        JOIN exercise_data ed ON ed.id = s.exercise_data_id
+        WHERE ed.workout_log_id = ? ORDER BY s.set_index
+    ''', (log_id,))
+    assert [(reps, load) for _, reps, load in rows] == [(5, 60.0)] * 2 + [(5, 100.0)] * 3 + [(3, 110.0)]
+    (best_weight,) = repository.query("SELECT best_weight FROM exercise_daily_stats")[0]
+    assert best_weight == 110.0
+
+@pytest.mark.parametrize("text, summary, reps, load, rpe, amrap, plus", [
+    ("6x6 50kg", (6, 6, 50.0), [6] * 6, 50.0, None, False, False),
+    ("6 x 6 50", (6, 6, 50.0), [6] * 6, 50.0, None, False, False),
+    ("6x4 +12.5kg", (6, 4, 12.5), [4] * 6, 12.5, None, False, True),
+    ("3x12-10-9 9kg", (3, None, 9.0), [12, 10, 9], 9.0, None, False, False),
+    ("4x10-8 20kg", (4, None, 20.0), [10, 8, 8, 8], 20.0, None, False, False),
+    ("3xRPE 10 50kg 9-7-6", (3, None, 50.0), [9, 7, 6], 50.0, 10.0, False, False),
+    ("5x5 @ 225lbs", (5, 5, 102.06), [5] * 5, 102.06, None, False, False),
+    ("3 x max", (3, None, None), [None] * 3, None, None, True, False),
+    ("4x8", (4, 8, None), [8] * 4, None, None, False, False),
+])
+def test_set_notation(text, summary, reps, load, rpe, amrap, plus):
+    parsed = app.parse_set_notation(text)
+    assert (parsed["sets"], parsed["reps"], parsed["weight"]) == summary
+    assert [d["reps"] for d in parsed["set_details"]] == reps
+    assert {(d["load"], d["rpe"], d["amrap"], d["bodyweight_plus"]) for d in parsed["set_details"]} == {(load, rpe, amrap, plus)}
+
+@pytest.mark.parametrize("text", ["felt heavy", "x5 60kg", "3 sets of 5", "3x5 60kg 70kg"])
+def test_not_set_notation(text):
+    assert app.parse_set_notation(text) is None
+
+def test_log_with_several_exercise_blocks():
+    result = app.parse_workout_locally(
+        "Prior notes:\n- slept badly\nSquat\n- 3x5 100kg\nBench press\n- 3x8 60kg\n- 1x5 70kg\n- Notes: easy\nPull ups\n- 6x4 +15kg"
+    )
+    assert [block["structured_data"] is None for block in result.blocks] == [True, False, False, False]
+    assert len({block["key"] for block in result.blocks}) == 4
+    assert [
+        (e["exercise_name"], e["sets"], e["reps"], e["weight"], [n["note_text"] for n in e["notes"]])
+        for e in result.structured_data["exercises"]
+    ] == [("Squat", 3, 5, 100.0, []), ("Bench press", 4, None, 70.0, ["easy"]), ("Pull ups", 6, 4, 15.0, [])]
+    assert result.confidence >= app.FAST_PARSE_MIN_CONFIDENCE
@@ -0,0 +1,54 @@
+import pytest
+
+import app
+
+@pytest.mark.parametrize("raw_name, raw_value, name, unit", [
+    ("Sleep", "7.5 hours", "sleep_hours", "h"),
+    ("Sleep", "poor (3 nights bad sleep)", "sleep_quality", "1-5"),
+    ("Sleep Quality", "7/10", "sleep_quality", "1-5"),
+    ("EnergyLevel", "good", "energy", "1-5"),
+    ("BW", "82kg", "bodyweight", "kg"),
+    ("TrapPain", "mild", "trap_pain", "0-10"),
+    ("ShoulderInflammation", "pain-free", "shoulder_pain", "0-10"),
+    ("Pain", "severe", "general_pain", "0-10"),
+    ("RestingHeartRate", "52", "resting_heart_rate", ""),
+    ("", "3", "unnamed", ""),
+])
+def test_metric_names_resolve(raw_name, raw_value, name, unit):
+    definition = app.resolve_metric(raw_name, raw_value)
+    assert (definition.name, definition.unit) == (name, unit)
+
+def test_unknown_metric_is_unscaled():
+    definition = app.resolve_metric("HRV", "65 ms")
+    assert definition == app.MetricDefinition("hrv", "HRV")
+    assert app.parse_metric_value(definition, "65 ms") == 65.0
+    assert app.parse_metric_value(definition, "n/a") is None
+
+@pytest.mark.parametrize("raw_name, raw_value, expected", [
+    # Ratings: phrases, bare numbers and ratios on the 1-5 scale
+    ("Energy", "good", 4.0),
+    ("Energy", "very good", 5.0),
+    ("Mood", "feeling ok", 3.0),
+    ("Mood", "3 but tired", 2.0),
+    ("Energy", "4", 4.0),
+    ("SleepQuality", "7/10", 3.5),
+    ("Stress", "n/a", None),
+    ("Energy", "", None),
+    # Pain: 0-10 scale
+    ("TrapPain", "mild", 3.0),
+    ("ShoulderInflammation", "pain-free", 0.0),
+    ("Pain", "severe", 8.0),
+    ("KneePain", "4/10", 4.0),
+    # Out of range: above the scale reads as out of 10, above 10 is rejected
+    ("Energy", "7", 3.5),
+    ("Energy", "12", None),
+    ("KneePain", "12", None),
+    # Units
+    ("Sleep", "7.5 hours", 7.5),
+    ("Bodyweight", "180 lbs", 81.65),
+    ("BW", "82,5kg", 82.5),
+    ("Weight", "heavy", None),
+])
+def test_metric_values_parse(raw_name, raw_value, expected):
+    definition = app.resolve_metric(raw_name, raw_value)
+    assert app.parse_metric_value(definition, raw_value) == expected
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import app
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.abspath(app.__file__)), "workout_app.db")
+
+def baseline_repository(tmp_path):
+    """
+    A repository on a database with only the original tables, as created
+    before migrations were tracked.
+    """
+    repository = app.WorkoutRepository(app.open_connection(str(tmp_path / "baseline.db")))
+    with repository.unit_of_work("baseline") as cursor:
+        app.migrate_001_base_schema(cursor)
+        cursor.execute("INSERT INTO workout_logs (id, session_name, date, raw_text) VALUES (1, 'Push', '2024-03-01', ?)",
+                       ("Military press\n- 2x5 40kg\n- 1x3 50kg\nPull ups\n- 3x8",))
+        cursor.execute("INSERT INTO workout_logs (id, session_name, date, raw_text) VALUES (2, 'Push', '2024-03-04', ?)",
+                       ("Military pres\n- free text the grammar does not cover",))
+        cursor.executemany("INSERT INTO exercises (id, exercise_name) VALUES (?, ?)",
+                           [(1, "Military press"), (2, "Pull ups"), (3, "Pull-ups")])
+        cursor.executemany(
+            "INSERT INTO exercise_data (workout_log_id, exercise_id, sets, reps, weight) VALUES (?, ?, ?, ?, ?)",
+            [(1, 1, 3, None, 50.0), (1, 2, 3, 8, None), (2, 3, 2, 10, None), (2, 1, 4, 6, 45.0)],
+        )
+        cursor.executemany(
+            "INSERT INTO daily_metrics (workout_log_id, metric_name, metric_value, sentiment) VALUES (?, ?, ?, ?)",
+            [(1, "TrapPain", "mild", "negative"), (2, "Sleep", "7h", "neutral")],
+        )
+    return repository
+
+def test_baseline_schema_migrates_to_latest(tmp_path):
+    repository = baseline_repository(tmp_path)
+    with repository.unit_of_work("migrations") as cursor:
+        assert app.apply_migrations(cursor) == len(app.SCHEMA_MIGRATIONS)
+
+    # "Pull ups" and "Pull-ups" share an alias key and merge into the oldest
+    assert repository.query("SELECT id, exercise_name FROM exercises ORDER BY id") == [
+        (1, "Military press"), (2, "Pull ups"),
+    ]
+    assert repository.query("SELECT alias_key, exercise_id FROM exercise_aliases ORDER BY alias_key") == [
+        ("militarypress", 1), ("pullups", 2),
+    ]
+    assert repository.query("SELECT exercise_id, total_sets, best_weight FROM exercise_daily_stats ORDER BY date_num, exercise_id") == [
+        (1, 3, 50.0), (2, 3, None), (1, 4, 45.0), (2, 2, None),
+    ]
+    assert repository.query("SELECT name, numeric_value FROM daily_metrics d JOIN metrics m ON d.metric_id = m.id ORDER BY d.id") == [
+        ("trap_pain", 3.0), ("sleep_hours", 7.0),
+    ]
+    assert repository.query("SELECT metric_id, date_num, value FROM metric_series ORDER BY date_num")[1][1:] == (20240304, 7.0)
+    repository.conn.close()
+
+def test_exercise_sets_are_recovered_from_raw_text_without_block_keys(tmp_path):
+    repository = baseline_repository(tmp_path)
+    with repository.unit_of_work("migrations") as cursor:
+        app.apply_migrations(cursor)
+    # Rows stored before block tracking expand their summary
+    assert repository.query('''
+        SELECT s.reps, s.load FROM exercise_sets s JOIN exercise_data ed ON s.exercise_data_id = ed.id
+        WHERE ed.workout_log_id = 1 AND ed.exercise_id = 1 ORDER BY s.set_index
+    ''') == [(None, 50.0)] * 3
+    repository.conn.close()
+
+def test_migration_006_recovers_sets_of_stored_blocks(tmp_path):
+    repository = baseline_repository(tmp_path)
+    with repository.unit_of_work("migrations") as cursor:
+        app.apply_migrations(cursor, target_version=5)
+        block_key = app.split_log_blocks("Military press\n- 2x5 40kg\n- 1x3 50kg\nPull ups\n- 3x8")[0]["key"]
+        cursor.execute("UPDATE exercise_data SET block_key = ? WHERE workout_log_id = 1 AND exercise_id = 1", (block_key,))
+        app.apply_migrations(cursor, target_version=6)
+    assert repository.query('''
+        SELECT s.reps, s.load FROM exercise_sets s JOIN exercise_data ed ON s.exercise_data_id = ed.id
+        WHERE ed.workout_log_id = 1 AND ed.exercise_id = 1 ORDER BY s.set_index
+    ''') == [(5, 40.0), (5, 40.0), (3, 50.0)]
+    repository.conn.close()
+
+@pytest.mark.skipif(not os.path.exists(BASELINE_DB), reason="no baseline database")
+def test_bundled_baseline_database_migrates(tmp_path):
+    path = tmp_path / "workout_app.db"
+    shutil.copyfile(BASELINE_DB, path)
+    repository = app.WorkoutRepository(app.open_connection(str(path)))
+    with repository.unit_of_work("migrations") as cursor:
+        assert app.apply_migrations(cursor) == len(app.SCHEMA_MIGRATIONS)
+    assert repository.query("SELECT COUNT(*) FROM exercises WHERE id NOT IN (SELECT exercise_id FROM exercise_aliases)")[0][0] == 0
+    assert repository.query("SELECT COUNT(*) FROM exercise_sets")[0][0] > 0
+    assert repository.query("SELECT COUNT(*) FROM daily_metrics WHERE metric_id IS NULL")[0][0] == 0
+    repository.conn.close()
+    assert sqlite3.connect(str(path)).execute("PRAGMA user_version").fetchone()[0] == len(app.SCHEMA_MIGRATIONS)
@@ -0,0 +1,28 @@
+import app
+
+STRUCTURED = {"metrics": [], "exercises": [{"exercise_name": "Squat", "sets": 3, "reps": 5}], "general_notes": []}
+
+def test_switching_backends_misses_the_cache(tmp_path, monkeypatch):
+    cache = app.ParseCache(str(tmp_path / "parse_cache.db"))
+    monkeypatch.setattr(app, "INFERENCE_BACKEND", "replay")
+    monkeypatch.setattr(app, "INFERENCE_URL", "recorded.jsonl")
+    cache.put(app.ParseCache.make_key("Squat\n- felt heavy"), STRUCTURED)
+    assert cache.get(app.ParseCache.make_key("Squat\n- felt heavy")) == STRUCTURED
+
+    monkeypatch.setattr(app, "INFERENCE_BACKEND", "tgi")
+    monkeypatch.setattr(app, "INFERENCE_URL", "http://127.0.0.1:8080")
+    assert cache.get(app.ParseCache.make_key("Squat\n- felt heavy")) is None
+    cache.put(app.ParseCache.make_key("Squat\n- felt heavy"), STRUCTURED)
+
+    # Same kind of backend on another server
+    monkeypatch.setattr(app, "INFERENCE_URL", "http://10.0.0.5:8080")
+    assert cache.get(app.ParseCache.make_key("Squat\n- felt heavy")) is None
+
+def test_hf_default_url_is_part_of_the_key(monkeypatch):
+    monkeypatch.setattr(app, "INFERENCE_BACKEND", "hf")
+    monkeypatch.setattr(app, "INFERENCE_URL", "")
+    default_key = app.ParseCache.make_key("Squat")
+    monkeypatch.setattr(app, "INFERENCE_URL", app.HF_API_URL)
+    assert app.ParseCache.make_key("Squat") == default_key
+    monkeypatch.setattr(app, "MODEL_ID", "other/model")
+    assert app.ParseCache.make_key("Squat") != default_key
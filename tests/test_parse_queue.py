@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+import app
+
+@pytest.fixture
+def pooled_repository(tmp_path):
+    path = str(tmp_path / "workout.db")
+    repository = app.WorkoutRepository(app.open_connection(path), pool=app.ConnectionPool(path, size=2))
+    with repository.unit_of_work("migrations") as cursor:
+        app.apply_migrations(cursor)
+    yield repository
+    repository.pool.close()
+    repository.conn.close()
+
+def queue_log(repository, raw_text="Squat\n- felt heavy today"):
+    with repository.unit_of_work() as cursor:
+        log_id = repository.insert_log(cursor, "Legs", "2024-05-01", raw_text)
+        cursor.execute(
+            "INSERT INTO parse_jobs (workout_log_id, status, updated_at) VALUES (?, 'pending', ?)",
+            (log_id, time.time()),
+        )
+    return log_id
+
+def test_parse_progress_does_not_invalidate_the_query_cache(pooled_repository, monkeypatch):
+    repository = pooled_repository
+    log_id = queue_log(repository)
+    worker = app.ParseWorker(repository)
+    job = worker.claim_next_job()
+    generation = repository.data_generation()
+    seen = []
+
+    def fake_parse(raw_text, on_exercise=None):
+        for name in ("Squat", "Leg press"):
+            on_exercise({"exercise_name": name, "sets": 3, "reps": 5, "weight": 100})
+            seen.append((repository.data_generation(), [e["exercise_name"] for e in repository.get_parse_progress(log_id)]))
+        return {"metrics": [], "exercises": [{"exercise_name": "Squat", "sets": 3, "reps": 5, "weight": 100}], "general_notes": []}
+
+    monkeypatch.setattr(app, "categorize_and_extract_features", fake_parse)
+    worker.process_job(*job)
+    assert seen == [(generation, ["Squat"]), (generation, ["Squat", "Leg press"])]
+    assert repository.get_parse_progress(log_id) == []
+    assert repository.get_parse_status(log_id) == "parsed"
+
+def test_parse_progress_is_cleared_when_the_parse_fails(pooled_repository, monkeypatch):
+    repository = pooled_repository
+    log_id = queue_log(repository)
+    worker = app.ParseWorker(repository)
+
+    def failing_parse(raw_text, on_exercise=None):
+        on_exercise({"exercise_name": "Squat"})
+        raise app.InferenceError("model unavailable")
+
+    monkeypatch.setattr(app, "categorize_and_extract_features", failing_parse)
+    worker.process_job(*worker.claim_next_job())
+    assert repository.get_parse_progress(log_id) == []
+    assert repository.get_parse_status(log_id) == "pending"
+
+def test_stale_running_jobs_are_claimed_again(pooled_repository):
+    repository = pooled_repository
+    stale_id = queue_log(repository)
+    busy_id = queue_log(repository, "Bench\n- felt strong")
+    with repository.unit_of_work() as cursor:
+        cursor.execute("UPDATE parse_jobs SET status = 'running', updated_at = ? WHERE workout_log_id = ?",
+                       (time.time() - app.PARSE_JOB_STALE_SECONDS - 1, stale_id))
+        cursor.execute("UPDATE parse_jobs SET status = 'running', updated_at = ? WHERE workout_log_id = ?",
+                       (time.time(), busy_id))
+    worker = app.ParseWorker(repository)
+    assert worker.claim_next_job()[0] == stale_id
+    assert worker.claim_next_job() is None
+    assert repository.get_parse_status(stale_id) == "running"
@@ -0,0 +1,55 @@
+import pytest
+
+import app
+
+LOGS_SQL = "SELECT id, session_name FROM workout_logs ORDER BY id"
+
+@pytest.fixture
+def shard_path(tmp_path):
+    path = str(tmp_path / "workout.db")
+    repository = app.WorkoutRepository(app.open_connection(path))
+    with repository.unit_of_work("migrations") as cursor:
+        app.apply_migrations(cursor)
+    repository.save_new_log("Legs", "2024-05-01", "Squat\n- 3x5 100kg", {})
+    repository.close()
+    return path
+
+@pytest.fixture(params=["writer", "pool"])
+def reader(shard_path, request):
+    """
+    The repository whose cache is checked, reading through its writer
+    connection or through a read pool.
+    """
+    pool = app.ConnectionPool(shard_path, size=2) if request.param == "pool" else None
+    repository = app.WorkoutRepository(app.open_connection(shard_path), pool=pool)
+    yield repository
+    repository.close()
+
+@pytest.fixture
+def other(shard_path):
+    """
+    A second repository on the same shard, as another session or process would open it.
+    """
+    repository = app.WorkoutRepository(app.open_connection(shard_path))
+    yield repository
+    repository.close()
+
+def test_repeated_reads_are_served_from_the_cache(reader):
+    rows = reader.cached_query(LOGS_SQL)
+    assert rows == [(1, "Legs")]
+    assert reader.cached_query(LOGS_SQL) is rows
+
+def test_write_through_another_connection_invalidates_the_cache(reader, other):
+    assert reader.cached_query(LOGS_SQL) == [(1, "Legs")]
+    other.save_new_log("Push", "2024-05-02", "Bench press\n- 3x5 60kg", {})
+    assert reader.cached_query(LOGS_SQL) == [(1, "Legs"), (2, "Push")]
+
+    other.delete_log(1)
+    assert reader.cached_query(LOGS_SQL) == [(2, "Push")]
+
+def test_raw_commit_on_the_file_invalidates_the_cache(reader, shard_path):
+    assert reader.cached_query(LOGS_SQL) == [(1, "Legs")]
+    conn = app.open_connection(shard_path)
+    conn.execute("UPDATE workout_logs SET session_name = 'Lower' WHERE id = 1")
+    conn.close()
+    assert reader.cached_query(LOGS_SQL) == [(1, "Lower")]
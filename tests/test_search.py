@@ -0,0 +1,47 @@
+import app
+
+def parsed_data(raw_text):
+    return app.parse_workout_locally(raw_text).structured_data
+
+def save(repository, session_name, date_str, raw_text):
+    return repository.save_new_log(session_name, date_str, raw_text, parsed_data(raw_text))
+
+def test_index_follows_inserts_edits_and_deletes(repository):
+    legs = save(repository, "Legs", "2024-05-01", "Squat\n- 3x5 100kg\n- Notes: knee felt sore")
+    pull = save(repository, "Pull", "2024-05-02", "Deadlift\n- 1x5 140kg\n- Notes: grip slipping")
+    assert [row[0] for row in repository.search_logs("knee")] == [legs]
+    assert [row[0] for row in repository.search_logs("grip")] == [pull]
+
+    new_text = "Squat\n- 3x5 100kg\n- Notes: hip felt fine"
+    repository.replace_log(legs, "Legs", "2024-05-01", new_text, parsed_data(new_text))
+    assert repository.search_logs("knee") == []
+    assert [row[0] for row in repository.search_logs("hip")] == [legs]
+
+    repository.delete_log(pull)
+    assert repository.search_logs("grip") == []
+    assert repository.search_logs("deadlift") == []
+
+def test_best_match_first_with_bold_snippet(repository):
+    once = save(repository, "Legs", "2024-05-01", "Squat\n- 3x5 100kg\n- Notes: knee felt sore")
+    thrice = save(repository, "Legs 2", "2024-05-03",
+                  "Squat\n- 3x5 100kg\nSquat\n- 2x3 110kg\nSquat pause\n- 2x2 90kg")
+    assert repository.search_logs("squat") == [
+        (thrice, "Legs 2", "2024-05-03", "**Squat** - 3x5 100kg **Squat** - 2x3 110kg **Squat** pause - 2x2 90kg"),
+        (once, "Legs", "2024-05-01", "**Squat** - 3x5 100kg - Notes: knee felt sore"),
+    ]
+    assert repository.search_logs("squats", date_from=app.date_to_num("2024-05-02")) == [
+        (thrice, "Legs 2", "2024-05-03", "**Squat** - 3x5 100kg **Squat** - 2x3 110kg **Squat** pause - 2x2 90kg"),
+    ]
+
+def test_quoted_text_is_a_phrase(repository):
+    log_id = save(repository, "Legs", "2024-05-01", "Squat\n- 3x5 100kg\n- Notes: knee felt sore")
+    assert repository.search_logs('"felt sore"') == [
+        (log_id, "Legs", "2024-05-01", "Squat - 3x5 100kg - Notes: knee **felt sore**"),
+    ]
+    assert repository.search_logs('"sore felt"') == []
+    assert repository.search_logs("sore felt")[0][0] == log_id
+
+def test_match_query_quotes_every_term():
+    assert app.fts_match_query('squat "felt sore" OR knee*') == '"squat" "felt sore" "OR" "knee*"'
+    assert app.fts_match_query('say "hi') == '"say" """hi"'
+    assert app.fts_match_query("   ") == ""
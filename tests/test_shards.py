@@ -0,0 +1,74 @@
+import sqlite3
+import time
+
+import pytest
+
+import app
+
+@pytest.fixture
+def shard_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "SHARD_DIR", str(tmp_path))
+    app.get_exercise_catalog.clear()
+    yield tmp_path
+    app.get_exercise_catalog.clear()
+
+def is_closed(repository):
+    try:
+        repository.conn.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+def test_least_recently_used_databases_are_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "SHARD_MIN_IDLE_SECONDS", 0)
+    registry = app.ShardRegistry(max_open=2, idle_seconds=3600)
+    paths = [str(tmp_path / f"{name}.db") for name in "abc"]
+    first, second = registry.get(paths[0]), registry.get(paths[1])
+    registry.get(paths[0])
+    registry.get(paths[2])
+    assert registry.open_paths() == [paths[0], paths[2]]
+    assert is_closed(second) and not is_closed(first)
+    registry.close_all()
+    assert is_closed(first)
+
+def test_idle_databases_are_closed_unless_leased(tmp_path):
+    registry = app.ShardRegistry(max_open=10, idle_seconds=0)
+    paths = [str(tmp_path / f"{name}.db") for name in "abc"]
+    with registry.lease(paths[0]) as leased:
+        idle = registry.get(paths[1])
+        time.sleep(0.01)
+        registry.get(paths[2])
+        assert is_closed(idle) and not is_closed(leased)
+    registry.close_all()
+
+def test_recently_used_databases_outlive_the_bound(tmp_path):
+    registry = app.ShardRegistry(max_open=1, idle_seconds=3600)
+    paths = [str(tmp_path / f"{name}.db") for name in "ab"]
+    first = registry.get(paths[0])
+    registry.get(paths[1])
+    assert not is_closed(first)
+    registry.close_all()
+
+def test_one_worker_drains_every_users_queue(shard_dir, monkeypatch):
+    registry = app.ShardRegistry()
+    users = ["alice@example.com", "bob@example.com"]
+    log_ids = {}
+    for user in users:
+        repository = registry.get(app.shard_path(user), True)
+        with repository.unit_of_work() as cursor:
+            log_ids[user] = repository.insert_log(cursor, "Legs", "2024-05-01", "Squat\n- felt heavy")
+            cursor.execute("INSERT INTO parse_jobs (workout_log_id, status, updated_at) VALUES (?, 'pending', ?)",
+                           (log_ids[user], time.time()))
+    registry.close_all()
+    monkeypatch.setattr(app, "categorize_and_extract_features", lambda raw_text, on_exercise=None: {
+        "metrics": [], "exercises": [{"exercise_name": "Squats", "sets": 3, "reps": 5, "weight": 100}], "general_notes": [],
+    })
+    worker = app.ShardParseWorker(registry)
+    assert worker.process_next_job() and worker.process_next_job()
+    assert not worker.process_next_job()
+    for user in users:
+        repository = registry.get(app.shard_path(user), True)
+        assert repository.get_parse_status(log_ids[user]) == "parsed"
+        assert repository.query("SELECT exercise_name FROM exercises") == [("Squat",)]
+    assert not app.has_due_parse_job(str(shard_dir / "catalog.db"))
+    registry.close_all()
@@ -0,0 +1,132 @@
+import json
+import time
+
+import pytest
+
+import app
+import snapshot
+
+def parsed_data(exercise_name, weight):
+    return {
+        "metrics": [{"metric_name": "Sleep", "metric_value": "7h"}],
+        "exercises": [{"exercise_name": exercise_name, "sets": 3, "reps": 5, "weight": weight, "notes": []}],
+        "general_notes": [],
+    }
+
+@pytest.fixture
+def source(tmp_path):
+    """
+    A database with two parsed logs, one log waiting to be parsed and one
+    being parsed.
+    """
+    path = str(tmp_path / "source.db")
+    repository = app.WorkoutRepository(app.open_connection(path))
+    with repository.unit_of_work("migrations") as cursor:
+        app.apply_migrations(cursor)
+    repository.save_new_log("Legs", "2024-05-01", "Squat\n- 3x5 100kg", parsed_data("Squat", 100))
+    repository.save_new_log("Push", "2024-05-02", "Bench press\n- 3x5 60kg", parsed_data("Bench press", 60))
+    with repository.unit_of_work() as cursor:
+        for status, raw_text in (("pending", "Squat\n- felt heavy"), ("running", "Row\n- felt strong")):
+            log_id = repository.insert_log(cursor, "Pull", "2024-05-03", raw_text)
+            cursor.execute("INSERT INTO parse_jobs (workout_log_id, status, updated_at) VALUES (?, ?, ?)",
+                           (log_id, status, time.time()))
+    yield path, repository
+    repository.conn.close()
+
+def query(path, sql):
+    conn = app.open_connection(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def parse_queue(path):
+    return query(path, '''
+        SELECT w.raw_text, j.status FROM parse_jobs j JOIN workout_logs w ON w.id = j.workout_log_id ORDER BY w.id
+    ''')
+
+QUEUED = [("Squat\n- felt heavy", "pending"), ("Row\n- felt strong", "pending")]
+
+def test_queued_logs_are_parsed_after_a_restore(source, tmp_path):
+    path, _ = source
+    snapshot.export_snapshot(path, str(tmp_path / "full"), "jsonl")
+    restored = str(tmp_path / "restored.db")
+    snapshot.import_snapshot(restored, str(tmp_path / "full"))
+    assert parse_queue(restored) == QUEUED
+
+    # --replace deletes the jobs of the old logs and loads the snapshot's
+    snapshot.import_snapshot(restored, str(tmp_path / "full"), replace=True)
+    assert parse_queue(restored) == QUEUED
+
+def test_snapshots_without_the_parse_queue_queue_unparsed_logs(source, tmp_path):
+    path, _ = source
+    out_dir = tmp_path / "old"
+    snapshot.export_snapshot(path, str(out_dir), "jsonl")
+    manifest = json.loads((out_dir / snapshot.MANIFEST_NAME).read_text())
+    del manifest["tables"]["parse_jobs"]
+    (out_dir / snapshot.MANIFEST_NAME).write_text(json.dumps(manifest))
+    restored = str(tmp_path / "restored.db")
+    snapshot.import_snapshot(restored, str(out_dir))
+    assert parse_queue(restored) == QUEUED
+
+def test_import_refreshes_only_the_touched_exercises(source, tmp_path):
+    path, repository = source
+    snapshot.export_snapshot(path, str(tmp_path / "full"), "jsonl")
+    restored = str(tmp_path / "restored.db")
+    snapshot.import_snapshot(restored, str(tmp_path / "full"))
+    stats_sql = "SELECT exercise_id, date_num, tonnage, is_pr FROM exercise_daily_stats ORDER BY 1, 2"
+    assert query(restored, stats_sql) == query(path, stats_sql)
+
+    # A row no import touches survives it
+    conn = app.open_connection(restored)
+    conn.execute("UPDATE exercise_daily_stats SET tonnage = -1 WHERE exercise_id = (SELECT id FROM exercises WHERE exercise_name = 'Squat')")
+    conn.close()
+    with repository.unit_of_work() as cursor:
+        log_id = repository.insert_log(cursor, "Push", "2024-05-04", "Bench press\n- 3x5 70kg")
+        repository.insert_structured_data(cursor, log_id, parsed_data("Bench press", 70))
+    manifest = json.loads((tmp_path / "full" / snapshot.MANIFEST_NAME).read_text())
+    snapshot.export_snapshot(path, str(tmp_path / "since"), "jsonl", since=manifest["watermark"])
+    snapshot.import_snapshot(restored, str(tmp_path / "since"))
+    tonnage = dict(query(restored, '''
+        SELECT e.exercise_name, SUM(s.tonnage) FROM exercise_daily_stats s JOIN exercises e ON e.id = s.exercise_id
+        GROUP BY e.exercise_name
+    '''))
+    assert tonnage == {"Squat": -1, "Bench press": 3 * 5 * 60 + 3 * 5 * 70}
+
+# parse_jobs is left out: running jobs come back pending
+ROUND_TRIP_TABLES = [
+    "workout_logs", "exercise_data", "exercise_sets", "notes", "daily_metrics", "exercises", "exercise_aliases",
+    "metrics", "exercise_daily_stats", "metric_series", "deleted_logs",
+]
+
+def dump(path):
+    conn = app.open_connection(path)
+    try:
+        tables = {table: sorted(map(repr, conn.execute(f"SELECT * FROM {table}").fetchall())) for table in ROUND_TRIP_TABLES}
+        tables["search"] = conn.execute(
+            "SELECT rowid FROM workout_logs_fts WHERE workout_logs_fts MATCH 'squat' ORDER BY rowid"
+        ).fetchall()
+        return tables
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("file_format", ["parquet", "jsonl"])
+def test_full_and_incremental_round_trip(source, tmp_path, file_format):
+    if file_format == "parquet":
+        pytest.importorskip("pyarrow")
+    path, repository = source
+    full = snapshot.export_snapshot(path, str(tmp_path / "full"), file_format, chunk_rows=2)
+    restored = str(tmp_path / "restored.db")
+    snapshot.import_snapshot(restored, str(tmp_path / "full"), chunk_rows=2)
+    assert dump(restored) == dump(path)
+    assert query(restored, "PRAGMA user_version") == [(len(app.SCHEMA_MIGRATIONS),)]
+
+    # Changes after the full snapshot: a deletion, an edit and a new log
+    first_id, second_id = [row[0] for row in repository.query("SELECT id FROM workout_logs ORDER BY id LIMIT 2")]
+    repository.delete_log(first_id)
+    repository.replace_log(second_id, "Push", "2024-05-02", "Bench press\n- 3x5 65kg", parsed_data("Bench press", 65))
+    repository.save_new_log("Legs", "2024-05-05", "Squat\n- 3x5 105kg", parsed_data("Squats", 105))
+    since = snapshot.export_snapshot(path, str(tmp_path / "since"), file_format, since=full["watermark"])
+    assert since["tables"]["workout_logs"]["rows"] == 2
+    snapshot.import_snapshot(restored, str(tmp_path / "since"))
+    assert dump(restored) == dump(path)